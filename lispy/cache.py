@@ -0,0 +1,239 @@
+import hashlib
+import itertools
+import marshal
+import os
+import struct
+import tempfile
+
+from lispy.expression import ExpressionTree
+from lispy.tokenizer import Token, Tokenizer
+
+
+# magic number, modification time and size of the source, sha256 of the
+# source, number of expressions. it is followed by the marshalled expressions,
+# one after the other. only the parse trees are cached: what the engines
+# compile them to depends on the interpreter and on the definitions made while
+# the code runs, e.g. of macros, and cannot be marshalled
+HEADER = struct.Struct('<8sqQ32sQ')
+MAGIC = b'LISPYC\x00\x03'
+
+# bytes read at a time when hashing the source
+CHUNK_SIZE = 1 << 16
+
+CACHE_DIR = '__lispycache__'
+CACHE_SUFFIX = '.lispyc'
+
+
+def cache_path(path, cache_dir=None):
+    """ where the cache of the given source file is stored: in a __lispycache__
+        directory next to the file, or in cache_dir if given, where the name
+        also contains a hash of the full path to avoid collisions
+    """
+    path = os.path.abspath(path)
+    name = os.path.basename(path)
+    if cache_dir is None:
+        return os.path.join(os.path.dirname(path), CACHE_DIR, name + CACHE_SUFFIX)
+
+    key = hashlib.sha256(path.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+    return os.path.join(cache_dir, '%s-%s%s' % (name, key, CACHE_SUFFIX))
+
+
+def read_expr_cached(path, cache_dir=None):
+    """ yields the top-level expressions of the file at the given path.
+
+        they are loaded from the cache, one at a time, if it is still valid,
+        i.e. if the source has the same modification time, size and content as
+        when the cache was written. otherwise the file is parsed while it is
+        being read, and each expression is written to the cache as soon as it
+        is parsed, so that the memory used does not depend on the size of the
+        file. a cache that turns out to be truncated or corrupt is written
+        again in the same way, and the expressions it already yielded are
+        skipped
+    """
+    stat = os.stat(path)
+    cached = cache_path(path, cache_dir)
+
+    try:
+        f = open(cached, 'rb')
+    except OSError:
+        f = None
+
+    loaded = 0
+    if f is not None:
+        with f:
+            header = read_header(f)
+            if (header is not None and header[1:3] == (stat.st_mtime_ns, stat.st_size)
+                    and header[3] == file_digest(path)):
+                exprs = decode(f, header[4])
+                while True:
+                    try:
+                        expr = next(exprs)
+                    except StopIteration:
+                        return
+                    except ValueError:
+                        break
+                    loaded += 1
+                    yield expr
+
+    yield from itertools.islice(parse_and_cache(path, cached, stat), loaded, None)
+
+
+def parse_and_cache(path, cached, stat):
+    writer = CacheWriter(cached)
+    try:
+        with open(path, 'rb') as f:
+            reader = HashingReader(f)
+            for expr in ExpressionTree.iter_from_tokens(Tokenizer().tokenize_stream(reader)):
+                writer.write(expr)
+                yield expr
+    except BaseException:  # including a generator closed before the end
+        writer.discard()
+        raise
+    writer.commit(stat, reader.digest())
+
+
+class HashingReader:
+    """ file object wrapper that computes the hash of the content that is read
+    """
+    def __init__(self, f):
+        self.f = f
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+    def digest(self):
+        return self.hash.digest()
+
+
+def file_digest(path, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        reader = HashingReader(f)
+        while reader.read(chunk_size):
+            pass
+    return reader.digest()
+
+
+def read_header(f):
+    try:
+        header = HEADER.unpack(f.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+
+    if header[0] != MAGIC:
+        return None
+    return header
+
+
+class CacheWriter:
+    """ writes the expressions to a temporary file, which replaces the cache
+        once the header is written. like python, it silently runs without
+        cache if it cannot be written, or if an expression is too deeply
+        nested for marshal
+    """
+
+    def __init__(self, cached):
+        self.cached = cached
+        self.f = self.tmp = None
+        self.count = 0
+        try:
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(cached))
+            self.f = os.fdopen(fd, 'wb')
+            self.f.write(bytes(HEADER.size))  # invalid until commit
+        except OSError:
+            self.discard()
+
+    def write(self, expr):
+        if self.f is None:
+            return
+        try:
+            marshal.dump(encode(expr), self.f)
+        except (ValueError, OSError):
+            self.discard()
+        else:
+            self.count += 1
+
+    def commit(self, stat, digest):
+        if self.f is None:
+            return
+        try:
+            self.f.seek(0)
+            self.f.write(HEADER.pack(MAGIC, stat.st_mtime_ns, stat.st_size, digest, self.count))
+            self.f.close()
+            os.replace(self.tmp, self.cached)
+        except OSError:
+            self.discard()
+        self.f = None
+
+    def discard(self):
+        f, self.f = self.f, None
+        tmp, self.tmp = self.tmp, None
+        try:
+            if f is not None:
+                f.close()
+            if tmp is not None:
+                os.remove(tmp)
+        except OSError:
+            pass
+
+
+def encode(expr):
+    """ converts a parsed expression to objects that can be marshalled.
+        symbols become (type, value) tuples, and since the same tuple is used
+        for every occurrence of a symbol, marshal stores them only once
+    """
+    symbols = {}
+
+    def encode_atom(atom):
+        if isinstance(atom, Token):
+            if atom not in symbols:
+                symbols[atom] = (atom.type, atom.value)
+            return symbols[atom]
+        return atom
+
+    # top-level lists are expression trees
+    if isinstance(expr, ExpressionTree):
+        return map_atoms(expr.children, encode_atom)
+    return encode_atom(expr)
+
+
+def decode(f, count):
+    """ yields the count expressions marshalled in the file, one at a time.
+        raises ValueError if the file is truncated or corrupt
+    """
+    def decode_atom(atom):
+        if isinstance(atom, tuple):
+            return Token(atom[1], atom[0])
+        return atom
+
+    for _ in range(count):
+        try:
+            expr = marshal.load(f)
+            if isinstance(expr, list):
+                expr = ExpressionTree(map_atoms(expr, decode_atom))
+            else:
+                expr = decode_atom(expr)
+        except (EOFError, ValueError, TypeError, IndexError) as exc:
+            raise ValueError('corrupt cache: %s' % exc) from exc
+        yield expr
+
+
+def map_atoms(expr, function):
+    """ copies nested lists, applying the function to everything else
+    """
+    result = []
+    stack = [(iter(expr), result)]
+    while stack:
+        children, copy = stack[-1]
+        for child in children:
+            if isinstance(child, list):
+                stack.append((iter(child), []))
+                copy.append(stack[-1][1])
+                break
+            copy.append(function(child))
+        else:
+            stack.pop()
+    return result
@@ -0,0 +1,515 @@
+import inspect
+import types
+
+from lispy.context import ExecutionContext, Frame, GlobalRef, LocalRef, MergedExecutionContext, UNBOUND
+from lispy.expression import ExpressionTree
+from lispy.globals import GLOBALS
+from lispy.interpreter import (
+    AnonymousFunction, CodeResult, EvaluationResult, Function, IterativeInterpreter,
+    Macro, TailCodeResult, UNQUOTE, VARARGS, ensure_not_recur, thread_last, unpack_bind,
+)
+from lispy.tokenizer import Token
+
+
+GeneratorType = types.GeneratorType
+
+
+# opcodes of the nodes
+CONST = 0    # a: the value
+VALUE = 1    # a: function of the context computing the value, e.g. a lookup
+CALL = 2     # a: function, b: arguments, c: whether the last argument is splatted
+ATOMIC_CALL = 3  # a call whose function and arguments are atoms, a and b as CALL
+IF = 4       # a: condition, b: then, c: else
+DO = 5       # a: children
+LET = 6      # a: (name, value) pairs, b: body, c: layout of the frame or None
+DEF = 7      # a: (name, value) pairs
+AND = 8      # a: children
+OR = 9       # a: children
+LEGACY = 10  # evaluated by the handle_* methods of IterativeInterpreter
+LAZY = 11    # compiled when evaluated
+
+# kinds of the continuation frames, which wait for the value of a child
+K_CALL = 0    # data: the values of the function and of the arguments so far
+K_IF = 1
+K_DO = 2      # i: the next child
+K_LET = 3     # env: the new frame, i: the binding being evaluated
+K_DEF = 4     # i: the definition being evaluated
+K_AND = 5     # i: the next child
+K_OR = 6      # i: the next child
+K_LEGACY = 7  # data: a generator of IterativeInterpreter
+
+
+class Node:
+    """ an expression compiled for the machine, see CEKInterpreter
+    """
+    __slots__ = ('op', 'expr', 'a', 'b', 'c')
+
+    def __init__(self, op, expr, a=None, b=None, c=None):
+        self.op = op
+        self.expr = expr
+        self.a = a
+        self.b = b
+        self.c = c
+
+
+class Continuation:
+    """ what to do with the value of the node being evaluated
+    """
+    __slots__ = ('op', 'node', 'env', 'data', 'i')
+
+    def __init__(self, op, node, env, data=None, i=0):
+        self.op = op
+        self.node = node
+        self.env = env
+        self.data = data
+        self.i = i
+
+
+class CEKInterpreter(IterativeInterpreter):
+    """ evaluates expressions with an abstract machine whose state is the
+        node being evaluated (control), its context (environment) and a stack
+        of continuation frames, see execute.
+
+        expressions are compiled once into nodes, whose opcodes are the
+        special forms. the machine either evaluates a node, possibly pushing
+        a continuation and moving on to one of its children, or returns a
+        value to the continuation on top of the stack. code in tail position
+        is evaluated without pushing anything, and function calls do not
+        recurse in python, so neither deep recursion nor long loops written
+        as recursion use the python stack.
+
+        special forms without a compile_* method are evaluated by the handle_*
+        methods of IterativeInterpreter, whose generators are run by the
+        machine too
+    """
+
+    # compiled expressions are cached by identity, the cache is cleared when
+    # it grows too large, e.g. because of the code produced by macros
+    CACHE_SIZE = 2 ** 16
+
+    # expressions nested deeper than this are compiled when first evaluated
+    MAX_COMPILE_DEPTH = 100
+
+    def __init__(self, ctx=None, with_stdlib=False, engine=None, optimize=False):
+        super(CEKInterpreter, self).__init__(ctx, with_stdlib, optimize=optimize)
+        self.compiled = {}
+        self.compile_depth = 0
+        self.last_expr = None
+
+    def evaluate(self, expr, ctx=None):
+        ctx = ctx or self.ctx
+        expr = self.prepare(expr, ctx)
+        return ensure_not_recur(self.execute(self.compile(expr), ctx, []))
+
+    def call(self, fun, args, ctx=None):
+        ctx = ctx or self.ctx
+        gen = self.call_function(fun, ctx, list(args))
+        return self.execute(None, ctx, [Continuation(K_LEGACY, None, ctx, gen)])
+
+    def print_stacktrace(self):
+        print('Call Stack (most recent last):')
+        for k in self.operation_stack:
+            if k.node is not None:
+                print(' ', ExpressionTree.print_short_format(k.node.expr))
+            elif k.data.gi_frame and 'expr' in k.data.gi_frame.f_locals:
+                print(' ', ExpressionTree.print_short_format(k.data.gi_frame.f_locals['expr']))
+            else:
+                print('  <unavailable>')
+
+        if isinstance(self.last_expr, list):
+            print('Exception happened here:', ExpressionTree.to_string(self.last_expr))
+
+    # compilation
+
+    def compile(self, expr):
+        entry = self.compiled.get(id(expr))
+        if entry is not None:
+            return entry[1]
+
+        if isinstance(expr, list):
+            if self.compile_depth >= self.MAX_COMPILE_DEPTH:
+                return Node(LAZY, expr)
+
+            self.compile_depth += 1
+            try:
+                node = self.compile_expression(expr)
+            finally:
+                self.compile_depth -= 1
+        elif isinstance(expr, Token):
+            node = self.compile_symbol(expr)
+        elif type(expr) is LocalRef or type(expr) is GlobalRef:
+            node = Node(VALUE, expr, expr.get)
+        else:
+            return Node(CONST, expr, expr)
+
+        if len(self.compiled) >= self.CACHE_SIZE:
+            self.compiled.clear()
+        self.compiled[id(expr)] = (expr, node)  # keeps expr alive, so that its id is not reused
+        return node
+
+    def compile_symbol(self, token):
+        if token.type == Token.TOKEN_IDENTIFIER or token.value in GLOBALS:
+            return Node(VALUE, token, GlobalRef(token).get)
+        elif token.type == Token.TOKEN_LITERAL:
+            return Node(CONST, token, token.value)
+        elif token is UNQUOTE or token.value == "'":
+            return Node(LEGACY, token)
+        elif token.value[0] == "'":
+            return Node(CONST, token, Token(token.value[1:]))
+
+        name = token.value
+        return Node(VALUE, token, lambda ctx: ctx.get(name, name))
+
+    def compile_expression(self, expr):
+        if not expr:
+            return Node(LEGACY, expr)
+
+        name = self.form_name(expr[0])
+        handler = getattr(self, 'handle_' + name, None) if name is not None else None
+        if handler is None:
+            return self.compile_function_call(expr)
+
+        compiler = getattr(self, 'compile_' + name, None)
+        if compiler is not None:
+            try:
+                # malformed forms are left to the handler, which raises the error
+                inspect.signature(handler).bind(None, expr, *expr[1:])
+            except TypeError:
+                pass
+            else:
+                node = compiler(expr, *expr[1:])
+                if node is not None:
+                    return node
+
+        return Node(LEGACY, expr)
+
+    def compile_function_call(self, expr):
+        children = expr[1:]
+        splat = len(children) > 1 and VARARGS in children
+        if splat and (children[-2] is not VARARGS or VARARGS in children[:-2]):
+            return Node(LEGACY, expr)  # raises the syntax error
+
+        if splat:
+            children = children[:-2] + children[-1:]
+        head = self.compile(expr[0])
+        args = tuple(Node(CONST, child, child) if child is VARARGS else self.compile(child)
+                     for child in children)
+        if not splat and all(node.op in (CONST, VALUE) for node in (head,) + args):
+            return Node(ATOMIC_CALL, expr, head, args)
+        return Node(CALL, expr, head, args, splat)
+
+    def compile_if(self, expr, cond, iftrue, iffalse):
+        return Node(IF, expr, self.compile(cond), self.compile(iftrue), self.compile(iffalse))
+
+    def compile_do(self, expr, *children):
+        if VARARGS in children:
+            return None
+        elif not children:
+            return Node(CONST, expr, None)
+        elif len(children) == 1:
+            return self.compile(children[0])
+        return Node(DO, expr, tuple(self.compile(child) for child in children))
+
+    def compile_let(self, expr, bindings, body):
+        if not isinstance(bindings, list) or len(bindings) % 2:
+            return None
+
+        try:
+            names = [
+                self.ensure_list_of_identifiers(name) if isinstance(name, list)
+                else self.ensure_identifier(name)
+                for name in bindings[::2]
+            ]
+        except SyntaxError:
+            return None
+
+        pairs = tuple(zip(names, [self.compile(value) for value in bindings[1::2]]))
+        layout = getattr(bindings, 'layout', None)  # see lispy.resolver
+        return Node(LET, expr, pairs, self.compile(body), layout)
+
+    def compile_def(self, expr, *children):
+        if len(children) % 2:
+            return None
+
+        try:
+            names = [self.ensure_identifier(name) for name in children[::2]]
+        except SyntaxError:
+            return None
+
+        if not names:
+            return Node(CONST, expr, None)
+        return Node(DEF, expr, tuple(zip(names, [self.compile(value) for value in children[1::2]])))
+
+    def compile_defn(self, expr, name, parameters, body):
+        return Node(VALUE, expr, lambda ctx: self.build_callable(
+            Function, ctx, expr, name, parameters, body).expr)
+
+    def compile_defmacro(self, expr, name, parameters, body):
+        return Node(VALUE, expr, lambda ctx: self.build_callable(
+            Macro, ctx, expr, name, parameters, body).expr)
+
+    def compile_hash(self, expr, *children):
+        body = list(children)
+        return Node(VALUE, expr, lambda ctx: AnonymousFunction(ctx, body))
+
+    def compile_and(self, expr, *children):
+        if VARARGS in children:
+            return None
+        elif not children:
+            return Node(CONST, expr, True)
+        return Node(AND, expr, tuple(self.compile(child) for child in children))
+
+    def compile_or(self, expr, *children):
+        if VARARGS in children:
+            return None
+        elif not children:
+            return Node(CONST, expr, False)
+        return Node(OR, expr, tuple(self.compile(child) for child in children))
+
+    def compile_thread_last(self, expr, value, *forms):
+        return self.compile(thread_last(expr, self.ctx))
+
+    def compile_comment(self, expr, *children):
+        return Node(CONST, expr, None)
+
+    # evaluation
+
+    def execute(self, node, env, stack):
+        """ runs the machine until the stack of continuations is empty, and
+            returns the last value
+        """
+        outer = self.operation_stack
+        self.operation_stack = stack
+        value = k = None
+
+        try:
+            while True:
+                if node is None:
+                    # return the value to the innermost continuation
+                    if not stack:
+                        break
+
+                    k = stack.pop()
+                    op = k.op
+                    if op == K_CALL:
+                        values = k.data
+                        values.append(value)
+                        call = k.node
+                        env = k.env
+
+                        if len(values) == 1 and isinstance(value, Macro):
+                            args = list(call.expr[1:])
+                            if call.c:
+                                args = args[:-2] + list(args[-1])
+                            stack.append(Continuation(K_LEGACY, None, env, value(env, *args)))
+                            value = None
+                            continue
+
+                        # atoms are evaluated in place
+                        children = call.b
+                        i, n = len(values) - 1, len(call.b)
+                        while i < n:
+                            child = children[i]
+                            if child.op == CONST:
+                                values.append(child.a)
+                            elif child.op == VALUE:
+                                values.append(child.a(env))
+                            else:
+                                break
+                            i += 1
+
+                        if i < n:
+                            stack.append(k)
+                            node = children[i]
+                            continue
+
+                        fun, args = values[0], values[1:]
+                        if call.c:
+                            args[-1:] = args[-1]
+                    elif op == K_IF:
+                        node = k.node.b if value else k.node.c
+                        env = k.env
+                        continue
+                    elif op == K_DO:
+                        children, i = k.node.a, k.i
+                        env = k.env
+                        if i < len(children) - 1:
+                            k.i += 1
+                            stack.append(k)
+                        node = children[i]  # the last child is in tail position
+                        continue
+                    elif op == K_LET:
+                        pairs, i = k.node.a, k.i
+                        env = k.env
+                        name = pairs[i][0]
+                        if isinstance(name, list):
+                            unpack_bind(name, value, env)
+                        else:
+                            env[name] = value
+
+                        if i < len(pairs) - 1:
+                            k.i += 1
+                            stack.append(k)
+                            node = pairs[i + 1][1]
+                        else:
+                            node = k.node.b
+                        continue
+                    elif op == K_DEF:
+                        pairs, i = k.node.a, k.i
+                        env = k.env
+                        env[pairs[i][0]] = value
+                        if i < len(pairs) - 1:
+                            k.i += 1
+                            stack.append(k)
+                            node = pairs[i + 1][1]
+                        continue
+                    elif op == K_AND or op == K_OR:
+                        if op == K_AND and not value:
+                            value = False
+                        elif op == K_OR and value:
+                            value = True
+                        elif k.i < len(k.node.a):
+                            node = k.node.a[k.i]
+                            env = k.env
+                            k.i += 1
+                            stack.append(k)
+                        else:
+                            value = op == K_AND
+                        continue
+                    else:
+                        node, env, value = self.resume(k, value)
+                        continue
+                else:
+                    op = node.op
+                    if op == ATOMIC_CALL:
+                        head = node.a
+                        fun = head.a if head.op == CONST else head.a(env)
+                        if isinstance(fun, Macro):
+                            stack.append(Continuation(K_CALL, node, env, []))
+                            value = fun
+                            node = None
+                            continue
+
+                        args = [child.a if child.op == CONST else child.a(env) for child in node.b]
+                        node = None
+                    elif op == CALL:
+                        head = node.a
+                        if head.op == VALUE:
+                            fun = head.a(env)
+                        elif head.op == CONST:
+                            fun = head.a
+                        else:
+                            stack.append(Continuation(K_CALL, node, env, []))
+                            node = head
+                            continue
+
+                        # continue with the arguments, see K_CALL
+                        stack.append(Continuation(K_CALL, node, env, []))
+                        value = fun
+                        node = None
+                        continue
+                    elif op == VALUE:
+                        value = node.a(env)
+                        node = None
+                        continue
+                    elif op == CONST:
+                        value = node.a
+                        node = None
+                        continue
+                    elif op == IF:
+                        stack.append(Continuation(K_IF, node, env))
+                        node = node.a
+                        continue
+                    elif op == LET:
+                        layout = node.c
+                        if layout is None:
+                            env = ExecutionContext(env)
+                        else:
+                            env = Frame(env, layout, [UNBOUND] * len(layout))
+
+                        if node.a:
+                            stack.append(Continuation(K_LET, node, env))
+                            node = node.a[0][1]
+                        else:
+                            node = node.b
+                        continue
+                    elif op == DO:
+                        stack.append(Continuation(K_DO, node, env, i=1))
+                        node = node.a[0]
+                        continue
+                    elif op == DEF:
+                        stack.append(Continuation(K_DEF, node, env))
+                        node = node.a[0][1]
+                        continue
+                    elif op == AND or op == OR:
+                        stack.append(Continuation(K_AND if op == AND else K_OR, node, env, i=1))
+                        node = node.a[0]
+                        continue
+                    elif op == LAZY:
+                        node = self.compile(node.expr)
+                        continue
+                    else:
+                        value = IterativeInterpreter.eval(self, node.expr, env)
+                        if type(value) is GeneratorType:
+                            stack.append(Continuation(K_LEGACY, None, env, value))
+                            value = None
+                        node = None
+                        continue
+
+                # apply fun to args, the call is in tail position
+                cls = type(fun)
+                if cls is Function:
+                    env = fun.frame(env, args)
+                    node = self.compile(fun.code)
+                elif cls is AnonymousFunction:
+                    bindings = {}
+                    for i, x in enumerate(args):
+                        bindings['%' + str(i)] = x
+                    env = MergedExecutionContext(ExecutionContext(bindings), env, fun.ctx)
+                    node = self.compile(fun.body)
+                elif isinstance(fun, (Function, AnonymousFunction)):
+                    stack.append(Continuation(K_LEGACY, None, env, fun(env, *args)))
+                    value = None
+                elif callable(fun):
+                    value = fun(*args)
+                    if type(value) is GeneratorType:
+                        stack.append(Continuation(K_LEGACY, None, env, value))
+                        value = None
+                else:
+                    raise RuntimeError('not a function: "%s"' % fun)
+        except Exception:
+            if node is None and k is not None:
+                node = k.node
+            self.last_expr = node.expr if node is not None else None
+            raise
+
+        # the stack is kept after an exception, for print_stacktrace
+        self.operation_stack = outer
+        return value
+
+    def resume(self, k, value):
+        """ sends the value to the generator of IterativeInterpreter waiting
+            for it, and returns the next state of the machine, i.e. the node
+            to evaluate, or None, its context and the value
+        """
+        gen = k.data
+        try:
+            res = gen.send(value)
+        except StopIteration:
+            return None, k.env, value  # the value of the last result
+
+        if not isinstance(res, EvaluationResult):
+            res = CodeResult(res, self.ctx)
+
+        if isinstance(res, TailCodeResult):
+            gen.close()
+        else:
+            k.env = res.ctx
+            self.operation_stack.append(k)
+
+        if type(res.expr) is GeneratorType:
+            self.operation_stack.append(Continuation(K_LEGACY, None, res.ctx, res.expr))
+            return None, res.ctx, None
+        elif res.must_evaluate:
+            return self.compile(res.expr), res.ctx, None
+        return None, res.ctx, res.expr
@@ -1,3 +1,4 @@
+import sys
 import traceback
 
 import click
@@ -6,10 +7,11 @@ from prompt_toolkit import prompt
 from prompt_toolkit.history import InMemoryHistory
 from prompt_toolkit.validation import ValidationError, Validator
 
+from lispy import parallel
 from lispy.expression import ExpressionTree
 from lispy.interpreter import IterativeInterpreter
 from lispy.tokenizer import Tokenizer
-from lispy.utils import eval_expr
+from lispy.utils import eval_expr, eval_file
 
 
 class ExpressionValidator(Validator):
@@ -66,23 +68,49 @@ def repl(inpr, **kwargs):
 
 
 @click.command()
-@click.argument('input-file', type=click.File('r'), nargs=-1)
+@click.argument('input-file', type=click.Path(exists=True, dir_okay=False, allow_dash=True), nargs=-1)
 @click.option('-e', '--expression', help='Evaluate this expression and print the result')
 @click.option('--without-stdlib', '-S', is_flag=True, help='Do not load standard library at startup.')
 @click.option('--do-repl', '-r', is_flag=True, help='Start the REPL after evaluating the file and/or the expression')
-def main(input_file, expression, without_stdlib, do_repl, **kwargs):
+@click.option('--engine', type=click.Choice(['coroutine', 'closure', 'python', 'cek']), default='coroutine',
+              help='How expressions are evaluated.')
+@click.option('--no-cache', is_flag=True, help='Always parse the input files instead of using the cached parse trees.')
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+              help='Store the cached parse trees here instead of __lispycache__ next to each file.')
+@click.option('--emit-python', is_flag=True,
+              help='Print the python code the expressions are translated to (implies --engine python).')
+@click.option('--optimize', '-O', is_flag=True,
+              help='Fold constant expressions and quoted forms before evaluating them.')
+@click.option('--processes', type=click.IntRange(min=1),
+              help='The number of worker processes of pmap (default: the number of cpus).')
+@click.option('--threads', type=click.IntRange(min=1),
+              help='The number of threads evaluating futures and pmap_io.')
+def main(input_file, expression, without_stdlib, do_repl, engine, no_cache, cache_dir, emit_python,
+         optimize, processes, threads, **kwargs):
     '''
     Python-based LISP interpreter.
 
     Starts the REPL when invoked without arguments. Otherwise, executes the code in
     the file (if given), then executes the provided expression (if given), then
     enters the REPL (if the flag is specified).
+
+    The parse trees of the files are cached in __lispycache__ directories and
+    reused as long as the files do not change.
     '''
-    inpr = IterativeInterpreter(with_stdlib=not without_stdlib)
+    if emit_python:
+        engine = 'python'
+    parallel.configure(processes=processes, threads=threads)
+
+    inpr = IterativeInterpreter(with_stdlib=not without_stdlib, engine=engine, optimize=optimize)
+    if emit_python:
+        inpr.emit = sys.stdout
 
     if input_file:
-        for f in input_file:
-            eval_expr(f.read(), inpr)
+        for path in input_file:
+            if path == '-':
+                eval_expr(click.get_text_stream('stdin'), inpr)
+            else:
+                eval_file(path, inpr, cache=not no_cache, cache_dir=cache_dir)
 
     if expression:
         result = eval_expr(expression, inpr)
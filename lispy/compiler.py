@@ -0,0 +1,682 @@
+import inspect
+import itertools
+import types
+
+from lispy.context import (
+    ExecutionContext, Frame, GlobalRef, LocalRef, MergedExecutionContext, UNBOUND,
+)
+from lispy.globals import GLOBALS
+from lispy.interpreter import (
+    AnonymousFunction, AwaitResult, CodeResult, EvaluationResult, Function, IterativeInterpreter,
+    Macro, Recur, TailCodeResult, UNQUOTE, VARARGS, as_awaitable, ensure_not_recur, thread_last,
+    unpack_bind,
+)
+from lispy.lazy import LazySeq
+from lispy.tokenizer import Token
+
+
+GeneratorType = types.GeneratorType
+
+
+class ClosureInterpreter(IterativeInterpreter):
+    """ compiles every expression once into a tree of python closures, which
+        are then called with the context to evaluate the expression in.
+
+        a closure either returns the value of the expression or, if it needs
+        to evaluate other code, a generator. generators yield the generators of
+        the code they want to evaluate and get back its value, which is what
+        the generator returns; evaluate runs them on a stack, so that deep
+        recursion in lispy does not become deep recursion in python. code in
+        tail position is not yielded but returned: a generator returning a
+        generator is replaced by it on the stack.
+
+        special forms without a compile_* method are evaluated by the handle_*
+        methods of IterativeInterpreter
+    """
+
+    # compiled expressions are cached by identity, the cache is cleared when
+    # it grows too large, e.g. because of the code produced by macros
+    CACHE_SIZE = 2 ** 16
+
+    # expressions nested deeper than this are compiled when first evaluated
+    MAX_COMPILE_DEPTH = 100
+
+    def __init__(self, ctx=None, with_stdlib=False, engine=None, optimize=False):
+        super(ClosureInterpreter, self).__init__(ctx, with_stdlib, optimize=optimize)
+        self.compiled = {}
+        self.compile_depth = 0
+
+    def evaluate(self, expr, ctx=None):
+        ctx = ctx or self.ctx
+        expr = self.prepare(expr, ctx)
+
+        val = self.compile(expr)(ctx)
+        if type(val) is not GeneratorType:
+            return ensure_not_recur(val)
+        return ensure_not_recur(self.run(val))
+
+    def call(self, fun, args, ctx=None):
+        val = self.apply(fun, ctx or self.ctx, list(args))
+        if type(val) is not GeneratorType:
+            return val
+        return self.run(val)
+
+    def run(self, gen):
+        outer = self.operation_stack
+        stack = self.operation_stack = [gen]
+        val = None
+        while stack:
+            op = stack[-1]
+            self.last_frame = op.gi_frame
+            try:
+                val = op.send(val)
+            except StopIteration as stop:
+                val = stop.value
+                if type(val) is GeneratorType:
+                    stack[-1] = val  # tail call
+                    val = None
+                else:
+                    stack.pop()
+            else:
+                if type(val) is AwaitResult:
+                    val = val.expr  # waits, see AwaitResult
+                else:
+                    stack.append(val)
+                    val = None
+
+        self.operation_stack = outer
+        self.last_frame = None
+        return val
+
+    async def run_async(self, gen):
+        """ like run, but a coroutine, see IterativeInterpreter.run_async
+        """
+        import asyncio
+
+        stack, outer = [gen], self.operation_stack
+        self.operation_stack = stack
+        val, steps = None, 0
+        while stack:
+            steps += 1
+            if steps % self.ASYNC_STEPS == 0:
+                self.operation_stack = outer
+                await asyncio.sleep(0)
+                outer, self.operation_stack = self.operation_stack, stack
+
+            op = stack[-1]
+            self.last_frame = op.gi_frame
+            try:
+                val = op.send(val)
+            except StopIteration as stop:
+                val = stop.value
+                if type(val) is GeneratorType:
+                    stack[-1] = val  # tail call
+                    val = None
+                else:
+                    stack.pop()
+            else:
+                if type(val) is AwaitResult:
+                    self.operation_stack = outer
+                    val = await as_awaitable(val.awaitable)
+                    outer, self.operation_stack = self.operation_stack, stack
+                else:
+                    stack.append(val)
+                    val = None
+
+        self.operation_stack = outer
+        self.last_frame = None
+        return val
+
+    def eval(self, expr, ctx):
+        return self.compile(expr)(ctx)
+
+    def compile(self, expr):
+        entry = self.compiled.get(id(expr))
+        if entry is not None:
+            return entry[1]
+
+        if isinstance(expr, list):
+            if self.compile_depth >= self.MAX_COMPILE_DEPTH:
+                return self.compile_later(expr)
+
+            self.compile_depth += 1
+            try:
+                node = self.compile_expression(expr)
+            finally:
+                self.compile_depth -= 1
+        elif isinstance(expr, Token):
+            node = self.compile_symbol(expr)
+        elif type(expr) is LocalRef or type(expr) is GlobalRef:
+            return expr.get
+        else:
+            return self.constant(expr)
+
+        if len(self.compiled) >= self.CACHE_SIZE:
+            self.compiled.clear()
+        self.compiled[id(expr)] = (expr, node)  # keeps expr alive, so that its id is not reused
+        return node
+
+    def compile_later(self, expr):
+        def node(ctx):
+            return self.compile(expr)(ctx)
+        return node
+
+    @staticmethod
+    def constant(value):
+        def node(ctx):
+            return value
+        return node
+
+    def compile_symbol(self, token):
+        if token.type == Token.TOKEN_IDENTIFIER or token.value in GLOBALS:
+            return GlobalRef(token).get
+        elif token.type == Token.TOKEN_LITERAL:
+            return self.constant(token.value)
+        elif token is UNQUOTE:
+            def node(ctx):
+                raise RuntimeError('cannot un-quote outside a quote')
+            return node
+        elif token.value[0] == "'":
+            return self.constant(Token(token.value[1:]))
+        else:
+            name = token.value
+
+            def node(ctx):
+                return ctx.get(name, name)
+            return node
+
+    def compile_expression(self, expr):
+        if not expr:
+            return self.compile_legacy(expr)
+
+        name = self.form_name(expr[0])
+        if name is None:
+            return self.compile_function_call(expr)
+
+        handler = getattr(self, 'handle_' + name, None)
+        if handler is None:
+            return self.compile_function_call(expr)
+
+        compiler = getattr(self, 'compile_' + name, None)
+        if compiler is not None:
+            try:
+                # malformed forms are left to the handler, which raises the error
+                inspect.signature(handler).bind(None, expr, *expr[1:])
+            except TypeError:
+                pass
+            else:
+                node = compiler(expr, *expr[1:])
+                if node is not None:
+                    return node
+
+        return self.compile_legacy(expr)
+
+    def compile_legacy(self, expr):
+        """ evaluates the expression with IterativeInterpreter.eval
+        """
+        def node(ctx):
+            val = IterativeInterpreter.eval(self, expr, ctx)
+            if type(val) is GeneratorType:
+                return self.run_legacy(val)
+            return val
+        return node
+
+    def run_legacy(self, gen):
+        """ runs a generator of IterativeInterpreter, which yields evaluation
+            results and whose value is the value of the last of them
+        """
+        val = None
+        try:
+            res = next(gen)
+            while True:
+                if not isinstance(res, EvaluationResult):
+                    res = CodeResult(res, self.ctx)
+
+                # generators found here follow the protocol of IterativeInterpreter
+                if type(res) is AwaitResult:
+                    val = yield res  # awaited by run or run_async
+                elif type(res.expr) is GeneratorType:
+                    val = self.run_legacy(res.expr)
+                elif res.must_evaluate:
+                    val = self.compile(res.expr)(res.ctx)
+                else:
+                    val = res.expr
+
+                if isinstance(res, TailCodeResult):
+                    gen.close()
+                    return val
+                elif type(val) is GeneratorType:
+                    val = yield val
+                res = gen.send(val)
+        except StopIteration:
+            return val
+
+    def compile_function_call(self, expr):
+        head = self.compile(expr[0])
+
+        children = expr[1:]
+        splat = len(children) > 1 and VARARGS in children
+        if splat and (children[-2] is not VARARGS or VARARGS in children[:-2]):
+            return self.compile_legacy(expr)  # raises the syntax error
+
+        if splat:
+            args = [self.compile(child) for child in children[:-2]]
+            rest = self.compile(children[-1])
+        else:
+            args = [self.constant(child) if child is VARARGS else self.compile(child)
+                    for child in children]
+        apply = self.apply
+
+        def node(ctx):
+            fun = head(ctx)
+            if type(fun) is GeneratorType:
+                fun = yield fun
+
+            if isinstance(fun, Macro):
+                values = list(children)
+                if splat:
+                    values = values[:-2] + list(values[-1])
+            else:
+                values = []
+                for arg in args:
+                    val = arg(ctx)
+                    if type(val) is GeneratorType:
+                        val = yield val
+                    values.append(val)
+
+                if splat:
+                    val = rest(ctx)
+                    if type(val) is GeneratorType:
+                        val = yield val
+                    values.extend(val)
+
+            return apply(fun, ctx, values)
+        return node
+
+    def apply(self, fun, ctx, args):
+        """ calls a function, returning its value or a generator
+        """
+        cls = type(fun)
+        if cls is Function:
+            return self.compile(fun.code)(fun.frame(ctx, args))
+        elif cls is AnonymousFunction:
+            bindings = {}
+            for i, x in enumerate(args):
+                bindings['%' + str(i)] = x
+
+            new_ctx = MergedExecutionContext(ExecutionContext(bindings), ctx, fun.ctx)
+            return self.compile(fun.body)(new_ctx)
+        elif isinstance(fun, (Function, AnonymousFunction, Macro)):
+            return self.run_legacy(fun(ctx, *args))
+        elif hasattr(fun, '__call__'):
+            val = fun(*args)
+            if type(val) is GeneratorType:
+                return self.run_legacy(val)
+            return val
+        else:
+            raise RuntimeError('not a function: "%s"' % fun)
+
+    def compile_if(self, expr, cond, iftrue, iffalse):
+        cond, iftrue, iffalse = self.compile(cond), self.compile(iftrue), self.compile(iffalse)
+
+        def node(ctx):
+            val = cond(ctx)
+            if type(val) is GeneratorType:
+                val = yield val
+
+            return (iftrue if val else iffalse)(ctx)
+        return node
+
+    def compile_do(self, expr, *children):
+        if VARARGS in children:
+            return None
+
+        if not children:
+            return self.constant(None)
+        *children, last = [self.compile(child) for child in children]
+
+        def node(ctx):
+            for child in children:
+                val = child(ctx)
+                if type(val) is GeneratorType:
+                    yield val
+            return last(ctx)
+        return node
+
+    def compile_let(self, expr, bindings, body):
+        if not isinstance(bindings, list) or len(bindings) % 2:
+            return None
+
+        try:
+            names = [
+                self.ensure_list_of_identifiers(name) if isinstance(name, list)
+                else self.ensure_identifier(name)
+                for name in bindings[::2]
+            ]
+        except SyntaxError:
+            return None
+
+        values = [self.compile(value) for value in bindings[1::2]]
+        pairs = list(zip(names, values))
+        body = self.compile(body)
+        layout = getattr(bindings, 'layout', None)  # see lispy.resolver
+
+        def node(ctx):
+            if layout is None:
+                new_ctx = ExecutionContext(ctx)
+            else:
+                new_ctx = Frame(ctx, layout, [UNBOUND] * len(layout))
+            for name, value in pairs:
+                val = value(new_ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+
+                if isinstance(name, list):
+                    unpack_bind(name, val, new_ctx)
+                else:
+                    new_ctx[name] = val
+
+            return body(new_ctx)
+        return node
+
+    def compile_loop(self, expr, bindings, body):
+        if not isinstance(bindings, list) or len(bindings) % 2:
+            return None
+
+        try:
+            names = [self.binding_target(name) for name in bindings[::2]]
+        except SyntaxError:
+            return None
+
+        pairs = list(zip(names, [self.compile(value) for value in bindings[1::2]]))
+        body = self.compile(body)
+        binding_context = self.binding_context
+
+        def node(ctx):
+            new_ctx = binding_context(ctx, bindings)
+            for name, value in pairs:
+                val = value(new_ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                bind(new_ctx, name, val)
+
+            while True:
+                val = body(new_ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                if type(val) is not Recur:
+                    return val
+                elif len(val.values) != len(names):
+                    raise SyntaxError('recur expects %d values, got %d' % (len(names), len(val.values)))
+
+                for name, each in zip(names, val.values):
+                    bind(new_ctx, name, each)
+        return node
+
+    def compile_recur(self, expr, *children):
+        if VARARGS in children:
+            return None
+        children = [self.compile(child) for child in children]
+
+        def node(ctx):
+            values = []
+            for child in children:
+                val = child(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                values.append(val)
+            return Recur(values)
+        return node
+
+    def compile_doseq(self, expr, binding, *body):
+        if not isinstance(binding, list) or len(binding) != 2:
+            return None
+
+        try:
+            name = self.binding_target(binding[0])
+        except SyntaxError:
+            return None
+
+        coll, body = self.compile(binding[1]), [self.compile(child) for child in body]
+        binding_context = self.binding_context
+        counting = self.form_name(expr[0]) == 'dotimes'
+
+        def node(ctx):
+            values = coll(ctx)
+            if type(values) is GeneratorType:
+                values = yield values
+            if counting:
+                values = range(values)
+
+            new_ctx = binding_context(ctx, binding)
+            for item in values:
+                bind(new_ctx, name, item)
+                for child in body:
+                    val = child(new_ctx)
+                    if type(val) is GeneratorType:
+                        yield val
+        return node
+
+    def compile_dotimes(self, expr, binding, *body):
+        return self.compile_doseq(expr, binding, *body)
+
+    def binding_target(self, target):
+        """ the name, or the list of names, that a loop binds
+        """
+        if isinstance(target, list):
+            return self.ensure_list_of_identifiers(target)
+        return self.ensure_identifier(target)
+
+    def compile_await(self, expr, awaitable):
+        awaitable = self.compile(awaitable)
+
+        def node(ctx):
+            aw = awaitable(ctx)
+            if type(aw) is GeneratorType:
+                aw = yield aw
+            return (yield AwaitResult(aw, ctx))
+        return node
+
+    def compile_def(self, expr, *children):
+        if len(children) % 2:
+            return None
+
+        try:
+            names = [self.ensure_identifier(name) for name in children[::2]]
+        except SyntaxError:
+            return None
+
+        pairs = [(name, self.compile(value)) for name, value in zip(names, children[1::2])]
+
+        def node(ctx):
+            val = None
+            for name, value in pairs:
+                val = value(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                ctx[name] = val
+            return val
+        return node
+
+    def compile_defn(self, expr, name, parameters, body):
+        def node(ctx):
+            return self.build_callable(Function, ctx, expr, name, parameters, body).expr
+        return node
+
+    def compile_defmacro(self, expr, name, parameters, body):
+        def node(ctx):
+            return self.build_callable(Macro, ctx, expr, name, parameters, body).expr
+        return node
+
+    def compile_hash(self, expr, *children):
+        body = list(children)
+
+        def node(ctx):
+            return AnonymousFunction(ctx, body)
+        return node
+
+    def compile_and(self, expr, *children):
+        if VARARGS in children:
+            return None
+        children = [self.compile(child) for child in children]
+
+        def node(ctx):
+            for child in children:
+                val = child(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                if not val:
+                    return False
+            return True
+        return node
+
+    def compile_or(self, expr, *children):
+        if VARARGS in children:
+            return None
+        children = [self.compile(child) for child in children]
+
+        def node(ctx):
+            for child in children:
+                val = child(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                if val:
+                    return True
+            return False
+        return node
+
+    def compile_in(self, expr, item, collection):
+        item, collection = self.compile(item), self.compile(collection)
+
+        def node(ctx):
+            it = item(ctx)
+            if type(it) is GeneratorType:
+                it = yield it
+
+            coll = collection(ctx)
+            if type(coll) is GeneratorType:
+                coll = yield coll
+            return it in coll
+        return node
+
+    def compile_dot(self, expr, member, obj):
+        try:
+            member = self.ensure_identifier(member)
+        except SyntaxError:
+            return None
+        obj = self.compile(obj)
+
+        def node(ctx):
+            val = obj(ctx)
+            if type(val) is GeneratorType:
+                val = yield val
+
+            # like handle_dot, the attribute is evaluated
+            val = getattr(val, member)
+            if type(val) is GeneratorType:
+                return self.run_legacy(val)
+            elif isinstance(val, (list, Token)):
+                return self.compile(val)(ctx)
+            return val
+        return node
+
+    def compile_comment(self, expr, *children):
+        return self.constant(None)
+
+    def compile_thread_last(self, expr, value, *forms):
+        return self.compile(thread_last(expr, self.ctx))
+
+    def compile_map(self, expr, fn, coll):
+        fn, coll = self.compile(fn), self.compile(coll)
+        apply = self.apply
+
+        def node(ctx):
+            f = fn(ctx)
+            if type(f) is GeneratorType:
+                f = yield f
+
+            c = coll(ctx)
+            if type(c) is GeneratorType:
+                c = yield c
+            if isinstance(c, LazySeq):
+                return c.map(self.as_python(f, ctx))
+
+            res = []
+            for x in c:
+                val = apply(f, ctx, [x])
+                if type(val) is GeneratorType:
+                    val = yield val
+                res.append(val)
+            return res
+        return node
+
+    def compile_filter(self, expr, fn, coll):
+        fn, coll = self.compile(fn), self.compile(coll)
+        apply = self.apply
+
+        def node(ctx):
+            f = fn(ctx)
+            if type(f) is GeneratorType:
+                f = yield f
+
+            c = coll(ctx)
+            if type(c) is GeneratorType:
+                c = yield c
+            if isinstance(c, LazySeq):
+                return c.filter(self.as_python(f, ctx))
+
+            res = []
+            for x in c:
+                keep = apply(f, ctx, [x])
+                if type(keep) is GeneratorType:
+                    keep = yield keep
+                if keep:
+                    res.append(x)
+            return res
+        return node
+
+    def compile_reduce(self, expr, fn, initial, *items):
+        splat = VARARGS in items
+        if splat and (len(items) < 2 or items[-2] is not VARARGS or VARARGS in items[:-2]):
+            return None  # raises the syntax error
+
+        fn, initial = self.compile(fn), self.compile(initial)
+        args = [self.compile(item) for item in (items[:-2] if splat else items)]
+        rest = self.compile(items[-1]) if splat else None
+        apply = self.apply
+
+        def node(ctx):
+            f = fn(ctx)
+            if type(f) is GeneratorType:
+                f = yield f
+
+            acc = initial(ctx)
+            if type(acc) is GeneratorType:
+                acc = yield acc
+
+            values = []
+            for arg in args:
+                val = arg(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                values.append(val)
+
+            if rest is not None:
+                val = rest(ctx)
+                if type(val) is GeneratorType:
+                    val = yield val
+                values = itertools.chain(values, val)
+
+            for x in values:
+                acc = apply(f, ctx, [acc, x])
+                if type(acc) is GeneratorType:
+                    acc = yield acc
+            return acc
+        return node
+
+
+def bind(ctx, target, value):
+    if type(target) is list:
+        unpack_bind(target, value, ctx)
+    else:
+        ctx[target] = value
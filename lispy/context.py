@@ -1,26 +1,114 @@
 import builtins
 
 from lispy.globals import GLOBALS
+from lispy.tokenizer import Token
+
+
+# value of the variables of a frame that were not bound yet
+UNBOUND = object()
+
+# the names bound by some context. the other names can only be found in
+# GLOBALS or in builtins, see GlobalRef
+SHADOWED = set()
+
+# incremented when a name is added to SHADOWED
+_version = 0
+
+
+class InlinedFunctions(dict):
+    """ the functions that lispy.resolver inlines, by name. a name is
+        removed when another context binds it, and version is incremented,
+        so that the code where the function was inlined is resolved again
+    """
+    __slots__ = ('version',)
+
+    def __init__(self):
+        super(InlinedFunctions, self).__init__()
+        self.version = 0
+
+    def forget(self, names):
+        for name in names:
+            self.pop(name, None)
+        self.version += 1
+
+
+INLINED = InlinedFunctions()
+
+# the globals that ->> assumed were not bound when it fused the stages calling
+# them. binding one of them invalidates the code like forgetting an inlined
+# function does
+FUSED = set()
+
+
+def shadow(names):
+    """ records that a context binds names, which invalidates the lookups
+        cached by GlobalRefs when one of them was not bound before, and the
+        code where functions with one of these names were inlined or fused
+    """
+    global _version
+    if not SHADOWED.issuperset(names):
+        SHADOWED.update(names)
+        _version += 1
+    if (INLINED and not INLINED.keys().isdisjoint(names)) or (FUSED and not FUSED.isdisjoint(names)):
+        FUSED.difference_update(names)
+        INLINED.forget(names)
 
 
 class ExecutionContext(object):
+    __slots__ = ('parent', 'bindings')
+
+    # searched after the parents, see Frame
+    defctx = None
+
     def __init__(self, parent_ctx, **bindings):
         self.parent = parent_ctx
         self.bindings = bindings
+        if bindings:
+            shadow(bindings)
+
+    def local(self, item):
+        """ the value bound to item by this context, without looking at
+            the parents, or UNBOUND
+        """
+        return self.bindings.get(item, UNBOUND)
 
     def __getitem__(self, item):
-        if item in self.bindings:
-            return self.bindings[item]
-        elif self.parent:
-            return self.parent[item]
-        elif item in GLOBALS:
-            return GLOBALS[item]
-        elif item in builtins.__dict__:
-            return builtins.__dict__[item]
-        else:
-            raise NameError(item)
+        # iterative, since the chains of contexts are as long as the chains
+        # of calls. the contexts where functions were defined are searched
+        # after the chain, the one of the outermost call first
+        ctx, definitions = self, None
+        while True:
+            value = ctx.local(item)
+            if value is not UNBOUND:
+                return value
+            elif ctx.defctx is not None:
+                definitions = definitions or []
+                definitions.append(ctx.defctx)
+
+            parent = ctx.parent
+            if not parent:
+                if item in GLOBALS:
+                    return GLOBALS[item]
+                elif item in builtins.__dict__:
+                    return builtins.__dict__[item]
+                break
+            elif type(parent).__getitem__ is not ExecutionContext.__getitem__:
+                try:
+                    return parent[item]
+                except NameError:
+                    break
+            ctx = parent
+
+        for defctx in reversed(definitions or ()):
+            try:
+                return defctx[item]
+            except NameError:
+                pass
+        raise NameError(item)
 
     def __setitem__(self, key, value):
+        if key not in SHADOWED or key in INLINED:
+            shadow((key,))
         self.bindings[key] = value
 
     def __contains__(self, item):
@@ -37,11 +125,20 @@ class ExecutionContext(object):
         except NameError:
             return default
 
+    def with_parent(self, parent_ctx):
+        """ a context sharing (not copying) the bindings of this one
+        """
+        ctx = ExecutionContext(parent_ctx)
+        ctx.bindings = self.bindings
+        return ctx
+
     def __str__(self):
         return '%s --> %s' % (self.bindings, self.parent)
 
 
 class MergedExecutionContext(ExecutionContext):
+    __slots__ = ('contexts',)
+
     def __init__(self, *contexts):
         super(MergedExecutionContext, self).__init__(None)
         self.contexts = contexts
@@ -68,3 +165,185 @@ class MergedExecutionContext(ExecutionContext):
             return self[key]
         except NameError:
             return default
+
+
+class Frame(ExecutionContext):
+    """ variables of a function call, let or match, stored in a list.
+
+        the layout maps their names to their position in the list and is
+        shared by the frames of the same code, see make_layout. names bound
+        later, e.g. by def, go in bindings, which is None until then.
+
+        the variables of a call are searched first, then the context of the
+        caller, then defctx, the context where the function was defined
+    """
+    __slots__ = ('layout', 'values', 'defctx', 'function')
+
+    def __init__(self, parent_ctx, layout, values, defctx=None, function=None):
+        self.parent = parent_ctx
+        self.bindings = None
+        self.layout = layout
+        self.values = values
+        self.defctx = defctx
+        self.function = function
+
+    def local(self, item):
+        slot = self.layout.get(item)
+        if slot is not None:
+            value = self.values[slot]
+            if value is not UNBOUND:
+                return value
+        if self.bindings is None:
+            return UNBOUND
+        return self.bindings.get(item, UNBOUND)
+
+    def __setitem__(self, key, value):
+        slot = self.layout.get(key)
+        if slot is not None:
+            self.values[slot] = value
+            return
+
+        if key not in SHADOWED or key in INLINED:
+            shadow((key,))
+        if self.bindings is None:
+            self.bindings = {key: value}
+        else:
+            self.bindings[key] = value
+
+    def items(self):
+        """ the variables bound in this frame, and their values
+        """
+        items = [(name, self.values[slot]) for name, slot in self.layout.items()
+                 if self.values[slot] is not UNBOUND]
+        return items + list((self.bindings or {}).items())
+
+    def __str__(self):
+        return '%s --> %s' % (dict(self.items()), self.parent)
+
+
+_layouts = {}
+
+
+def make_layout(names):
+    """ the layout of frames holding the variables with the given names.
+        frames of the same variables share the same layout object
+    """
+    names = tuple(names)
+    layout = _layouts.get(names)
+    if layout is None:
+        layout = {}
+        for name in names:
+            layout.setdefault(name, len(layout))
+        shadow(layout)
+        layout = _layouts.setdefault(names, layout)
+    return layout
+
+
+class LocalRef:
+    """ a variable bound by the function it appears in, in a frame of the
+        given layout, depth frames up from the one where it is used.
+        see lispy.resolver
+    """
+    __slots__ = ('token', 'name', 'members', 'depth', 'layout', 'slot')
+
+    def __init__(self, token, depth, layout):
+        self.token = token
+        self.name, *self.members = token.value.split('.')
+        self.depth = depth
+        self.layout = layout
+        self.slot = layout[self.name]
+
+    def get(self, ctx):
+        frame = ctx
+        for _ in range(self.depth):
+            # frames added by code that was not resolved, or variables bound
+            # later, can shadow the variable: look it up by name
+            if type(frame) is not Frame or (frame.bindings is not None
+                                            and self.name in frame.bindings):
+                break
+            frame = frame.parent
+        else:
+            if type(frame) is Frame and frame.layout is self.layout:
+                value = frame.values[self.slot]
+                if value is not UNBOUND:
+                    for each in self.members:
+                        value = getattr(value, each)
+                    return value
+
+        value = ctx[self.name]
+        for each in self.members:
+            value = getattr(value, each)
+        return value
+
+    def __str__(self):
+        return str(self.token)
+
+    def __repr__(self):
+        return repr(self.token)
+
+
+class GlobalRef:
+    """ a name used in code, with an inline cache of its value.
+
+        scoping is dynamic, so in general the value depends on the callers,
+        but a name that no context binds can only be found in GLOBALS or in
+        builtins, or not at all: its value is cached until a context binds it.
+        names that are not identifiers, i.e. operators, default to themselves
+    """
+    __slots__ = ('token', 'name', 'members', 'version', 'value')
+
+    def __init__(self, token):
+        self.token = token
+        if token.type == Token.TOKEN_IDENTIFIER:
+            self.name, *self.members = token.value.split('.')
+        else:
+            self.name, self.members = token.value, []
+        self.version = None
+        self.value = None
+
+    def get(self, ctx, defctx=None):
+        """ the value of the name in ctx, or else in defctx
+        """
+        if self.version == _version:
+            value = self.value
+        else:
+            value = self.lookup(ctx, defctx)
+
+        for each in self.members:
+            value = getattr(value, each)
+        return value
+
+    def lookup(self, ctx, defctx):
+        version = _version
+        try:
+            try:
+                value = ctx[self.name]
+            except (NameError, KeyError):
+                if defctx is None:
+                    raise NameError(self.name)
+                value = defctx[self.name]
+        except NameError:
+            if self.token.type == Token.TOKEN_IDENTIFIER:
+                raise
+            value = self.name
+
+        if self.name not in SHADOWED:
+            self.version, self.value = version, value
+        return value
+
+    def __str__(self):
+        return str(self.token)
+
+    def __repr__(self):
+        return repr(self.token)
+
+
+class ResolvedBindings(list):
+    """ the bindings of a let or a case of a match, whose variables are
+        stored in frames with the given layout
+    """
+    __slots__ = ('layout',)
+
+    def __init__(self, items, layout):
+        super(ResolvedBindings, self).__init__(items)
+        self.layout = layout
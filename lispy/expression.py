@@ -2,57 +2,71 @@ from lispy.tokenizer import Token, Tokenizer
 
 
 class ExpressionTree:
+    """ a top-level expression. its children are plain, nested python lists
+        and can be evaluated as they are
+    """
+    __slots__ = ('children',)
+
     def __init__(self, children=None):
         self.children = children or []
 
     @staticmethod
     def from_tokens(token_stream):
-        class CheckBalancedParentheses:
-            def __init__(self):
-                self.open_pars = self.closed_pars = 0
-
-            def parse(self, tokens):
-                expressions = []
-                for token in tokens:
-                    if token.type == Token.TOKEN_EXPR_BEGIN:
-                        self.open_pars += 1
-                        children = self.parse(tokens)
-                        expressions.append(ExpressionTree(children))
-                    elif token.type == Token.TOKEN_EXPR_END:
-                        self.closed_pars += 1
-                        break
-                    else:
-                        expressions.append(token)
-
-                return expressions
-
-        check = CheckBalancedParentheses()
-        exprs = check.parse(iter(token_stream))
-        if check.open_pars != check.closed_pars:
+        return list(ExpressionTree.iter_from_tokens(token_stream))
+
+    @staticmethod
+    def iter_from_tokens(token_stream):
+        """ parses the tokens one top-level expression at a time, yielding each
+            of them as soon as it is complete. literals are replaced by their value.
+
+            uses an explicit stack of the expressions being parsed, so that the
+            nesting depth is not bound by python's recursion limit
+        """
+        open_pars = closed_pars = 0
+        stack = []
+        for token in token_stream:
+            if token.type == Token.TOKEN_EXPR_BEGIN:
+                open_pars += 1
+                stack.append([])
+                continue
+            elif token.type == Token.TOKEN_EXPR_END:
+                closed_pars += 1
+                if not stack:
+                    break
+                expr = stack.pop()
+                if not stack:
+                    expr = ExpressionTree(expr)
+            elif token.type == Token.TOKEN_LITERAL:
+                expr = token.value
+            else:
+                expr = token
+
+            if stack:
+                stack[-1].append(expr)
+            else:
+                yield expr
+
+        if stack or open_pars != closed_pars:
             raise SyntaxError('unbalanced parentheses (open: %s closed: %s)'
-                              '' % (check.open_pars, check.closed_pars))
-        else:
-            return exprs
+                              '' % (open_pars, closed_pars))
 
     def print_indent(self, indent=0):
+        return ExpressionTree.print_indent_format(self.children, indent)
+
+    @staticmethod
+    def print_indent_format(children, indent=0):
         ind = '  '
-        text = ['%s%s(' % (ind * indent, self.__class__.__name__)]
-        for child in self.children:
-            if isinstance(child, ExpressionTree):
-                text.append(child.print_indent(indent + 1))
+        text = ['%s%s(' % (ind * indent, ExpressionTree.__name__)]
+        for child in children:
+            if isinstance(child, list):
+                text.append(ExpressionTree.print_indent_format(child, indent + 1))
             else:
                 text.append(ind * (indent + 1) + child.__str__())
         text.append(ind * indent + ')')
         return '\n'.join(text)
 
     def as_list(self):
-        res = []
-        for child in self.children:
-            if isinstance(child, ExpressionTree):
-                res.append(child.as_list())
-            else:
-                res.append(child)
-        return res
+        return self.children
 
     def print_short(self):
         return ExpressionTree.print_short_format(self.children)
@@ -75,10 +89,25 @@ class ExpressionTree:
 
     @staticmethod
     def to_string(children):
-        parts = []
-        for child in children:
-            if isinstance(child, list):
-                parts.append(ExpressionTree.to_string(child))
+        # iterative, so that deeply nested lists can be printed
+        parts = ['(']
+        stack = [iter(children)]
+        first = True
+        while stack:
+            for child in stack[-1]:
+                if not first:
+                    parts.append(' ')
+                first = False
+
+                if isinstance(child, list):
+                    parts.append('(')
+                    stack.append(iter(child))
+                    first = True
+                    break
+                else:
+                    parts.append(str(child))
             else:
-                parts.append(str(child))
-        return '(' + ' '.join(parts) + ')'
+                stack.pop()
+                parts.append(')')
+                first = False
+        return ''.join(parts)
@@ -1,5 +1,8 @@
+import itertools
 from functools import reduce
 from lispy.expression import ExpressionTree
+from lispy.lazy import LazySeq, Transducer
+from lispy.persistent import HashMap, Vector
 
 GLOBALS = {}
 
@@ -161,4 +164,184 @@ def is_list(*args):
 @glob('dict_set')
 def dict_set(d, k, v):
     d[k] = v
-    return d
\ No newline at end of file
+    return d
+
+# native versions of the sequence functions of the standard library, see
+# lispy.stdlib.REFERENCE
+
+
+@glob('rest')
+def rest(lst):
+    return list(lst[1:])
+
+
+@glob('skip')
+def skip(count, lst):
+    return list(lst[max(count, 0):])
+
+
+@glob('cons')
+def cons(x, lst):
+    return [x] + lst
+
+
+@glob('zip')
+def zip_(*lists):
+    length = min(len(lst) for lst in lists)
+    return [[lst[i] for lst in lists] for i in range(length)]
+
+
+@glob('flatten')
+def flatten(lst):
+    result, stack = [], [iter(lst)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            result.append(item)
+        else:
+            stack.pop()
+    return result
+
+
+@glob('concat')
+def concat(*lists):
+    result = []
+    for lst in lists:
+        result.extend(lst)
+    return result
+
+
+# persistent data structures, see lispy.persistent. the other collections
+# are copied instead of changed
+
+
+@glob('vector')
+def make_vector(*args):
+    return Vector(args)
+
+
+@glob('hash_map')
+def make_hash_map(*args):
+    return HashMap(zip(args[::2], args[1::2]))
+
+
+@glob('conj')
+def conj(coll, *items):
+    if isinstance(coll, Vector):
+        for item in items:
+            coll = coll.conj(item)
+        return coll
+    return list(coll) + list(items)
+
+
+@glob('assoc')
+def assoc(coll, *args):
+    if not isinstance(coll, (Vector, HashMap)):
+        coll = coll.copy()
+        for key, value in zip(args[::2], args[1::2]):
+            coll[key] = value
+        return coll
+
+    for key, value in zip(args[::2], args[1::2]):
+        coll = coll.assoc(key, value)
+    return coll
+
+
+@glob('dissoc')
+def dissoc(mapping, *keys):
+    if not isinstance(mapping, HashMap):
+        mapping = mapping.copy()
+        for key in keys:
+            mapping.pop(key, None)
+        return mapping
+
+    for key in keys:
+        mapping = mapping.dissoc(key)
+    return mapping
+
+
+# lazy sequences, see lispy.lazy
+
+
+@glob('seq')
+def seq(coll):
+    if isinstance(coll, LazySeq):
+        return coll
+    return LazySeq(lambda: coll)
+
+
+@glob('lazy_range')
+def lazy_range(*args):
+    return LazySeq(lambda: range(*args))
+
+
+@glob('take')
+def take(count, coll):
+    return LazySeq(lambda: itertools.islice(coll, count))
+
+
+@glob('drop')
+def drop(count, coll):
+    return LazySeq(lambda: itertools.islice(coll, count, None))
+
+
+@glob('lines')
+def lines(path, encoding=None):
+    def read():
+        # the file is open only while the sequence is iterated
+        with open(path, encoding=encoding) as f:
+            for line in f:
+                yield line.rstrip('\r\n')
+    return LazySeq(read)
+
+
+# memoization, see lispy.memo
+
+
+@glob('memoize')
+def memoize(function, max_size=128, ttl=None):
+    from lispy.memo import MemoizedFunction  # which imports this module
+    return MemoizedFunction(function, max_size, ttl)
+
+
+@glob('cache_info')
+def cache_info(function):
+    return function.cache_info()
+
+
+@glob('cache_clear')
+def cache_clear(function):
+    function.cache_clear()
+
+
+# futures, see handle_future
+
+
+@glob('deref')
+def deref(future, timeout=None):
+    return future.result(timeout)
+
+
+# transducers, see handle_transduce
+
+
+@glob('mapping')
+def mapping(function):
+    return Transducer([('map', function)])
+
+
+@glob('filtering')
+def filtering(function):
+    return Transducer([('filter', function)])
+
+
+@glob('taking')
+def taking(count):
+    return Transducer([('take', count)])
+
+
+@glob('dropping')
+def dropping(count):
+    return Transducer([('drop', count)])
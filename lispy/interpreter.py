@@ -1,19 +1,99 @@
+import concurrent.futures
+import functools
 import inspect
 import re
 
 import importlib
+import itertools
 import types
-from lispy.context import ExecutionContext, MergedExecutionContext
+from lispy.context import (
+    FUSED, INLINED, SHADOWED, ExecutionContext, Frame, GlobalRef, LocalRef, MergedExecutionContext,
+    UNBOUND, make_layout,
+)
 from lispy.expression import ExpressionTree
+from lispy.globals import GLOBALS
+from lispy.lazy import LazySeq, Transducer
+from lispy.persistent import Vector
 from lispy.tokenizer import Token
-from lispy.utils import load_stdlib
+from lispy.utils import frozen_stdlib
+
+
+VARARGS = Token('&')
+UNQUOTE = Token('~')
+
+# what needs to be evaluated, the rest are unboxed literals
+CODE_TYPES = (Token, list, LocalRef, GlobalRef)
+
+# the values that patterns and parameters can unpack
+SEQUENCE_TYPES = (list, tuple, Vector)
+
+
+def flatten(names):
+    """ the names in a list of possibly nested lists of names
+    """
+    for name in names:
+        if isinstance(name, (list, tuple)):
+            yield from flatten(name)
+        else:
+            yield name
+
+
+# the stages that ->> fuses into a transduce, and the transducers they become
+FUSED_STAGES = {'map': 'mapping', 'filter': 'filtering', 'take': 'taking', 'drop': 'dropping'}
+
+
+def thread_last(expr, ctx=None, bound=(), fuse=True):
+    """ the code of (->> value form...), where value is the last argument of
+        the first form, which is the last argument of the next form and so
+        on. forms can also be names of functions.
+
+        the stages (map f), (filter f), (take n) and (drop n) followed by
+        (reduce f init &) become a transduce, which evaluates them in a
+        single pass. this is only done if fuse is true and the globals they
+        use are not bound by any context, by bound, or differently in ctx
+    """
+    value, stages = expr[1], []
+    for form in expr[2:] + [None]:
+        if not isinstance(form, list) and form is not None:
+            form = [form]
+
+        name = IterativeInterpreter.form_name(form[0]) if form else None
+        if fuse and name in FUSED_STAGES and len(form) == 2:
+            stages.append((name, form))
+            continue
+        elif (stages and name == 'reduce' and len(form) == 4 and form[3] is VARARGS
+                and fusible([kind for kind, _ in stages], ctx, bound)):
+            xforms = [[Token(FUSED_STAGES[kind]), stage[1]] for kind, stage in stages]
+            value = [Token('transduce'), [Token('list')] + xforms, form[1], form[2], value]
+            stages = []
+            continue
+
+        for _, stage in stages:
+            value = stage + [value]
+        stages = []
+        if form is not None:
+            value = form + [value]
+    return value
+
+
+def fusible(kinds, ctx, bound):
+    """ whether the names of the stages, and of the transducers they become,
+        refer to the globals. map and filter are special forms, which
+        cannot be bound
+    """
+    names = ['list'] + [FUSED_STAGES[kind] for kind in kinds] + [kind for kind in kinds if kind in GLOBALS]
+    for name in names:
+        if name in SHADOWED or name in bound or (ctx is not None and ctx.get(name) is not GLOBALS[name]):
+            return False
+    FUSED.update(names)
+    return True
 
 
 def unpack_bind(variable, value, bindings=None):
     """ binds value to variable, optionally unpacking
         (a, b) = (0, 2) results in a = 1 and b = 2
     """
-    binds = bindings or {}
+    binds = {} if bindings is None else bindings
     if len(variable) != len(value):
         raise RuntimeError('cannot unpack "%s" to "%s": they have different length' % (
             value, variable
@@ -21,7 +101,7 @@ def unpack_bind(variable, value, bindings=None):
 
     for f, a in zip(variable, value):
         expand_f = isinstance(f, (list, tuple))
-        expand_a = isinstance(a, (list, tuple))
+        expand_a = isinstance(a, SEQUENCE_TYPES)
 
         if expand_f and expand_a:
             unpack_bind(f, a, binds)
@@ -35,6 +115,29 @@ def unpack_bind(variable, value, bindings=None):
     return binds
 
 
+class Recur:
+    """ the value of (recur value...), which makes the innermost loop whose
+        body has it as value evaluate the body again, with its variables
+        bound to the values. recur must be in tail position in the body
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def __repr__(self):
+        return 'Recur(%r)' % (self.values,)
+
+
+def ensure_not_recur(val):
+    """ val, the result of an evaluation, unless it is the value of a recur
+        that no loop used, e.g. in code produced by a macro, see check_recur
+    """
+    if type(val) is Recur:
+        raise SyntaxError('recur outside of loop tail position')
+    return val
+
+
 class Function:
     def __init__(self, name, parameters, body, ctx):
         self.name = name
@@ -50,13 +153,42 @@ class Function:
         except ValueError:
             self.has_varargs = False
 
+        # the parameters are stored in frames, in this order
+        names = list(flatten(p for p in self.parameters if p != '&'))
+        self.layout = make_layout(names)
+        self.positional = len(names) == len(self.layout) and all(
+            not isinstance(p, (tuple, list)) for p in self.parameters
+        )
+        self.arity = len(self.parameters) - 2 if self.has_varargs else len(self.parameters)
+        self._code = None
+        self._version = None
+
+    @property
+    def code(self):
+        """ the body, with the variables bound by the function resolved to
+            their position in its frames. it is resolved again when a function
+            that might have been inlined in it is no longer inlined
+        """
+        if self._code is None or self._version != INLINED.version:
+            from lispy.resolver import resolve
+            self._code = resolve(self.body, self.layout, self.ctx)
+            self._version = INLINED.version
+        return self._code
+
     def bind_parameters(self, args):
-        bindings = {}
+        """ the values of the parameters, in the order of the layout
+        """
+        n = self.arity
+        if len(args) < n:
+            raise IndexError('not enough arguments for "%s"' % self.name)
 
-        n = len(self.parameters)
-        if self.has_varargs:
-            n -= 2
+        if self.positional:
+            values = list(args[:n])
+            if self.has_varargs:
+                values.append(list(args[n:]))
+            return values
 
+        bindings = {}
         for i in range(n):
             if isinstance(self.parameters[i], (tuple, list)):
                 try:
@@ -65,16 +197,29 @@ class Function:
                     raise RuntimeError('cannot unpack parameters') from exc
             else:
                 bindings[self.parameters[i]] = args[i]
-        
+
         if self.has_varargs:
             bindings[self.parameters[-1]] = list(args[n:])
 
-        return bindings
+        return [bindings[name] for name in self.layout]
+
+    def frame(self, ctx, args):
+        """ the frame the body is evaluated in when called from ctx.
+
+            when the function is called from the frame of a function with the
+            same layout and definition context, e.g. itself or a mutually
+            recursive function with the same parameters, all the variables of
+            that frame are shadowed and it is skipped, so that the chain of
+            contexts of a loop written as recursion does not grow
+        """
+        if (type(ctx) is Frame and ctx.layout is self.layout and ctx.bindings is None
+                and ctx.defctx is self.ctx):
+            ctx = ctx.parent
+        return Frame(ctx, self.layout, self.bind_parameters(args), self.ctx, self)
 
     def __call__(self, ctx, *args):
-        bindings = self.bind_parameters(args)
-        new_ctx = MergedExecutionContext(ExecutionContext(ctx, **bindings), self.ctx)
-        yield CodeResult(self.body, new_ctx)
+        frame = self.frame(ctx, args)
+        yield TailCodeResult(self.code, frame)
 
     def __eq__(self, other):
         if not isinstance(other, Function):
@@ -92,7 +237,7 @@ class Function:
 
 class AnonymousFunction:
     def __init__(self, ctx, children):
-        self.body = list(children)
+        self.body = children if isinstance(children, list) else list(children)
         self.ctx = ctx
 
     def __call__(self, ctx, *args):
@@ -101,7 +246,7 @@ class AnonymousFunction:
             bindings['%' + str(i)] = x
 
         new_ctx = MergedExecutionContext(ExecutionContext(bindings), ctx, self.ctx)
-        yield CodeResult(self.body, new_ctx)
+        yield TailCodeResult(self.body, new_ctx)
 
     def __eq__(self, other):
         return False
@@ -114,15 +259,35 @@ class AnonymousFunction:
 
 
 class Macro(Function):
+    """ expansions are cached by the identity of the arguments, i.e. of the
+        code at the call site, so that each use of a macro is expanded only
+        once, and again only when the macro is defined again. the expansion
+        is assumed to depend on its arguments only
+    """
+
+    # the cache is cleared when it grows too large, e.g. because of the code
+    # produced by other macros
+    CACHE_SIZE = 2 ** 12
+
     def __init__(self, name, parameters, body, ctx):
         super(Macro, self).__init__(name, parameters, body, ctx)
+        self.expansions = {}
 
-    def __call__(self, ctx, *args):
-        bindings = self.bind_parameters(args)
+    def expand(self, ctx, args):
+        """ the code evaluating to the expansion of the macro
+        """
+        frame = Frame(None, self.layout, self.bind_parameters(args))
+        return CodeResult(self.body, MergedExecutionContext(frame, ctx, self.ctx))
 
-        new_ctx = MergedExecutionContext(ExecutionContext(bindings), ctx, self.ctx)
-        code = yield CodeResult(self.body, new_ctx)
-        yield CodeResult(code, ctx)
+    def __call__(self, ctx, *args):
+        key = tuple(map(id, args))
+        entry = self.expansions.get(key)
+        if entry is None:
+            code = yield self.expand(ctx, args)
+            if len(self.expansions) >= self.CACHE_SIZE:
+                self.expansions.clear()
+            entry = self.expansions[key] = (args, code)  # keeps args alive, so that their ids are not reused
+        yield TailCodeResult(entry[1], ctx)
 
     def __eq__(self, other):
         if not isinstance(other, Macro):
@@ -162,26 +327,118 @@ class CodeResult(EvaluationResult):
         super(CodeResult, self).__init__(expr, ctx, must_evaluate=True)
 
 
+class TailCodeResult(CodeResult):
+    """ Code whose value is the value of the generator that yields it,
+        i.e. the last thing the generator does. The interpreter evaluates it
+        in place of the generator instead of on top of it
+    """
+
+
+class AwaitResult(EvaluationResult):
+    """ Result of the evaluation of an expression that is the value of an
+        awaitable. evaluate_async awaits it, letting the event loop run other
+        tasks meanwhile. Elsewhere the awaitable is run to completion when
+        its value is needed, see wait
+    """
+    def __init__(self, awaitable, ctx):
+        self.awaitable = awaitable
+        self.ctx = ctx
+        self.must_evaluate = False
+
+    @functools.cached_property
+    def expr(self):
+        return wait(self.awaitable)
+
+
+def as_awaitable(value):
+    """ value, or an asyncio future of it if it is a future of the thread pool
+    """
+    if isinstance(value, concurrent.futures.Future):
+        import asyncio
+        return asyncio.wrap_future(value)
+    return value
+
+
+def wait(awaitable):
+    """ the value of an awaitable, or of a future of the thread pool, run on
+        a new event loop. it cannot be used while an event loop is running
+    """
+    if isinstance(awaitable, concurrent.futures.Future):
+        return awaitable.result()
+
+    import asyncio
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        if inspect.iscoroutine(awaitable):
+            awaitable.close()  # never awaited
+        raise RuntimeError('cannot await "%s" while an event loop is running, see evaluate_async' % awaitable)
+
+    async def value():
+        return await awaitable
+    return asyncio.run(value())
+
+
 class IterativeInterpreter:
-    def __init__(self, ctx=None, with_stdlib=False):
+    """ evaluates expressions with coroutines, see evaluate. the engine
+        argument selects another implementation:
+
+         - coroutine: this class
+         - closure: compiles expressions to python closures, see ClosureInterpreter
+         - python: translates expressions to python code, see PythonInterpreter
+         - cek: runs compiled expressions on an abstract machine, see CEKInterpreter
+    """
+
+    # used when no engine is given
+    DEFAULT_ENGINE = 'coroutine'
+
+    # the number of steps evaluate_async takes before it lets the event loop
+    # run other tasks
+    ASYNC_STEPS = 1000
+
+    def __new__(cls, ctx=None, with_stdlib=False, engine=None, optimize=False):
+        if cls is IterativeInterpreter:
+            engine = engine or cls.DEFAULT_ENGINE
+            if engine == 'closure':
+                from lispy.compiler import ClosureInterpreter
+                cls = ClosureInterpreter
+            elif engine == 'python':
+                from lispy.to_python import PythonInterpreter
+                cls = PythonInterpreter
+            elif engine == 'cek':
+                from lispy.cek import CEKInterpreter
+                cls = CEKInterpreter
+            elif engine != 'coroutine':
+                raise ValueError('unknown engine: %s' % engine)
+        return super(IterativeInterpreter, cls).__new__(cls)
+
+    def __init__(self, ctx=None, with_stdlib=False, engine=None, optimize=False):
         self.last_frame = None
         self.operation_stack = []
         self.result_stack = []
+        self.optimize = optimize
 
-        self.ctx = ExecutionContext(ctx)
         if with_stdlib:
-            load_stdlib(self)
+            ctx = frozen_stdlib().with_parent(ctx)
+        self.ctx = ExecutionContext(ctx)
 
     def print_stacktrace(self):
         print('Call Stack (most recent last):')
         for op in self.operation_stack[:-1]:
             if op.gi_code.co_name == '__call__':
                 func = op.gi_frame.f_locals['self']
+                frame = op.gi_frame.f_locals.get('frame') or op.gi_frame.f_locals.get('bindings')
+                if frame is None:  # e.g. memoized and compiled functions, which only have their arguments
+                    args = op.gi_frame.f_locals.get('args', ())
+                    names = getattr(func, 'parameters', None) or ['%%%d' % i for i in range(len(args))]
+                    frame = dict(zip(map(str, names), args))
 
                 print('  (%s %s)' % (getattr(func, 'name', '<anonymous>'), ' '.join([
                     '%s=%s' % (
                         formal, str(actual) if len(str(actual)) < 25 else str(actual)[:25] + ' ... '
-                    ) for formal, actual in op.gi_frame.f_locals['bindings'].items()
+                    ) for formal, actual in frame.items()
                 ])))
             elif op.gi_frame:
                 print(' ', ExpressionTree.print_short_format(op.gi_frame.f_locals.get('expr', '<unknown>')))
@@ -198,20 +455,170 @@ class IterativeInterpreter:
         Entry point for the evaluation of an expression.
         """
         ctx = ctx or self.ctx
+        expr = self.prepare(expr, ctx)
 
-        val = self.eval(expr.as_list(), ctx)
+        val = self.eval(expr, ctx)
         if not inspect.isgenerator(val):
-            return val
+            return ensure_not_recur(val)
+        return ensure_not_recur(self.run(val))
+
+    async def evaluate_async(self, expr, ctx=None):
+        """ like evaluate, but a coroutine, which lets the event loop run other
+            tasks every ASYNC_STEPS steps, and while it waits for (await ...).
+            the engines without their own run_async are evaluated by the
+            trampoline of this class
+        """
+        ctx = ctx or self.ctx
+        expr = self.prepare(expr, ctx)
+
+        val = self.eval(expr, ctx)
+        if not inspect.isgenerator(val):
+            return ensure_not_recur(val)
+        return ensure_not_recur(await self.run_async(val))
 
-        self.operation_stack = [val]
-        self.result_stack = [None]
+    async def run_async(self, gen):
+        """ like run, but a coroutine. other evaluations can run while this
+            one is suspended, so the stacks of the interpreter are set to the
+            ones of this evaluation only while it is running
+        """
+        import asyncio
+
+        operation_stack, result_stack = [gen], [None]
+        outer = self.operation_stack, self.result_stack
+        self.operation_stack, self.result_stack = operation_stack, result_stack
+        val, steps = None, 0
+
+        while operation_stack:
+            steps += 1
+            if steps % self.ASYNC_STEPS == 0:
+                self.operation_stack, self.result_stack = outer
+                await asyncio.sleep(0)
+                outer = self.operation_stack, self.result_stack
+                self.operation_stack, self.result_stack = operation_stack, result_stack
+
+            op = operation_stack[-1]
+            if op is None:
+                operation_stack.pop()
+                continue
+
+            self.last_frame = op.gi_frame
+            val = result_stack[-1]
+            try:
+                res = op.send(val)
+            except StopIteration:
+                operation_stack.pop()
+            else:
+                result_stack.pop()
+                if isinstance(res, TailCodeResult):
+                    operation_stack.pop()
+
+                if type(res) is AwaitResult:
+                    self.operation_stack, self.result_stack = outer
+                    val = await as_awaitable(res.awaitable)
+                    outer = self.operation_stack, self.result_stack
+                    self.operation_stack, self.result_stack = operation_stack, result_stack
+                elif not isinstance(res, EvaluationResult):
+                    val = self.eval(res, self.ctx)
+                elif res.must_evaluate:
+                    val = self.eval(res.expr, res.ctx)
+                else:
+                    val = res.expr
+
+                if isinstance(val, types.GeneratorType):
+                    operation_stack.append(val)
+                    result_stack.append(None)
+                else:
+                    result_stack.append(val)
+
+        self.operation_stack, self.result_stack = outer
+        self.last_frame = None
+        return val
+
+    def prepare(self, expr, ctx):
+        """ the parse tree of an expression about to be evaluated, optimized
+            if the interpreter was created with optimize=True, see
+            lispy.optimizer
+        """
+        if isinstance(expr, ExpressionTree):
+            expr = expr.children
+        self.check_recur(expr, ctx)
+        if self.optimize:
+            from lispy.optimizer import optimize
+            expr = optimize(expr, ctx)
+        return expr
+
+    # special forms whose children are not evaluated, or not as code in the
+    # context of the form
+    UNCHECKED_FORMS = frozenset(('quote', 'tick', 'comment', 'dollar', 'macroexpand'))
+
+    def check_recur(self, expr, ctx):
+        """ raises a SyntaxError if a recur in expr is not the value of the
+            body of a loop, i.e. is not in tail position in it. the arguments
+            of macros are not checked, the recur they expand to are checked
+            when they reach the result of evaluate
+        """
+        stack = [(expr, False)]
+        while stack:
+            expr, tail = stack.pop()
+            if not isinstance(expr, list) or not expr:
+                continue
+
+            head, children = expr[0], expr[1:]
+            name = self.form_name(head)
+            if name is None or not hasattr(self, 'handle_' + name):
+                if isinstance(head, Token) and isinstance(ctx.get(head.value), Macro):
+                    continue
+                stack.extend((child, False) for child in expr)
+            elif name in self.UNCHECKED_FORMS:
+                continue
+            elif name == 'recur':
+                if not tail:
+                    raise SyntaxError('recur outside of loop tail position')
+                stack.extend((child, False) for child in children)
+            elif name == 'if' and len(children) == 3:
+                stack.extend(((children[0], False), (children[1], tail), (children[2], tail)))
+            elif name == 'do' and children and VARARGS not in children:
+                stack.extend((child, False) for child in children[:-1])
+                stack.append((children[-1], tail))
+            elif name in ('let', 'loop') and len(children) == 2 and isinstance(children[0], list):
+                stack.extend((value, False) for value in children[0][1::2])
+                stack.append((children[1], tail or name == 'loop'))
+            elif name == 'match' and children:
+                stack.append((children[0], False))
+                stack.extend((case[1], tail) for case in children[1:]
+                             if isinstance(case, list) and len(case) == 2)
+            elif name in ('defn', 'defmacro') and len(children) == 3:
+                stack.append((children[2], False))
+            else:
+                stack.extend((child, False) for child in children)
+
+    def call(self, fun, args, ctx=None):
+        """ calls a lispy or python function from python
+        """
+        return self.run(self.call_function(fun, ctx or self.ctx, list(args)))
+
+    def as_python(self, fun, ctx):
+        """ a python function calling fun from ctx, e.g. for lazy sequences
+        """
+        if isinstance(fun, (Function, AnonymousFunction, Macro)):
+            return lambda *args: self.call(fun, args, ctx)
+        return fun
+
+    def run(self, gen):
+        """ runs the generator of an expression until it is completely evaluated.
+            it can be called again while running, e.g. by python functions
+            calling lispy functions
+        """
+        outer = self.operation_stack, self.result_stack
+        operation_stack = self.operation_stack = [gen]
+        result_stack = self.result_stack = [None]
         val = None
 
-        while self.operation_stack:
-            op = self.operation_stack[-1]
+        while operation_stack:
+            op = operation_stack[-1]
 
             if op is None:
-                self.operation_stack.pop()
+                operation_stack.pop()
                 continue
 
             # used for exception reporting
@@ -219,13 +626,16 @@ class IterativeInterpreter:
             # which is a pity, because it contains the exact spot that caused the exception
             self.last_frame = op.gi_frame
 
-            val = self.result_stack[-1]
+            val = result_stack[-1]
             try:
                 res = op.send(val)
             except StopIteration:
-                self.operation_stack.pop()
+                operation_stack.pop()
             else:
-                self.result_stack.pop()
+                result_stack.pop()
+                if isinstance(res, TailCodeResult):
+                    operation_stack.pop()  # replaced by the evaluation of res
+
                 if not isinstance(res, EvaluationResult):
                     val = self.eval(res, self.ctx)
                 elif res.must_evaluate:
@@ -234,35 +644,54 @@ class IterativeInterpreter:
                     val = res.expr
 
                 if isinstance(val, types.GeneratorType):
-                    self.operation_stack.append(val)
-                    self.result_stack.append(None)  # to initialize the generator
+                    operation_stack.append(val)
+                    result_stack.append(None)  # to initialize the generator
                 else:
-                    self.result_stack.append(val)
+                    result_stack.append(val)
 
+        # the stacks are kept after an exception, for print_stacktrace
+        self.operation_stack, self.result_stack = outer
         self.last_frame = None
         return val
 
+    @staticmethod
+    def form_name(head):
+        """ name of the special form an expression starting with head could
+            be, i.e. the suffix of its handle_* method
+        """
+        # string literals are unboxed, but the head of an expression used
+        # to be looked up among the special forms even when it was a literal
+        if isinstance(head, Token):
+            name = head.value
+        elif isinstance(head, str):
+            name = head
+        else:
+            return None
+
+        return (name
+                .replace('->>', 'thread_last')
+                .replace('.', 'dot')
+                .replace('#', 'hash')
+                .replace("'", 'tick')
+                .replace('$', 'dollar'))
+
     def eval(self, expr, ctx):
         if isinstance(expr, list):
-            if not isinstance(expr[0], Token):
-                return self.evaluate_function_call(expr, ctx)
+            name = self.form_name(expr[0])
+            if name is None:
+                return self.call_expression(expr, ctx)
 
-            name = (expr[0].value
-                    .replace('.', 'dot')
-                    .replace('#', 'hash')
-                    .replace("'", 'tick')
-                    .replace('$', 'dollar'))
             args = expr[1:]
 
             try:
                 handler = getattr(self, 'handle_' + name)
             except AttributeError:
-                return self.evaluate_function_call(expr, ctx)
+                return self.call_expression(expr, ctx)
             else:
                 try:
                     return handler(ctx, expr, *args)
                 except TypeError as exc:
-                    expected = inspect.getargspec(handler).args[3:]
+                    expected = inspect.getfullargspec(handler).args[3:]
                     raise SyntaxError('expected syntax: (%s %s)' % (
                         name, ' '.join('<%s>' % arg for arg in expected)
                     )) from exc
@@ -276,12 +705,14 @@ class IterativeInterpreter:
                 return obj
             elif expr.type == Token.TOKEN_LITERAL:
                 return expr.value
-            elif expr.value == '~':
+            elif expr is UNQUOTE:
                 raise RuntimeError('cannot un-quote outside a quote')
             elif expr.value[0] == "'":
                 return Token(expr.value[1:])
             else:
                 return ctx.get(expr.value, expr.value)
+        elif type(expr) is LocalRef or type(expr) is GlobalRef:
+            return expr.get(ctx)
         else:
             return expr
 
@@ -301,19 +732,45 @@ class IterativeInterpreter:
             for x in lst
         ]
 
-    def evaluate_function_call(self, expr, ctx):
-        fun = yield CodeResult(expr[0], ctx)
+    def call_expression(self, expr, ctx):
+        """ the value of a call of a python function whose arguments are
+            all atoms, which needs no generator, or else the generator of the
+            call
+        """
+        for child in expr:
+            if isinstance(child, list) or child is VARARGS:
+                return self.evaluate_function_call(expr, ctx)
+
+        fun = self.eval(expr[0], ctx)
+        if isinstance(fun, (Function, AnonymousFunction)) or not callable(fun):
+            return self.evaluate_function_call(expr, ctx, fun)
+
+        return fun(*[self.eval(child, ctx) for child in expr[1:]])
+
+    def evaluate_function_call(self, expr, ctx, fun=UNBOUND):
+        # the children are evaluated in place, and only the generators of
+        # those that need one go through run
+        if fun is UNBOUND:
+            fun = self.eval(expr[0], ctx)
+            if isinstance(expr[0], list) and isinstance(fun, types.GeneratorType):
+                fun = yield fun
+
         args = []
         if not isinstance(fun, Macro):
             for child in expr[1:]:
-                val = yield CodeResult(child, ctx) if child != '&' else child
+                if child is VARARGS:
+                    val = child
+                else:
+                    val = self.eval(child, ctx)
+                    if isinstance(child, list) and isinstance(val, types.GeneratorType):
+                        val = yield val
                 args.append(val)
         else:
-            args = [e if not isinstance(e, Token) or e.value != '&' else '&' for e in expr[1:]]
+            args = list(expr[1:])
 
-        if len(args) > 1 and '&' in args:
+        if len(args) > 1 and VARARGS in args:
             # unpack actual varargs
-            if args[-2] == '&':
+            if args[-2] is VARARGS:
                 args = args[:-2] + list(args[-1])
             else:
                 raise SyntaxError('cannot have parameters after varargs')
@@ -322,7 +779,7 @@ class IterativeInterpreter:
 
     def call_function(self, fun, ctx, args):
         if isinstance(fun, (Function, AnonymousFunction, Macro)):
-            yield CodeResult(fun(ctx, *args), ctx)
+            yield TailCodeResult(fun(ctx, *args), ctx)
         elif hasattr(fun, '__call__'):
             val = fun(*args)
             yield ValueResult(val, ctx)
@@ -331,35 +788,101 @@ class IterativeInterpreter:
 
     def handle_macroexpand(self, ctx, expr, macro, *args):
         mac = yield CodeResult(macro, ctx)
-        val = next(mac(ctx, *args))
-        yield val
+        yield mac.expand(ctx, args)
 
     def handle_if(self, ctx, expr, cond, iftrue, iffalse):
-        cval = yield CodeResult(cond, ctx)
+        cval = self.eval(cond, ctx)
+        if isinstance(cond, list) and isinstance(cval, types.GeneratorType):
+            cval = yield cval
         if cval:
-            yield CodeResult(iftrue, ctx)
+            yield TailCodeResult(iftrue, ctx)
         else:
-            yield CodeResult(iffalse, ctx)
+            yield TailCodeResult(iffalse, ctx)
 
     def handle_let(self, ctx, expr, bindings, body):
-        new_ctx = ExecutionContext(ctx)
+        new_ctx = self.binding_context(ctx, bindings)
         for i in range(0, len(bindings), 2):
             value = yield CodeResult(bindings[i + 1], new_ctx)
-            if isinstance(bindings[i], (list, tuple)):
-                names = self.ensure_list_of_identifiers(bindings[i])
-                unpack_bind(names, value, new_ctx)
-            else:
-                name = self.ensure_identifier(bindings[i])
-                new_ctx[name] = value
+            self.bind(new_ctx, bindings[i], value)
+
+        yield TailCodeResult(body, new_ctx)
+
+    @staticmethod
+    def binding_context(ctx, bindings):
+        """ the context of the variables bound by a let, a loop...
+        """
+        layout = getattr(bindings, 'layout', None)  # see lispy.resolver
+        if layout is None:
+            return ExecutionContext(ctx)
+        return Frame(ctx, layout, [UNBOUND] * len(layout))
+
+    def bind(self, ctx, target, value):
+        """ binds value to target, a name or a list of names to unpack value to
+        """
+        if isinstance(target, (list, tuple)):
+            names = self.ensure_list_of_identifiers(target)
+            unpack_bind(names, value, ctx)
+        else:
+            ctx[self.ensure_identifier(target)] = value
+
+    def handle_loop(self, ctx, expr, bindings, body):
+        if not isinstance(bindings, list) or len(bindings) % 2:
+            raise SyntaxError('expected syntax: (loop (<name> <value>...) <body>)')
+
+        new_ctx = self.binding_context(ctx, bindings)
+        targets = bindings[::2]
+        for target, init in zip(targets, bindings[1::2]):
+            value = yield CodeResult(init, new_ctx)
+            self.bind(new_ctx, target, value)
+
+        # the variables are bound again in the same context at each recur
+        while True:
+            value = yield CodeResult(body, new_ctx)
+            if type(value) is not Recur:
+                break
+            elif len(value.values) != len(targets):
+                raise SyntaxError('recur expects %d values, got %d' % (len(targets), len(value.values)))
 
-        yield CodeResult(body, new_ctx)
+            for target, each in zip(targets, value.values):
+                self.bind(new_ctx, target, each)
+        yield ValueResult(value, ctx)
+
+    def handle_recur(self, ctx, expr, *children):
+        values = []
+        for child in children:
+            values.append((yield CodeResult(child, ctx)))
+        yield ValueResult(Recur(values), ctx)
+
+    def handle_doseq(self, ctx, expr, binding, *body):
+        if not isinstance(binding, list) or len(binding) != 2:
+            raise SyntaxError('expected syntax: (doseq (<name> <collection>) <body>...)')
+
+        coll = yield CodeResult(binding[1], ctx)
+        new_ctx = self.binding_context(ctx, binding)
+        for item in coll:
+            self.bind(new_ctx, binding[0], item)
+            for child in body:
+                yield CodeResult(child, new_ctx)
+        yield ValueResult(None, ctx)
+
+    def handle_dotimes(self, ctx, expr, binding, *body):
+        if not isinstance(binding, list) or len(binding) != 2:
+            raise SyntaxError('expected syntax: (dotimes (<name> <count>) <body>...)')
+
+        count = yield CodeResult(binding[1], ctx)
+        new_ctx = self.binding_context(ctx, binding)
+        for i in range(count):
+            self.bind(new_ctx, binding[0], i)
+            for child in body:
+                yield CodeResult(child, new_ctx)
+        yield ValueResult(None, ctx)
 
     def build_callable(self, callable_cls, ctx, expr, name, parameters, body):
         formal = []
         has_varargs = False
         for i, p in enumerate(parameters):
             if isinstance(p, Token):
-                if p.value != '&':
+                if p is not VARARGS:
                     formal.append(self.ensure_identifier(p))
                 else:
                     formal.append('&')
@@ -384,10 +907,16 @@ class IterativeInterpreter:
         yield self.build_callable(Macro, ctx, expr, name, parameters, body)
 
     def handle_do(self, ctx, expr, *children):
+        if children and VARARGS not in children:
+            for child in children[:-1]:
+                yield CodeResult(child, ctx)
+            yield TailCodeResult(children[-1], ctx)
+            return
+
         result = None
         it = IterativeInterpreter.vararg_iterator(children)
         for arg in it:
-            if isinstance(arg, (Token, list)):
+            if isinstance(arg, CODE_TYPES):
                 val = yield CodeResult(arg, ctx)
                 arg = it.send(val)
             result = yield ValueResult(arg, ctx)
@@ -410,7 +939,7 @@ class IterativeInterpreter:
 
     def handle_dot(self, ctx, expr, member, obj):
         obj = yield CodeResult(obj, ctx)
-        yield CodeResult(getattr(obj, self.ensure_identifier(member)), ctx)
+        yield TailCodeResult(getattr(obj, self.ensure_identifier(member)), ctx)
 
     def handle_def(self, ctx, expr, *children):
         value = None
@@ -435,11 +964,15 @@ class IterativeInterpreter:
     def vararg_iterator(vargs):
         iterating_on_vargs = False
         for arg in vargs:
-            if isinstance(arg, Token) and arg.value == '&':
+            if arg is VARARGS:
                 iterating_on_vargs = True
                 continue
 
-            val = yield arg
+            if isinstance(arg, CODE_TYPES):
+                val = yield arg
+            else:
+                val = arg  # unboxed literal, no need to evaluate it
+
             if iterating_on_vargs:
                 yield from val
             else:
@@ -448,7 +981,7 @@ class IterativeInterpreter:
     def handle_and(self, ctx, expr, *children):
         it = IterativeInterpreter.vararg_iterator(children)
         for arg in it:
-            if isinstance(arg, (Token, list)):
+            if isinstance(arg, CODE_TYPES):
                 val = yield CodeResult(arg, ctx)
                 arg = it.send(val)
 
@@ -461,7 +994,7 @@ class IterativeInterpreter:
     def handle_or(self, ctx, expr, *children):
         it = IterativeInterpreter.vararg_iterator(children)
         for arg in it:
-            if isinstance(arg, (Token, list)):
+            if isinstance(arg, CODE_TYPES):
                 val = yield CodeResult(arg, ctx)
                 arg = it.send(val)
 
@@ -487,8 +1020,8 @@ class IterativeInterpreter:
                 cur = to_expand[-1][progress[-1]]
                 progress[-1] += 1
 
-                if isinstance(cur, Token):
-                    if cur.value == '~':
+                if not isinstance(cur, list):
+                    if cur is UNQUOTE:
                         if progress[-1] == len(to_expand[-1]):
                             raise RuntimeError('nothing to un-quote')
                         val = yield CodeResult(to_expand[-1][progress[-1]], ctx)
@@ -516,9 +1049,10 @@ class IterativeInterpreter:
 
     def handle_match(self, ctx, expr, var, *cases):
         value = yield CodeResult(var, ctx)
-        for pattern, result in cases:
+        for case in cases:
+            pattern, result = case
             pattern_is_list = isinstance(pattern, (list, tuple))
-            var_is_list = isinstance(value, (list, tuple))
+            var_is_list = isinstance(value, SEQUENCE_TYPES)
 
             if pattern_is_list and var_is_list:
                 names = self.ensure_list_of_identifiers(pattern)
@@ -526,19 +1060,28 @@ class IterativeInterpreter:
                     binds = unpack_bind(names, value)
                 except RuntimeError:
                     continue
-                else:
-                    yield CodeResult(result, ExecutionContext(ctx, **binds))
-                    break
             elif not pattern_is_list:
-                name = self.ensure_identifier(pattern)
-                yield CodeResult(result, ExecutionContext(ctx, name=value))
-                break
+                binds = {self.ensure_identifier(pattern): value}
+            else:
+                continue
+
+            layout = getattr(case, 'layout', None)  # see lispy.resolver
+            if layout is None:
+                new_ctx = ExecutionContext(ctx, **binds)
+            else:
+                new_ctx = Frame(ctx, layout, [binds[name] for name in layout])
+            yield TailCodeResult(result, new_ctx)
+            break
         else:
             raise RuntimeError('pattern matching failed')
 
     def handle_filter(self, ctx, expr, fn, coll):
         f = yield CodeResult(fn, ctx)
         c = yield CodeResult(coll, ctx)
+        if isinstance(c, LazySeq):
+            yield ValueResult(c.filter(self.as_python(f, ctx)), ctx)
+            return
+
         res = []
         for x in c:
             keep = yield self.call_function(f, ctx, [x])
@@ -549,9 +1092,116 @@ class IterativeInterpreter:
     def handle_map(self, ctx, expr, fn, coll):
         f = yield CodeResult(fn, ctx)
         c = yield CodeResult(coll, ctx)
+        if isinstance(c, LazySeq):
+            yield ValueResult(c.map(self.as_python(f, ctx)), ctx)
+            return
+
+        res = []
+        for x in c:
+            fx = yield self.call_function(f, ctx, [x])
+            res.append(fx)
+        yield ValueResult(res, ctx)
+
+    def handle_pmap(self, ctx, expr, fn, coll, chunk_size=None):
+        from lispy import parallel  # which imports this module
+
+        f = yield CodeResult(fn, ctx)
+        c = yield CodeResult(coll, ctx)
+        size = yield CodeResult(chunk_size, ctx)
+        if not parallel.in_worker():
+            yield ValueResult(parallel.pmap(self, f, c, ctx, size), ctx)
+            return
+
+        # the work is already split among the workers
         res = []
         for x in c:
             fx = yield self.call_function(f, ctx, [x])
             res.append(fx)
         yield ValueResult(res, ctx)
 
+    def handle_future(self, ctx, expr, fn, *args):
+        from lispy import parallel  # which imports this module
+
+        f = yield CodeResult(fn, ctx)
+        values = []
+        for arg in args:
+            values.append((yield CodeResult(arg, ctx)))
+        yield ValueResult(parallel.submit(self, f, values, ctx), ctx)
+
+    def handle_pmap_io(self, ctx, expr, fn, coll):
+        from lispy import parallel  # which imports this module
+
+        f = yield CodeResult(fn, ctx)
+        c = yield CodeResult(coll, ctx)
+        yield ValueResult(parallel.pmap_io(self, f, c, ctx), ctx)
+
+    def handle_await(self, ctx, expr, awaitable):
+        aw = yield CodeResult(awaitable, ctx)
+        yield AwaitResult(aw, ctx)
+
+    def handle_reduce(self, ctx, expr, fn, initial, *items):
+        f = yield CodeResult(fn, ctx)
+        acc = yield CodeResult(initial, ctx)
+
+        splat = VARARGS in items
+        if splat and (len(items) < 2 or items[-2] is not VARARGS or VARARGS in items[:-2]):
+            raise SyntaxError('cannot have parameters after varargs')
+
+        values = []
+        for item in items[:-2] if splat else items:
+            values.append((yield CodeResult(item, ctx)))
+        if splat:
+            # iterated, not copied, so that lazy sequences are not kept in memory
+            values = itertools.chain(values, (yield CodeResult(items[-1], ctx)))
+
+        for x in values:
+            acc = yield self.call_function(f, ctx, [acc, x])
+        yield ValueResult(acc, ctx)
+
+    # expansions of ->>, cached by the identity of the code until a global
+    # they fused is bound
+    THREADED_CACHE_SIZE = 2 ** 12
+    _threaded = {}
+
+    def handle_thread_last(self, ctx, expr, value, *forms):
+        entry = self._threaded.get(id(expr))
+        if entry is None or entry[2] != INLINED.version:
+            if len(self._threaded) >= self.THREADED_CACHE_SIZE:
+                self._threaded.clear()
+            # keeps expr alive, so that its id is not reused
+            entry = self._threaded[id(expr)] = (expr, thread_last(expr, ctx), INLINED.version)
+        yield TailCodeResult(entry[1], ctx)
+
+    def handle_transduce(self, ctx, expr, xform, fn, initial, coll):
+        xf = yield CodeResult(xform, ctx)
+        f = yield CodeResult(fn, ctx)
+        acc = yield CodeResult(initial, ctx)
+        c = yield CodeResult(coll, ctx)
+
+        stages = Transducer.compose(xf)
+        if any(kind == 'take' and count <= 0 for kind, count in stages):
+            yield ValueResult(acc, ctx)
+            return
+
+        # how many elements reached each stage
+        counts = [0] * len(stages)
+        for x in c:
+            last = False
+            for i, (kind, arg) in enumerate(stages):
+                counts[i] += 1
+                if kind == 'map':
+                    x = yield self.call_function(arg, ctx, [x])
+                elif kind == 'filter':
+                    keep = yield self.call_function(arg, ctx, [x])
+                    if not keep:
+                        break
+                elif kind == 'take':
+                    last = last or counts[i] >= arg
+                elif counts[i] <= arg:  # drop
+                    break
+            else:
+                acc = yield self.call_function(f, ctx, [acc, x])
+
+            if last:
+                break
+        yield ValueResult(acc, ctx)
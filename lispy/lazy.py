@@ -0,0 +1,63 @@
+from lispy.expression import ExpressionTree
+
+
+class LazySeq:
+    """ a sequence whose elements are computed while it is iterated, and
+        are not kept. make returns a new python iterator over the elements,
+        so that every iteration starts again from the source: map and filter
+        call their function again, and files are read again.
+
+        map and filter return a LazySeq when their collection is one, so that
+        chains of them process one element at a time. the elements are
+        realized by iterating the sequence, e.g. with (list & seq),
+        (reduce f init & seq) or by printing it
+    """
+    __slots__ = ('make',)
+
+    def __init__(self, make):
+        self.make = make
+
+    def __iter__(self):
+        return iter(self.make())
+
+    def map(self, function):
+        """ the sequence of the values of function on the elements of this one
+        """
+        return LazySeq(lambda: map(function, self))
+
+    def filter(self, function):
+        """ the sequence of the elements of this one for which function is true
+        """
+        return LazySeq(lambda: filter(function, self))
+
+    def __str__(self):
+        return ExpressionTree.to_string(self)
+
+    def __repr__(self):
+        return 'LazySeq(%r)' % self.make
+
+
+class Transducer:
+    """ the stages of a pipeline, which transduce applies to each element in
+        a single pass, without building the collections in between. stages
+        are ('map', function), ('filter', function), ('take', count) or
+        ('drop', count), in order. transducers are composed with +
+    """
+    __slots__ = ('stages',)
+
+    def __init__(self, stages):
+        self.stages = tuple(stages)
+
+    @staticmethod
+    def compose(xforms):
+        """ the stages of a transducer, or of a list of them
+        """
+        if isinstance(xforms, Transducer):
+            return xforms.stages
+        return tuple(stage for xform in xforms for stage in xform.stages)
+
+    def __add__(self, other):
+        return Transducer(self.stages + other.stages)
+
+    def __repr__(self):
+        return 'Transducer(%r)' % (self.stages,)
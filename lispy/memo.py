@@ -0,0 +1,136 @@
+import collections
+import time
+from collections.abc import Mapping, Set
+
+from lispy.interpreter import CodeResult, Function, Macro, ValueResult
+from lispy.persistent import Vector
+
+
+# the value of lookup when the cache has none
+MISSING = object()
+
+CacheInfo = collections.namedtuple('CacheInfo', ['hits', 'misses', 'max_size', 'size'])
+
+
+def freeze(value):
+    """ a hashable key for value, where lists, dicts and sets are compared by
+        their content. the type is part of the key, so that e.g. a list and a
+        vector with the same elements are different keys
+    """
+    cls = type(value)
+    if cls is list or cls is tuple or cls is Vector:
+        return cls, tuple(map(freeze, value))
+    elif isinstance(value, Mapping):
+        return cls, frozenset((freeze(k), freeze(v)) for k, v in value.items())
+    elif isinstance(value, Set):
+        return cls, frozenset(map(freeze, value))
+    return value
+
+
+class MemoCache:
+    """ the values of the calls of a function, by their arguments. when there
+        are max_size of them the least recently used one is dropped, and
+        values older than ttl seconds are computed again. max_size and ttl
+        can be None, for no limit
+    """
+
+    def __init__(self, max_size=128, ttl=None):
+        if max_size is not None and max_size < 0:
+            raise ValueError('max_size cannot be negative')
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()  # key -> (value, expiration time)
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """ the value for key, raises KeyError if there is none
+        """
+        value, expires = self.entries[key]
+        if expires is not None and expires <= time.monotonic():
+            del self.entries[key]
+            raise KeyError(key)
+
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.max_size == 0:
+            return
+
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        self.entries[key] = value, expires
+        self.entries.move_to_end(key)
+        if self.max_size is not None and len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.max_size, len(self.entries))
+
+
+class MemoizedFunction(Function):
+    """ a function whose values are cached by its arguments, which are hashed
+        by content, see freeze. the function is assumed to depend on its
+        arguments only. calls whose arguments cannot be hashed, and calls
+        raising an exception, are not cached
+    """
+
+    def __init__(self, function, max_size=128, ttl=None):
+        if not isinstance(function, Function) or isinstance(function, Macro):
+            raise TypeError('cannot memoize "%s", it is not a function' % function)
+
+        super(MemoizedFunction, self).__init__(function.name, function.parameters, function.body, function.ctx)
+        self.function = function
+        self.cache = MemoCache(max_size, ttl)
+
+    def lookup(self, args):
+        """ the key of the arguments, which is None if they cannot be hashed,
+            and the cached value, or MISSING
+        """
+        cache = self.cache
+        try:
+            key = freeze(args)
+            value = cache.get(key)
+        except TypeError:
+            key, value = None, MISSING
+        except KeyError:
+            value = MISSING
+
+        if value is MISSING:
+            cache.misses += 1
+        else:
+            cache.hits += 1
+        return key, value
+
+    def store(self, key, value):
+        if key is not None:
+            self.cache.put(key, value)
+
+    def __call__(self, ctx, *args):
+        key, value = self.lookup(args)
+        if value is MISSING:
+            value = yield CodeResult(self.function(ctx, *args), ctx)
+            self.store(key, value)
+        yield ValueResult(value, ctx)
+
+    def cache_info(self):
+        """ the hits, misses, maximum size and size of the cache
+        """
+        return self.cache.info()
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    def __eq__(self, other):
+        if not isinstance(other, MemoizedFunction):
+            return False
+        return self.function == other.function
+
+    def __str__(self):
+        return '<memoized function "%s">' % self.name
+
+    def __repr__(self):
+        return 'MemoizedFunction(%r)' % self.function
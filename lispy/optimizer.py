@@ -0,0 +1,226 @@
+from lispy.cache import map_atoms
+from lispy.context import SHADOWED
+from lispy.expression import ExpressionTree
+from lispy.globals import GLOBALS
+from lispy.interpreter import UNQUOTE, IterativeInterpreter, Macro, thread_last
+from lispy.resolver import bound_names
+from lispy.tokenizer import Token
+
+
+# globals whose value only depends on their arguments, and that do nothing else
+PURE_GLOBALS = frozenset((
+    '!=', '%', '*', '+', '-', '/', '<', '<=', '=', '>', '>=',
+    'float', 'index', 'int', 'is_list', 'list', 'mod', 'not', 'nth', 'slice', 'str',
+))
+
+# values that are unboxed in the parse tree
+LITERAL_TYPES = (bool, int, float, str, type(None))
+
+
+def optimize(expr, ctx):
+    """ a copy of the parsed expression where:
+
+         - calls of pure globals whose arguments are literals are replaced by
+           their value. in the bodies of functions and macros, only calls of
+           operators, e.g. (* 60 60), since lispy code cannot bind them
+         - ifs whose condition is a literal are replaced by one of the branches
+         - quoted forms without ~ are built once, see Constant
+         - comments are dropped
+
+        lists that are not changed are not copied. a global is only folded if
+        no context binds its name yet and the expression does not bind it.
+        bodies are evaluated later, from callers that can bind any identifier,
+        so globals like int and str are not folded there. code that is too
+        deeply nested is returned as it is
+    """
+    try:
+        return Optimizer(ctx, bound_names(expr)).optimize(expr)
+    except RecursionError:
+        return expr
+
+
+class Constant:
+    """ the value of a quoted form or of a folded expression that is a list.
+        the parse tree holds a call of it, i.e. [Constant(value)], which
+        evaluates to a copy of the value, since lists can be changed
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return map_atoms(self.value, lambda x: x)
+
+    def __str__(self):
+        return '(quote %s)' % ExpressionTree.to_string(self.value)[1:-1]
+
+    def __repr__(self):
+        return 'Constant(%r)' % (self.value,)
+
+
+class Optimizer:
+    """ the special forms without an optimize_* method are left as they are,
+        since their children are not all code
+    """
+
+    # special forms that evaluate all their arguments
+    PLAIN_FORMS = ('if', 'do', 'and', 'or', 'in', 'map', 'filter', 'reduce', 'transduce', 'call',
+                   'recur', 'pmap', 'pmap_io', 'future', 'await')
+
+    def __init__(self, ctx, bound, fold=True):
+        self.ctx = ctx
+        self.bound = bound
+        self.fold = fold  # whether calls of identifiers are folded, not only of operators
+
+    def optimize(self, expr):
+        if not isinstance(expr, list) or not expr:
+            return expr
+
+        name = IterativeInterpreter.form_name(expr[0])
+        if name is None or not hasattr(IterativeInterpreter, 'handle_' + name):
+            return self.optimize_call(expr)
+        elif name == 'comment':
+            return None
+
+        if name in self.PLAIN_FORMS:
+            expr = self.optimize_children(expr, range(1, len(expr)))
+        optimizer = getattr(self, 'optimize_' + name, None)
+        return expr if optimizer is None else optimizer(expr)
+
+    def optimize_children(self, expr, positions):
+        """ expr, or a copy of it if the children at the given positions change
+        """
+        copy = None
+        for i in positions:
+            child = self.optimize(expr[i])
+            if child is not expr[i]:
+                copy = copy or list(expr)
+                copy[i] = child
+        return expr if copy is None else copy
+
+    def optimize_call(self, expr):
+        head = expr[0]
+        if isinstance(head, Token) and isinstance(self.ctx.get(head.value), Macro):
+            return expr  # the arguments are code for the macro
+
+        expr = self.optimize_children(expr, range(len(expr)))
+        if not (isinstance(head, Token) and (self.fold or head.type != Token.TOKEN_IDENTIFIER)
+                and self.is_pure(head.value)):
+            return expr
+
+        args = []
+        for arg in expr[1:]:
+            if type(arg) in LITERAL_TYPES:
+                args.append(arg)
+            elif isinstance(arg, list) and len(arg) == 1 and type(arg[0]) is Constant:
+                args.append(arg[0]())
+            else:
+                return expr
+
+        try:
+            value = GLOBALS[head.value](*args)
+        except Exception:
+            return expr  # raised when evaluated
+        return self.literal(value, expr)
+
+    def optimize_if(self, expr):
+        if len(expr) == 4 and type(expr[1]) in LITERAL_TYPES:
+            return expr[2] if expr[1] else expr[3]
+        return expr
+
+    def optimize_do(self, expr):
+        # the value of the last child is the value of the do
+        children = [child for child in expr[1:-1] if child is not None]
+        if len(children) == len(expr) - 2:
+            return expr
+        return expr[:1] + children + expr[-1:]
+
+    def optimize_def(self, expr):
+        return self.optimize_children(expr, range(2, len(expr), 2))
+
+    def optimize_defn(self, expr):
+        body = Optimizer(self.ctx, self.bound, fold=False)
+        return body.optimize_children(expr, range(3, len(expr)))
+
+    def optimize_defmacro(self, expr):
+        return self.optimize_defn(expr)
+
+    def optimize_let(self, expr):
+        if len(expr) != 3 or not isinstance(expr[1], list):
+            return expr
+
+        bindings = self.optimize_children(expr[1], range(1, len(expr[1]), 2))
+        body = self.optimize(expr[2])
+        if bindings is expr[1] and body is expr[2]:
+            return expr
+        return [expr[0], bindings, body]
+
+    def optimize_loop(self, expr):
+        return self.optimize_let(expr)
+
+    def optimize_doseq(self, expr):
+        if len(expr) < 2 or not isinstance(expr[1], list) or len(expr[1]) != 2:
+            return expr
+
+        binding = self.optimize_children(expr[1], [1])
+        copy = self.optimize_children(expr, range(2, len(expr)))
+        if binding is not expr[1]:
+            copy = copy if copy is not expr else list(expr)
+            copy[1] = binding
+        return copy
+
+    def optimize_dotimes(self, expr):
+        return self.optimize_doseq(expr)
+
+    def optimize_match(self, expr):
+        copy = self.optimize_children(expr, range(1, min(2, len(expr))))
+        for i in range(2, len(expr)):
+            case = expr[i]
+            if isinstance(case, list) and len(case) == 2:
+                result = self.optimize(case[1])
+                if result is not case[1]:
+                    copy = copy if copy is not expr else list(expr)
+                    copy[i] = [case[0], result]
+        return copy
+
+    def optimize_dot(self, expr):
+        return self.optimize_children(expr, range(2, len(expr)))
+
+    def optimize_thread_last(self, expr):
+        if len(expr) < 2 or not self.fold:
+            return expr  # bodies are expanded when resolved, see lispy.resolver
+        return self.optimize(thread_last(expr, self.ctx, self.bound))
+
+    def optimize_quote(self, expr):
+        if self.has_unquote(expr):
+            return expr
+        return [Constant(expr[1:])]
+
+    def optimize_tick(self, expr):
+        return self.optimize_quote(expr)
+
+    def is_pure(self, name):
+        return (name in PURE_GLOBALS and name not in SHADOWED and name not in self.bound
+                and self.ctx.get(name) is GLOBALS[name])
+
+    @staticmethod
+    def literal(value, expr):
+        """ the parse tree evaluating to value, or else expr
+        """
+        if type(value) in LITERAL_TYPES:
+            return value
+        elif isinstance(value, list):
+            return [Constant(value)]
+        return expr
+
+    @staticmethod
+    def has_unquote(template):
+        stack = [template]
+        while stack:
+            for child in stack.pop():
+                if child is UNQUOTE:
+                    return True
+                elif isinstance(child, list):
+                    stack.append(child)
+        return False
@@ -0,0 +1,336 @@
+import builtins
+import importlib
+import math
+import os
+import pickle
+import threading
+import types
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from lispy.context import UNBOUND, ExecutionContext
+from lispy.globals import GLOBALS
+from lispy.interpreter import AnonymousFunction, Function, Macro
+from lispy.memo import MemoizedFunction
+from lispy.resolver import bound_names
+from lispy.tokenizer import Token
+from lispy.utils import frozen_stdlib
+
+
+# the number of worker processes, the number of cpus if None. it is read when
+# the pool is first used, see configure
+PROCESSES = None
+
+# how many chunks each worker gets, when the chunk size is not given
+CHUNKS_PER_WORKER = 4
+
+# functions restored by a worker, by payload
+CACHE_SIZE = 64
+
+# the number of threads evaluating futures, see ThreadPoolExecutor if None. it
+# is read when the pool is first used, see configure
+THREADS = None
+
+_executor = None
+_workers = None  # by interpreter class, in the worker processes
+_thread_executor = None
+_local = threading.local()
+
+
+class PortableFunction:
+    """ a lispy function, or anonymous function or macro, without the
+        contexts it refers to, so that it can be pickled. its free variables
+        are sent with it, see export
+    """
+    __slots__ = ('kind', 'name', 'parameters', 'body')
+
+    def __init__(self, function):
+        if isinstance(function, Macro):
+            self.kind = 'macro'
+        elif isinstance(function, Function):
+            self.kind = 'function'
+        else:
+            self.kind = 'anonymous'
+        self.name = getattr(function, 'name', None)
+        self.parameters = getattr(function, 'parameters', None)
+        self.body = function.body
+
+    def restore(self, ctx):
+        if self.kind == 'anonymous':
+            return AnonymousFunction(ctx, self.body)
+        return (Macro if self.kind == 'macro' else Function)(self.name, self.parameters, self.body, ctx)
+
+
+class PortableModule:
+    """ a python module, which is imported again by the workers
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+
+def free_names(function):
+    """ the names a lispy function might look up in the contexts of its
+        callers or of its definition, i.e. the names in its body that it does
+        not bind
+    """
+    bound = bound_names(function.body)
+    bound.update(p.value for p in getattr(function, 'parameters', ()) if isinstance(p, Token))
+
+    names, stack = set(), [function.body]
+    while stack:
+        expr = stack.pop()
+        if isinstance(expr, list):
+            stack.extend(expr)
+        elif isinstance(expr, Token) and expr.type != Token.TOKEN_LITERAL:
+            name = expr.value.split('.')[0] if expr.type == Token.TOKEN_IDENTIFIER else expr.value
+            if name and name not in bound:
+                names.add(name)
+    return names
+
+
+def inherited(name, value):
+    """ whether the workers have the same value for name
+    """
+    return (value is GLOBALS.get(name, UNBOUND) or value is builtins.__dict__.get(name, UNBOUND)
+            or value is frozen_stdlib().bindings.get(name, UNBOUND))
+
+
+class Exporter:
+    """ converts a value to its portable form. the free variables of the
+        lispy functions found in it are looked up in ctx, the context of the
+        caller, then in the context where the function was defined, and
+        collected in env, so that they can be bound again in the workers
+    """
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.env = {}
+        self.seen = {}
+
+    def export(self, value):
+        if isinstance(value, MemoizedFunction):
+            value = value.function  # the cache stays in this process
+
+        if isinstance(value, (Function, AnonymousFunction)):
+            portable = self.seen.get(id(value))
+            if portable is None:
+                portable = self.seen[id(value)] = PortableFunction(value)
+                self.capture(free_names(value), value.ctx)
+            return portable
+        elif type(value) is types.ModuleType:
+            return PortableModule(value.__name__)
+        elif type(value) is list:
+            return [self.export(x) for x in value]
+        elif type(value) is tuple:
+            return tuple(self.export(x) for x in value)
+        elif type(value) is dict:
+            return {k: self.export(v) for k, v in value.items()}
+        return value
+
+    def capture(self, names, defctx):
+        for name in names:
+            if name in self.env:
+                continue
+
+            value = self.ctx.get(name, UNBOUND)
+            if value is UNBOUND and defctx is not None:
+                value = defctx.get(name, UNBOUND)
+            if value is UNBOUND or inherited(name, value):
+                continue
+
+            self.env[name] = None  # the value can refer to the name again
+            self.env[name] = self.export(value)
+
+
+def export(function, ctx):
+    """ the function called from ctx, and the free variables it needs, as a
+        pickled payload for the workers. raises RuntimeError if some of them
+        cannot be pickled
+    """
+    exporter = Exporter(ctx)
+    portable = exporter.export(function)
+    try:
+        return pickle.dumps((portable, exporter.env))
+    except (pickle.PicklingError, TypeError, AttributeError) as exc:
+        raise RuntimeError('cannot send "%s" to other processes: %s' % (function, exc)) from exc
+
+
+def restore(value, ctx, restored):
+    if type(value) is PortableFunction:
+        function = restored.get(id(value))
+        if function is None:
+            function = restored[id(value)] = value.restore(ctx)
+        return function
+    elif type(value) is PortableModule:
+        return importlib.import_module(value.name)
+    elif type(value) is list:
+        return [restore(x, ctx, restored) for x in value]
+    elif type(value) is tuple:
+        return tuple(restore(x, ctx, restored) for x in value)
+    elif type(value) is dict:
+        return {k: restore(v, ctx, restored) for k, v in value.items()}
+    return value
+
+
+def load(payload, worker):
+    """ the function in the payload, and the context to call it from, with
+        its free variables bound
+    """
+    portable, env = pickle.loads(payload)
+    ctx, restored = ExecutionContext(worker.ctx), {}
+    for name, value in env.items():
+        ctx[name] = restore(value, ctx, restored)
+    return restore(portable, ctx, restored), ctx
+
+
+class Worker:
+    """ an interpreter of a worker process, and the functions it received
+    """
+
+    def __init__(self, interpreter_class):
+        self.interpreter = interpreter_class(with_stdlib=True)
+        self.ctx = self.interpreter.ctx
+        self.functions = {}
+
+    def run(self, payload, chunk):
+        entry = self.functions.get(payload)
+        if entry is None:
+            if len(self.functions) >= CACHE_SIZE:
+                self.functions.clear()
+            entry = self.functions[payload] = load(payload, self)
+
+        function, ctx = entry
+        return [self.interpreter.call(function, [x], ctx) for x in chunk]
+
+
+def init_worker():
+    global _workers
+    _workers = {}
+    frozen_stdlib()  # shared by the interpreters of the worker
+
+
+def run_chunk(interpreter_class, payload, chunk):
+    worker = _workers.get(interpreter_class)
+    if worker is None:
+        worker = _workers[interpreter_class] = Worker(interpreter_class)
+    return worker.run(payload, chunk)
+
+
+def in_worker():
+    """ whether this process is a worker, where pmap runs serially
+    """
+    return _workers is not None
+
+
+def executor():
+    """ the pool of worker processes, which is started when first used
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PROCESSES, initializer=init_worker)
+    return _executor
+
+
+def thread_executor():
+    """ the pool of threads evaluating futures, started when first used
+    """
+    global _thread_executor
+    if _thread_executor is None:
+        _thread_executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix='lispy')
+    return _thread_executor
+
+
+def shutdown():
+    """ stops the worker processes and threads, new pools are started when
+        needed
+    """
+    global _executor, _thread_executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+    if _thread_executor is not None:
+        _thread_executor.shutdown()
+        _thread_executor = None
+
+
+def configure(processes=UNBOUND, threads=UNBOUND):
+    """ sets the number of worker processes and of threads, None for the
+        defaults, and stops the pools, which are started again with the new
+        sizes when needed. the sizes not given are left as they are
+    """
+    global PROCESSES, THREADS
+    for size in (processes, threads):
+        if size is not UNBOUND and size is not None and size < 1:
+            raise ValueError('the number of workers must be positive')
+
+    if processes is not UNBOUND:
+        PROCESSES = processes
+    if threads is not UNBOUND:
+        THREADS = threads
+    shutdown()
+
+
+def pmap(interpreter, function, items, ctx, chunk_size=None):
+    """ the values of the function, called from ctx, on the items, which are
+        split in chunks and evaluated by the worker processes with the engine
+        of the interpreter. the values are in the order of the items
+    """
+    items = list(items)
+    if not items:
+        return []
+
+    payload = export(function, ctx)
+    if chunk_size is None:
+        workers = PROCESSES or os.cpu_count() or 1
+        chunk_size = math.ceil(len(items) / (workers * CHUNKS_PER_WORKER))
+    elif chunk_size < 1:
+        raise ValueError('the chunk size must be positive')
+
+    pool = executor()
+    futures = [pool.submit(run_chunk, type(interpreter), payload, items[i:i + chunk_size])
+               for i in range(0, len(items), chunk_size)]
+
+    values = []
+    for future in futures:
+        values.extend(future.result())
+    return values
+
+
+def call_in_thread(interpreter_class, function, args, ctx):
+    """ calls a lispy function from ctx with an interpreter of the current
+        thread, since interpreters cannot run in two threads at once
+    """
+    interpreters = getattr(_local, 'interpreters', None)
+    if interpreters is None:
+        interpreters = _local.interpreters = {}
+
+    interpreter = interpreters.get(interpreter_class)
+    if interpreter is None:
+        interpreter = interpreters[interpreter_class] = interpreter_class()
+    return interpreter.call(function, args, ctx)
+
+
+def submit(interpreter, function, args, ctx):
+    """ a future of the value of the function on the arguments, evaluated by
+        the thread pool. lispy functions are called from ctx, with the engine
+        of the interpreter
+    """
+    if isinstance(function, Macro):
+        raise RuntimeError('cannot call macro "%s" in a future' % function.name)
+    elif isinstance(function, (Function, AnonymousFunction)):
+        return thread_executor().submit(call_in_thread, type(interpreter), function, args, ctx)
+    return thread_executor().submit(function, *args)
+
+
+def pmap_io(interpreter, function, items, ctx):
+    """ the values of the function on the items, which are all evaluated at
+        the same time by the thread pool, in order
+    """
+    futures = [submit(interpreter, function, [x], ctx) for x in items]
+    try:
+        return [future.result() for future in futures]
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
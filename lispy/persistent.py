@@ -0,0 +1,421 @@
+from collections.abc import Mapping, Sequence
+
+from lispy.expression import ExpressionTree
+
+
+# the nodes of the tries have up to 2 ** BITS children
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+def to_string(value):
+    """ how print shows a value inside a vector or a map
+    """
+    if isinstance(value, list):
+        return ExpressionTree.to_string(value)
+    return str(value)
+
+
+class Vector(Sequence):
+    """ an immutable vector. changes return a new vector that shares most of
+        its structure with the old one, so that conj, assoc, pop and nth take
+        O(log32 n) time.
+
+        the elements are stored in the leaves of a trie whose nodes are lists
+        of up to 32 children, except for the last up to 32 elements, which
+        are kept in tail. nodes are never changed after they are created
+    """
+    __slots__ = ('count', 'shift', 'root', 'tail')
+
+    def __init__(self, items=()):
+        items = list(items)
+        tailoff = self.tail_offset(len(items))
+
+        nodes, shift = [items[i:i + WIDTH] for i in range(0, tailoff, WIDTH)], BITS
+        while len(nodes) > WIDTH:
+            nodes = [nodes[i:i + WIDTH] for i in range(0, len(nodes), WIDTH)]
+            shift += BITS
+
+        self.count = len(items)
+        self.shift = shift
+        self.root = nodes
+        self.tail = items[tailoff:]
+
+    @classmethod
+    def make(cls, count, shift, root, tail):
+        vector = cls.__new__(cls)
+        vector.count, vector.shift, vector.root, vector.tail = count, shift, root, tail
+        return vector
+
+    @staticmethod
+    def tail_offset(count):
+        """ the index of the first element in the tail of a vector of the
+            given length
+        """
+        return 0 if count < WIDTH else ((count - 1) >> BITS) << BITS
+
+    def leaf(self, i):
+        """ the list holding the i-th element
+        """
+        if i >= self.tail_offset(self.count):
+            return self.tail
+
+        node = self.root
+        for level in range(self.shift, 0, -BITS):
+            node = node[(i >> level) & MASK]
+        return node
+
+    def position(self, i):
+        """ i as a non-negative index, which must be in range
+        """
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('vector index out of range')
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return Vector(self[j] for j in range(*i.indices(self.count)))
+        i = self.position(i)
+        return self.leaf(i)[i & MASK]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for i in range(0, self.tail_offset(self.count), WIDTH):
+            yield from self.leaf(i)
+        yield from self.tail
+
+    def conj(self, value):
+        """ a vector with value added at the end
+        """
+        count, shift, root = self.count, self.shift, self.root
+        if count - self.tail_offset(count) < WIDTH:
+            return Vector.make(count + 1, shift, root, self.tail + [value])
+
+        # the tail is full, and goes in the trie
+        if (count >> BITS) > (1 << shift):
+            root, shift = [root, self.new_path(shift, self.tail)], shift + BITS
+        else:
+            root = self.push_tail(shift, root, self.tail)
+        return Vector.make(count + 1, shift, root, [value])
+
+    def push_tail(self, level, parent, tail):
+        i = ((self.count - 1) >> level) & MASK
+        if level == BITS:
+            child = tail
+        elif i < len(parent):
+            child = self.push_tail(level - BITS, parent[i], tail)
+        else:
+            child = self.new_path(level - BITS, tail)
+
+        node = list(parent)
+        if i < len(node):
+            node[i] = child
+        else:
+            node.append(child)
+        return node
+
+    @staticmethod
+    def new_path(level, node):
+        while level:
+            node, level = [node], level - BITS
+        return node
+
+    def assoc(self, i, value):
+        """ a vector with value in position i, which can be one past the end
+        """
+        if i == self.count:
+            return self.conj(value)
+
+        i = self.position(i)
+        if i >= self.tail_offset(self.count):
+            tail = list(self.tail)
+            tail[i & MASK] = value
+            return Vector.make(self.count, self.shift, self.root, tail)
+        return Vector.make(self.count, self.shift, self.set_in(self.shift, self.root, i, value), self.tail)
+
+    def set_in(self, level, node, i, value):
+        node = list(node)
+        if level == 0:
+            node[i & MASK] = value
+        else:
+            j = (i >> level) & MASK
+            node[j] = self.set_in(level - BITS, node[j], i, value)
+        return node
+
+    def pop(self):
+        """ a vector without the last element
+        """
+        count, shift = self.count, self.shift
+        if count == 0:
+            raise IndexError('pop from empty vector')
+        elif count - self.tail_offset(count) > 1:
+            return Vector.make(count - 1, shift, self.root, self.tail[:-1])
+
+        # the last leaf of the trie becomes the tail
+        tail = self.leaf(count - 2) if count > 1 else []
+        root = self.pop_tail(shift, self.root) or []
+        if shift > BITS and len(root) == 1:
+            root, shift = root[0], shift - BITS
+        return Vector.make(count - 1, shift, root, tail)
+
+    def pop_tail(self, level, node):
+        i = ((self.count - 2) >> level) & MASK
+        if level > BITS:
+            child = self.pop_tail(level - BITS, node[i])
+            if child is None and i == 0:
+                return None
+            return node[:i] if child is None else node[:i] + [child]
+        elif i == 0:
+            return None
+        return node[:i]
+
+    def __add__(self, other):
+        vector = self
+        for value in other:
+            vector = vector.conj(value)
+        return vector
+
+    def __eq__(self, other):
+        if not isinstance(other, (Vector, list, tuple)) or len(self) != len(other):
+            return False
+        return all(x == y for x, y in zip(self, other))
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __str__(self):
+        return '[%s]' % ' '.join(map(to_string, self))
+
+    def __repr__(self):
+        return 'Vector(%r)' % list(self)
+
+
+class BitmapNode:
+    """ a node of a HashMap, holding the keys whose hashes have the same
+        first bits. bitmap tells which of the 32 values of the next bits are
+        used, and array holds a (key, value) pair or a node for each of them
+    """
+    __slots__ = ('bitmap', 'array')
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+    def find(self, shift, h, key):
+        """ the pair with the given key, or None
+        """
+        node = self
+        while True:
+            if type(node) is CollisionNode:
+                return node.find(shift, h, key)
+
+            bit = 1 << ((h >> shift) & MASK)
+            if not node.bitmap & bit:
+                return None
+
+            child = node.array[bin(node.bitmap & (bit - 1)).count('1')]
+            if type(child) is tuple:
+                return child if child[0] is key or child[0] == key else None
+            node, shift = child, shift + BITS
+
+    def assoc(self, shift, h, key, value):
+        """ the node with key bound to value, and whether key is new
+        """
+        bit = 1 << ((h >> shift) & MASK)
+        i = bin(self.bitmap & (bit - 1)).count('1')
+        if not self.bitmap & bit:
+            return BitmapNode(self.bitmap | bit, self.array[:i] + [(key, value)] + self.array[i:]), True
+
+        child, added = self.array[i], False
+        if type(child) is tuple:
+            if child[0] is key or child[0] == key:
+                if child[1] is value:
+                    return self, False
+                child = (key, value)
+            else:
+                child, added = make_node(shift + BITS, hash_of(child[0]), child, h, (key, value)), True
+        else:
+            new, added = child.assoc(shift + BITS, h, key, value)
+            if new is child:
+                return self, False
+            child = new
+
+        array = list(self.array)
+        array[i] = child
+        return BitmapNode(self.bitmap, array), added
+
+    def dissoc(self, shift, h, key):
+        """ the node without key, which is None if it would be empty
+        """
+        bit = 1 << ((h >> shift) & MASK)
+        if not self.bitmap & bit:
+            return self
+
+        i = bin(self.bitmap & (bit - 1)).count('1')
+        child = self.array[i]
+        if type(child) is tuple:
+            if not (child[0] is key or child[0] == key):
+                return self
+            child = None
+        else:
+            new = child.dissoc(shift + BITS, h, key)
+            if new is child:
+                return self
+            child = new
+
+            # a node with a single pair is replaced by the pair
+            if child is not None and len(child.array) == 1 and type(child.array[0]) is tuple:
+                child = child.array[0]
+
+        if child is not None:
+            array = list(self.array)
+            array[i] = child
+            return BitmapNode(self.bitmap, array)
+        elif len(self.array) == 1:
+            return None
+        return BitmapNode(self.bitmap ^ bit, self.array[:i] + self.array[i + 1:])
+
+    def __iter__(self):
+        """ the pairs in this node and below
+        """
+        stack = [iter(self.array)]
+        while stack:
+            for child in stack[-1]:
+                if type(child) is not tuple:
+                    stack.append(iter(child.array))
+                    break
+                yield child
+            else:
+                stack.pop()
+
+
+class CollisionNode:
+    """ a node of a HashMap holding the pairs whose keys have the same hash
+    """
+    __slots__ = ('hash', 'array')
+
+    def __init__(self, h, array):
+        self.hash = h
+        self.array = array
+
+    def find(self, shift, h, key):
+        for pair in self.array:
+            if pair[0] is key or pair[0] == key:
+                return pair
+        return None
+
+    def assoc(self, shift, h, key, value):
+        if h != self.hash:
+            # the hashes differ in the bits after shift
+            node = BitmapNode(1 << ((self.hash >> shift) & MASK), [self])
+            return node.assoc(shift, h, key, value)
+
+        for i, pair in enumerate(self.array):
+            if pair[0] is key or pair[0] == key:
+                if pair[1] is value:
+                    return self, False
+                array = list(self.array)
+                array[i] = (key, value)
+                return CollisionNode(h, array), False
+        return CollisionNode(h, self.array + [(key, value)]), True
+
+    def dissoc(self, shift, h, key):
+        array = [pair for pair in self.array if not (pair[0] is key or pair[0] == key)]
+        if len(array) == len(self.array):
+            return self
+        elif not array:
+            return None
+        elif len(array) == 1:
+            return BitmapNode(1 << ((h >> shift) & MASK), array)
+        return CollisionNode(h, array)
+
+    def __iter__(self):
+        return iter(self.array)
+
+
+def hash_of(key):
+    return hash(key) & 0xFFFFFFFF
+
+
+def make_node(shift, h1, pair1, h2, pair2):
+    """ a node holding two pairs with different keys
+    """
+    if h1 == h2:
+        return CollisionNode(h1, [pair1, pair2])
+    node, _ = BitmapNode(0, []).assoc(shift, h1, *pair1)
+    node, _ = node.assoc(shift, h2, *pair2)
+    return node
+
+
+class HashMap(Mapping):
+    """ an immutable map, stored in a hash array mapped trie. like Vector,
+        changes return a new map sharing most of its nodes with the old one,
+        and assoc, dissoc and lookups take O(log32 n) time. keys are iterated
+        in the order of their hashes
+    """
+    __slots__ = ('count', 'root')
+
+    def __init__(self, items=()):
+        self.count, self.root = 0, BitmapNode(0, [])
+        if isinstance(items, Mapping):
+            items = items.items()
+        for key, value in items:
+            self.root, added = self.root.assoc(0, hash_of(key), key, value)
+            self.count += added
+
+    @classmethod
+    def make(cls, count, root):
+        mapping = cls.__new__(cls)
+        mapping.count, mapping.root = count, root
+        return mapping
+
+    def __getitem__(self, key):
+        pair = self.root.find(0, hash_of(key), key)
+        if pair is None:
+            raise KeyError(key)
+        return pair[1]
+
+    def __contains__(self, key):
+        return self.root.find(0, hash_of(key), key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for key, _ in self.root:
+            yield key
+
+    def items(self):
+        return list(self.root)
+
+    def assoc(self, key, value):
+        """ a map with key bound to value
+        """
+        root, added = self.root.assoc(0, hash_of(key), key, value)
+        if root is self.root:
+            return self
+        return HashMap.make(self.count + added, root)
+
+    def dissoc(self, key):
+        """ a map without key
+        """
+        root = self.root.dissoc(0, hash_of(key), key)
+        if root is self.root:
+            return self
+        elif root is None:
+            root = BitmapNode(0, [])
+        return HashMap.make(self.count - 1, root)
+
+    def __hash__(self):
+        return hash(frozenset(self.root))
+
+    def __str__(self):
+        return '{%s}' % ' '.join('%s %s' % (to_string(k), to_string(v)) for k, v in self.root)
+
+    def __repr__(self):
+        return 'HashMap(%r)' % dict(self.root)
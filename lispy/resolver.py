@@ -0,0 +1,291 @@
+import builtins
+
+from lispy.context import INLINED, GlobalRef, LocalRef, ResolvedBindings, make_layout
+from lispy.globals import GLOBALS
+from lispy.interpreter import (
+    UNQUOTE, VARARGS, Function, IterativeInterpreter, Macro, flatten, thread_last,
+)
+from lispy.tokenizer import Token
+
+
+# resolved bodies are cached by identity, so that functions defined again
+# and again, e.g. inside other functions, are resolved only once
+CACHE_SIZE = 2 ** 12
+
+_resolved = {}
+
+# the most names and literals in the body of a function that is inlined
+MAX_INLINED_SIZE = 8
+
+
+def resolve(body, layout, ctx):
+    """ a copy of the body of a function whose parameters are stored in
+        frames with the given layout, where the variables bound by the
+        function, its lets and its matches are LocalRefs.
+
+        other names are GlobalRefs, since scoping is dynamic: they are
+        looked up by name in the frames of the callers. code that cannot be
+        resolved, e.g. because it is too deeply nested, is returned as it is
+        and works the same, only slower.
+
+        the calls of the functions in INLINED are replaced by their bodies,
+        see inlinable
+    """
+    entry = _resolved.get(id(body))
+    if entry is None or entry[1] is not layout or entry[2] != INLINED.version:
+        version = INLINED.version
+        try:
+            code = Resolver(ctx, bound_names(body)).resolve(body, [layout])
+        except RecursionError:
+            code = body
+
+        if len(_resolved) >= CACHE_SIZE:
+            _resolved.clear()
+        # keeps body alive, so that its id is not reused
+        entry = _resolved[id(body)] = (body, layout, version, code)
+    return entry[3]
+
+
+def bound_names(expr):
+    """ the names that the expression binds with def, defn, let, match...
+    """
+    names, stack = set(), [expr]
+    while stack:
+        expr = stack.pop()
+        if not isinstance(expr, list) or not expr:
+            continue
+
+        name = IterativeInterpreter.form_name(expr[0])
+        if name in ('defn', 'defmacro') and len(expr) > 2 and isinstance(expr[2], list):
+            names.update(flatten(expr[2]))
+        elif name in ('let', 'loop') and len(expr) > 1 and isinstance(expr[1], list):
+            names.update(flatten(expr[1][::2]))
+        elif name in ('doseq', 'dotimes') and len(expr) > 1 and isinstance(expr[1], list):
+            names.update(flatten(expr[1][:1]))
+        elif name == 'match':
+            names.update(flatten(case[0] for case in expr[2:] if isinstance(case, list) and case))
+        if name in ('def', 'defn', 'defmacro'):
+            names.update(expr[1::2] if name == 'def' else expr[1:2])
+        stack.extend(expr)
+
+    return {name.value for name in names if isinstance(name, Token)}
+
+
+def inlinable(function):
+    """ whether calls of the function can be replaced by its body, with the
+        arguments in place of the parameters. the body must be a small call
+        of globals, with each parameter used once, in order, before anything
+        is called: then the arguments are evaluated as in the call, and the
+        rest of the body sees the same bindings, since scoping is dynamic
+    """
+    if type(function) is not Function or not function.positional or function.has_varargs:
+        return False
+
+    # the parameters, in the order they are evaluated, and None after a call
+    events, size, stack = [], 0, [function.body]
+    if not isinstance(function.body, list):
+        return False
+
+    while stack:
+        expr = stack.pop()
+        if expr is None:
+            events.append(None)
+        elif isinstance(expr, list):
+            head = expr[0] if expr else None
+            if (not isinstance(head, Token) or head.value in function.parameters
+                    or not is_global(head) or hasattr(
+                        IterativeInterpreter, 'handle_%s' % IterativeInterpreter.form_name(head))):
+                return False
+            stack.append(None)
+            stack.extend(reversed(expr))
+        else:
+            size += 1
+            if isinstance(expr, Token):
+                if expr.value in function.parameters:
+                    events.append(expr.value)
+                elif not is_global(expr):
+                    return False
+        if size > MAX_INLINED_SIZE:
+            return False
+
+    parameters = [event for event in events if event is not None]
+    if parameters != function.parameters:
+        return False
+    # a call would be evaluated before an argument
+    return not parameters or None not in events[:events.index(parameters[-1])]
+
+
+def is_global(token):
+    return token.value in GLOBALS or (token.type == Token.TOKEN_IDENTIFIER
+                                      and token.value in builtins.__dict__)
+
+
+def substitute(body, arguments):
+    """ a copy of the body with the names in arguments replaced by their value
+    """
+    if isinstance(body, list):
+        return [substitute(child, arguments) for child in body]
+    elif isinstance(body, Token):
+        return arguments.get(body.value, body)
+    return body
+
+
+class Resolver:
+    """ scopes are the layouts of the frames visible from an expression,
+        the innermost last.
+
+        the special forms without a resolve_* method are left as they are:
+        they either do not evaluate their arguments, or create functions,
+        whose bodies are resolved when they are first called
+    """
+
+    # special forms that evaluate all their arguments in the same context
+    PLAIN_FORMS = ('if', 'do', 'and', 'or', 'in', 'map', 'filter', 'reduce', 'transduce', 'call',
+                   'recur', 'pmap', 'pmap_io', 'future', 'await')
+
+    def __init__(self, ctx, bound=()):
+        self.ctx = ctx
+        self.bound = bound
+
+    def resolve(self, expr, scopes):
+        if isinstance(expr, Token):
+            return self.resolve_symbol(expr, scopes)
+        elif not isinstance(expr, list) or not expr:
+            return expr
+
+        name = IterativeInterpreter.form_name(expr[0])
+        if name is None or not hasattr(IterativeInterpreter, 'handle_' + name):
+            return self.resolve_call(expr, scopes)
+        elif name in self.PLAIN_FORMS:
+            return expr[:1] + [self.resolve(child, scopes) for child in expr[1:]]
+
+        resolver = getattr(self, 'resolve_' + name, None)
+        if resolver is None:
+            return expr
+        return resolver(expr, scopes)
+
+    def resolve_symbol(self, token, scopes):
+        if token.type != Token.TOKEN_IDENTIFIER:
+            # operators, the other symbols evaluate to something else
+            return GlobalRef(token) if token.value in GLOBALS else token
+
+        name = token.value.split('.')[0]
+        for depth, layout in enumerate(reversed(scopes)):
+            if name in layout:
+                return LocalRef(token, depth, layout)
+        return GlobalRef(token)
+
+    def resolve_call(self, expr, scopes):
+        head = expr[0]
+        if (isinstance(head, Token) and head.type == Token.TOKEN_IDENTIFIER
+                and type(self.resolve_symbol(head, scopes)) is GlobalRef):
+            value = self.ctx.get(head.value)
+            if isinstance(value, Macro):
+                return expr  # the arguments are code for the macro
+            elif (head.value in INLINED and INLINED[head.value] is value
+                    and head.value not in self.bound and len(expr) == value.arity + 1
+                    and VARARGS not in expr):
+                arguments = dict(zip(value.parameters, expr[1:]))
+                return self.resolve(substitute(value.body, arguments), scopes)
+        return [self.resolve(child, scopes) for child in expr]
+
+    def resolve_thread_last(self, expr, scopes):
+        if len(expr) < 2:
+            return expr
+        return self.resolve(thread_last(expr, self.ctx, self.bound), scopes)
+
+    def resolve_dot(self, expr, scopes):
+        if len(expr) != 3:
+            return expr
+        return [expr[0], expr[1], self.resolve(expr[2], scopes)]
+
+    def resolve_def(self, expr, scopes):
+        if len(expr) % 2 == 0:
+            return expr
+        return expr[:1] + [
+            self.resolve(child, scopes) if i % 2 else child
+            for i, child in enumerate(expr[1:])
+        ]
+
+    def resolve_let(self, expr, scopes):
+        if len(expr) != 3 or not isinstance(expr[1], list) or len(expr[1]) % 2:
+            return expr
+
+        targets = expr[1][::2]
+        if not self.are_names(targets):
+            return expr
+
+        layout = make_layout(flatten(t.value if isinstance(t, Token) else self.names(t)
+                                     for t in targets))
+        scopes = scopes + [layout]
+        bindings = []
+        for target, value in zip(targets, expr[1][1::2]):
+            bindings.extend((target, self.resolve(value, scopes)))
+        return [expr[0], ResolvedBindings(bindings, layout), self.resolve(expr[2], scopes)]
+
+    def resolve_loop(self, expr, scopes):
+        return self.resolve_let(expr, scopes)
+
+    def resolve_doseq(self, expr, scopes):
+        if len(expr) < 2 or not isinstance(expr[1], list) or len(expr[1]) != 2:
+            return expr
+
+        target, coll = expr[1]
+        if not self.are_names([target]):
+            return expr
+
+        layout = make_layout([target.value] if isinstance(target, Token) else self.names(target))
+        binding = ResolvedBindings([target, self.resolve(coll, scopes)], layout)
+        return [expr[0], binding] + [self.resolve(child, scopes + [layout]) for child in expr[2:]]
+
+    def resolve_dotimes(self, expr, scopes):
+        return self.resolve_doseq(expr, scopes)
+
+    def resolve_match(self, expr, scopes):
+        if len(expr) < 2:
+            return expr
+
+        cases = []
+        for case in expr[2:]:
+            if not isinstance(case, list) or len(case) != 2 or not self.are_names([case[0]]):
+                return expr
+
+            pattern = case[0]
+            layout = make_layout([pattern.value] if isinstance(pattern, Token) else self.names(pattern))
+            result = self.resolve(case[1], scopes + [layout])
+            cases.append(ResolvedBindings([pattern, result], layout))
+        return [expr[0], self.resolve(expr[1], scopes)] + cases
+
+    def resolve_quote(self, expr, scopes):
+        return expr[:1] + self.resolve_unquoted(expr[1:], scopes)
+
+    def resolve_tick(self, expr, scopes):
+        return self.resolve_quote(expr, scopes)
+
+    def resolve_unquoted(self, template, scopes):
+        copy, it = [], iter(template)
+        for cur in it:
+            if isinstance(cur, list):
+                copy.append(self.resolve_unquoted(cur, scopes))
+            elif cur is UNQUOTE:
+                copy.append(cur)
+                for unquoted in it:
+                    copy.append(self.resolve(unquoted, scopes))
+                    break
+            else:
+                copy.append(cur)
+        return copy
+
+    def are_names(self, targets):
+        """ whether targets are identifiers or nested lists of identifiers
+        """
+        for target in targets:
+            if isinstance(target, list):
+                if not self.are_names(target):
+                    return False
+            elif not isinstance(target, Token) or target.type != Token.TOKEN_IDENTIFIER:
+                return False
+        return True
+
+    def names(self, targets):
+        return [t.value for t in flatten(targets)]
@@ -6,10 +6,39 @@ STDLIB = '''
 (defn last (lst) (nth lst -1))
 (defn zero? (x) (= x 0))
 (defn empty? (lst) (= 0 (len lst)))
-(defn cons (x lst) (+ (list x) lst))
 (defn append (lst x) (do ((. append lst) x) lst))
 (defn extend (lst1 lst2) (do ((. extend lst1) lst2) lst1))
 
+(defn filter (function lst) (filter function lst))
+(defn map (function lst) (map function lst))
+(defn reduce (function initial & lst) (reduce function initial & lst))
+
+(defn curry (function & args1)
+    (defn _ ( & args2)
+        (function & (+ args1 args2))))
+
+(defmacro when (cond & body)
+    (list 'if cond (cons 'do body) None))
+
+(defmacro unless (cond body)
+    (list 'if (list 'not cond) body None))
+
+(defmacro letfn (function expression)
+    (let (fname (first function)
+          fparams (second function)
+          fbody (last function)
+          anon (map (# list '$ (+ "%" (str %0))) (range (len fparams))))
+
+        (list 'let (list fname (list '# 'let (concat & (zip fparams anon)) fbody))
+            expression)))
+'''
+
+# the definitions in lispy of the functions that STDLIB defines with the
+# special forms map, filter and reduce, or that are in GLOBALS. they are
+# slower, but give the same results
+REFERENCE = '''
+(defn cons (x lst) (+ (list x) lst))
+
 (defn rest (lst)
     (do
         (defn aux (i result)
@@ -43,10 +72,6 @@ STDLIB = '''
                 (cons (function (first l)) (aux (rest l)))))
         (aux lst)))
 
-(defn curry (function & args1)
-    (defn _ ( & args2)
-        (function & (+ args1 args2))))
-
 (defn zip (& lists)
     (let (length (min (map (# len %0) lists)))
         (do (defn aux (i result)
@@ -77,19 +102,4 @@ STDLIB = '''
 
 (defn concat (& lists)
     (reduce (# extend %0 %1) (list) & lists))
-
-(defmacro when (cond & body)
-    (list 'if cond (cons 'do body) None))
-
-(defmacro unless (cond body)
-    (list 'if (list 'not cond) body None))
-
-(defmacro letfn (function expression)
-    (let (fname (first function)
-          fparams (second function)
-          fbody (last function)
-          anon (map (# list '$ (+ "%" (str %0))) (range (len fparams))))
-
-        (list 'let (list fname (list '# 'let (concat & (zip fparams anon)) fbody))
-            expression)))
 '''
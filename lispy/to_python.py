@@ -1 +1,893 @@
-asd
+import ast
+import itertools
+import re
+
+from lispy.cache import map_atoms
+from lispy.context import INLINED, ExecutionContext, GlobalRef, MergedExecutionContext
+from lispy.expression import ExpressionTree
+from lispy.globals import GLOBALS
+from lispy.interpreter import (
+    AnonymousFunction, Function, IterativeInterpreter, Macro, SEQUENCE_TYPES, TailCodeResult,
+    UNQUOTE, VARARGS, ValueResult, ensure_not_recur, thread_last, unpack_bind,
+)
+from lispy.lazy import LazySeq
+from lispy.memo import MISSING, MemoizedFunction
+from lispy.tokenizer import Token
+
+
+class NotTranslatable(Exception):
+    """ raised for code that cannot be translated to python
+    """
+
+
+class TailCall:
+    """ returned by translated functions calling a lispy function in tail
+        position, which is then called by whoever called the function
+    """
+    __slots__ = ('function', 'ctx', 'args')
+
+    def __init__(self, function, ctx, args):
+        self.function = function
+        self.ctx = ctx
+        self.args = args
+
+
+def native_result(val, ctx):
+    if type(val) is TailCall:
+        return TailCodeResult(val.function(val.ctx, *val.args), val.ctx)
+    return ValueResult(val, ctx)
+
+
+class CompiledFunction(Function):
+    """ function whose body was translated to python. native is called with
+        the context of the caller, used to look up free variables, and the
+        arguments
+    """
+    def __init__(self, name, parameters, body, ctx, native):
+        super(CompiledFunction, self).__init__(name, parameters, body, ctx)
+        self.native = native
+
+    def __call__(self, ctx, *args):
+        if len(args) < self.arity:
+            raise IndexError('not enough arguments for "%s"' % self.name)
+        yield native_result(self.native(ctx, *args), ctx)
+
+    def interpret(self, ctx, args):
+        """ calls the function without its python code, see PythonInterpreter.run_async
+        """
+        return Function.__call__(self, ctx, *args)
+
+
+class CompiledAnonymousFunction(AnonymousFunction):
+    arity = 0  # the arguments %0, %1... are only checked when used
+
+    def __init__(self, ctx, children, native):
+        super(CompiledAnonymousFunction, self).__init__(ctx, children)
+        self.native = native
+
+    def __call__(self, ctx, *args):
+        yield native_result(self.native(ctx, *args), ctx)
+
+    def interpret(self, ctx, args):
+        return AnonymousFunction.__call__(self, ctx, *args)
+
+
+class Level:
+    """ a function being translated: the names of the python variables with
+        the context of the caller, the context where the function was defined
+        (None at the top level), and the arguments of anonymous functions
+    """
+    __slots__ = ('ctx', 'defctx', 'args')
+
+    def __init__(self, ctx, defctx, args=None):
+        self.ctx = ctx
+        self.defctx = defctx
+        self.args = args
+
+
+class Scope:
+    """ lispy names bound by a function, let or match, and the python
+        variables holding their values
+    """
+    __slots__ = ('parent', 'level', 'names')
+
+    def __init__(self, parent, level=None):
+        self.parent = parent
+        self.level = level or parent.level
+        self.names = {}
+
+    def __getitem__(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return scope.names[name]
+            scope = scope.parent
+        raise KeyError(name)
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def local_names(self):
+        """ the names bound in this function, which callees can see
+        """
+        names, scope = {}, self
+        while scope is not None and scope.level is self.level:
+            for name, var in scope.names.items():
+                names.setdefault(name, var)
+            scope = scope.parent
+        return names
+
+
+def lookup(ctx, defctx, name):
+    try:
+        return ctx[name]
+    except (NameError, KeyError):
+        if defctx is None:
+            raise NameError(name)
+        return defctx[name]
+
+
+def lookup_default(ctx, defctx, name):
+    try:
+        return lookup(ctx, defctx, name)
+    except NameError:
+        return name
+
+
+class CallerContext(MergedExecutionContext):
+    """ context given to the lispy functions called by a translated function:
+        its variables on top of its own context, then the context of its
+        definition
+    """
+
+
+def make_context(ctx, defctx, bindings):
+    if defctx is None:
+        return ExecutionContext(ctx, **bindings)
+
+    # translated code never changes these contexts, so when the bindings of
+    # the caller of the caller are all shadowed it can be skipped, as
+    # Function.frame does
+    if (type(ctx) is CallerContext and ctx.contexts[1] is defctx
+            and ctx.contexts[0].bindings.keys() <= bindings.keys()):
+        ctx = ctx.contexts[0].parent
+    return CallerContext(ExecutionContext(ctx, **bindings), defctx)
+
+
+def unpack(names, value):
+    return unpack_bind(names, value)
+
+
+def unpack_parameter(names, value):
+    try:
+        return unpack_bind(names, value)
+    except TypeError as exc:
+        raise RuntimeError('cannot unpack parameters') from exc
+
+
+def copy_quoted(template):
+    return map_atoms(template, lambda x: x)
+
+
+def match(value, patterns):
+    """ index of the pattern matching the value, and the bindings it creates
+    """
+    for i, names in enumerate(patterns):
+        if isinstance(names, list):
+            if isinstance(value, SEQUENCE_TYPES):
+                try:
+                    return i, unpack_bind(names, value)
+                except RuntimeError:
+                    continue
+        else:
+            return i, {names: value}
+    raise RuntimeError('pattern matching failed')
+
+
+class Translator:
+    """ translates lispy expressions to python functions taking the context
+        to evaluate them in.
+
+        variables bound by parameters, let and match become python variables,
+        all other names are looked up in the context of the caller and then
+        in the context of the definition, like IterativeInterpreter does.
+        lispy functions called by translated code receive a context with the
+        variables of the caller, so dynamic scoping keeps working; python
+        variables of enclosing functions are captured as python closures.
+
+        lispy functions called in tail position are not called but returned
+        as a TailCall, see call.
+
+        macros, dynamic definitions not at the top level and the special forms
+        without a translate_* method raise NotTranslatable
+    """
+
+    LISPY_CALLABLES = (Function, AnonymousFunction)
+
+    # special forms whose value can be the value of one of their children
+    TAIL_FORMS = ('if', 'do', 'let', 'match', 'thread_last')
+
+    # how many calls of translated functions can be nested in python, each
+    # takes a few python frames. deeper calls are interpreted, see interpret
+    MAX_DEPTH = 100
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self.depth = 0  # calls running in the python stack
+        self.counter = itertools.count(1)  # _c0 is the context of the form
+        self.namespace = {
+            '_lookup': lookup,
+            '_get': lookup_default,
+            '_context': make_context,
+            '_unpack': unpack,
+            '_unpack_parameter': unpack_parameter,
+            '_copy': copy_quoted,
+            '_match': match,
+            '_lispy': self.LISPY_CALLABLES,
+            '_inlined': INLINED,
+            '_macro': Macro,
+            '_expand': self.expand,
+            '_call': self.call,
+            '_tail': self.tail_call,
+            '_map': self.map,
+            '_filter': self.filter,
+            '_reduce': self.reduce,
+            '_dot': self.dot,
+            '_def': self.define,
+            '_defn': self.define_function,
+            '_function': CompiledFunction,
+            '_anonymous': CompiledAnonymousFunction,
+        }
+
+    def translate(self, expr, ctx):
+        """ returns a python function evaluating the expression and its source.
+
+            the constants of the code are the parameters of a function that
+            defines it, so that they are freed with the functions using them
+        """
+        self.ctx = ctx
+        self.constants = {}
+        level = Level('_c0', None)
+        try:
+            body = self.translate_expr(expr, Scope(None, level))
+            form = ast.FunctionDef(
+                name='_form', args=self.arguments(['_c0']), body=[ast.Return(body)],
+                decorator_list=[], returns=None, type_comment=None,
+            )
+            module = ast.Module(body=[ast.FunctionDef(
+                name='_define', args=self.arguments(list(self.constants)),
+                body=[form, ast.Return(self.load('_form'))],
+                decorator_list=[], returns=None, type_comment=None,
+            )], type_ignores=[])
+            ast.fix_missing_locations(module)
+            code = compile(module, '<lispy>', 'exec')
+            source = ast.unparse(form)
+        except (RecursionError, MemoryError, SyntaxError):
+            raise NotTranslatable('too deeply nested')
+        finally:
+            constants, self.constants = self.constants, None
+
+        exec(code, self.namespace)
+        return self.namespace.pop('_define')(*constants.values()), source
+
+    # runtime support
+
+    def call(self, fun, ctx, args):
+        if self.depth >= self.MAX_DEPTH:
+            return self.interpret(fun, ctx, args)
+
+        self.depth += 1
+        try:
+            while isinstance(fun, (CompiledFunction, CompiledAnonymousFunction)):
+                if len(args) < fun.arity:
+                    raise IndexError('not enough arguments for "%s"' % fun.name)
+                val = fun.native(ctx, *args)
+                if type(val) is not TailCall:
+                    return val
+                fun, ctx, args = val.function, val.ctx, val.args
+        finally:
+            self.depth -= 1
+
+        if type(fun) is MemoizedFunction:
+            key, val = fun.lookup(args)
+            if val is MISSING:
+                val = self.call(fun.function, ctx, args)
+                fun.store(key, val)
+            return val
+        return self.interpreter.call(fun, args, ctx)
+
+    def interpret(self, fun, ctx, args):
+        """ calls fun with the interpreter, which also interprets the
+            translated functions it calls, so that deep recursion does not
+            use the python stack
+        """
+        interpreter = self.interpreter
+        interpreter.interpreting += 1
+        try:
+            return interpreter.call(fun, args, ctx)
+        finally:
+            interpreter.interpreting -= 1
+
+    def expand(self, macro, ctx, args):
+        """ the value of a call of a macro that was not defined yet when the
+            call was translated. args is the code of the arguments, the
+            expansion is evaluated by the interpreter
+        """
+        return self.interpreter.call(macro, args, ctx)
+
+    def as_python(self, fun, ctx):
+        if isinstance(fun, self.LISPY_CALLABLES):
+            return lambda *args: self.call(fun, ctx, list(args))
+        return fun
+
+    @staticmethod
+    def tail_call(fun, ctx, args):
+        return TailCall(fun, ctx, args)
+
+    def map(self, fun, coll, ctx):
+        if isinstance(coll, LazySeq):
+            return coll.map(self.as_python(fun, ctx))
+        elif isinstance(fun, self.LISPY_CALLABLES):
+            return [self.call(fun, ctx, [x]) for x in coll]
+        return [fun(x) for x in coll]
+
+    def filter(self, fun, coll, ctx):
+        if isinstance(coll, LazySeq):
+            return coll.filter(self.as_python(fun, ctx))
+        elif isinstance(fun, self.LISPY_CALLABLES):
+            return [x for x in coll if self.call(fun, ctx, [x])]
+        return [x for x in coll if fun(x)]
+
+    def reduce(self, fun, acc, ctx, items, rest=()):
+        items = itertools.chain(items, rest)
+        if isinstance(fun, self.LISPY_CALLABLES):
+            for x in items:
+                acc = self.call(fun, ctx, [acc, x])
+        else:
+            for x in items:
+                acc = fun(acc, x)
+        return acc
+
+    def dot(self, obj, member):
+        val = getattr(obj, member)
+        if isinstance(val, (list, Token)):
+            # like handle_dot, but in the context of the interpreter
+            return self.interpreter.evaluate(val)
+        return val
+
+    @staticmethod
+    def define(ctx, name, value):
+        ctx[name] = value
+        return value
+
+    @staticmethod
+    def define_function(ctx, name, parameters, body, native):
+        f = CompiledFunction(name, parameters, body, ctx, native)
+        ctx[name] = f
+        return f
+
+    # helpers for building the syntax tree
+
+    def new_name(self, prefix):
+        return '%s%d' % (prefix, next(self.counter))
+
+    def new_variable(self, name):
+        return '%s_%d' % (re.sub(r'\W', lambda m: '_%x_' % ord(m.group()), name),
+                          next(self.counter))
+
+    def constant(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return ast.Constant(value)
+        name = self.new_name('_k')
+        self.constants[name] = value
+        return self.load(name)
+
+    @staticmethod
+    def load(name):
+        return ast.Name(name, ast.Load())
+
+    @staticmethod
+    def assign(name, value):
+        return ast.NamedExpr(ast.Name(name, ast.Store()), value)
+
+    def call_helper(self, helper, *args):
+        return ast.Call(self.load(helper), list(args), [])
+
+    @staticmethod
+    def sequence(exprs):
+        """ evaluates the expressions in order, the value is the last one
+        """
+        if not exprs:
+            return ast.Constant(None)
+        elif len(exprs) == 1:
+            return exprs[0]
+        return ast.Subscript(ast.Tuple(list(exprs), ast.Load()), ast.Constant(-1), ast.Load())
+
+    @staticmethod
+    def arguments(names, vararg=None):
+        return ast.arguments(
+            posonlyargs=[], args=[ast.arg(name) for name in names],
+            vararg=ast.arg(vararg or '_'), kwonlyargs=[], kw_defaults=[], defaults=[],
+        )
+
+    def context(self, scope):
+        """ the context that lispy code called from this scope sees
+        """
+        level = scope.level
+        names = scope.local_names()
+        if not names and level.defctx is None:
+            return self.load(level.ctx)
+
+        bindings = ast.Dict([ast.Constant(k) for k in names], [self.load(v) for v in names.values()])
+        return self.call_helper('_context', self.load(level.ctx),
+                                self.load(level.defctx) if level.defctx else ast.Constant(None),
+                                bindings)
+
+    def free_variable(self, scope, helper, name):
+        level = scope.level
+        return self.call_helper(helper, self.load(level.ctx),
+                                self.load(level.defctx) if level.defctx else ast.Constant(None),
+                                ast.Constant(name))
+
+    def global_variable(self, scope, token):
+        """ a free variable looked up through a GlobalRef, i.e. cached when
+            it can only be a global or a builtin
+        """
+        level = scope.level
+        get = ast.Attribute(self.constant(GlobalRef(token)), 'get', ast.Load())
+        return ast.Call(get, [self.load(level.ctx),
+                              self.load(level.defctx) if level.defctx else ast.Constant(None)], [])
+
+    def identifier(self, token):
+        try:
+            return self.interpreter.ensure_identifier(token)
+        except SyntaxError as exc:
+            raise NotTranslatable(str(exc))
+
+    def identifiers(self, lst):
+        try:
+            return self.interpreter.ensure_list_of_identifiers(lst)
+        except SyntaxError as exc:
+            raise NotTranslatable(str(exc))
+
+    # translation of the expressions
+
+    def translate_expr(self, expr, scope, tail=False):
+        """ tail is true for the expressions whose value is returned by the
+            function being translated
+        """
+        if isinstance(expr, list):
+            return self.translate_list(expr, scope, tail)
+        elif isinstance(expr, Token):
+            return self.translate_symbol(expr, scope)
+        return self.constant(expr)
+
+    def translate_symbol(self, token, scope):
+        if token.type == Token.TOKEN_IDENTIFIER:
+            name, *members = token.value.split('.')
+            if name in scope:
+                node = self.load(scope[name])
+            else:
+                node = self.global_variable(scope, Token(name))
+
+            for each in members:
+                node = ast.Attribute(node, each, ast.Load())
+            return node
+        elif token.type == Token.TOKEN_LITERAL:
+            return self.constant(token.value)
+        elif token is UNQUOTE:
+            raise NotTranslatable('cannot un-quote outside a quote')
+        elif token.value[0] == "'":
+            return self.constant(Token(token.value[1:]))
+
+        level = scope.level
+        if level.args is not None and re.fullmatch(r'%\d+', token.value):
+            return ast.Subscript(self.load(level.args), ast.Constant(int(token.value[1:])), ast.Load())
+        elif token.value in scope:
+            return self.load(scope[token.value])
+        elif token.value in GLOBALS:
+            return self.global_variable(scope, token)
+        return self.free_variable(scope, '_get', token.value)
+
+    def translate_list(self, expr, scope, tail=False):
+        if not expr:
+            raise NotTranslatable('empty expression')
+
+        name = self.interpreter.form_name(expr[0])
+        if name is None or not hasattr(self.interpreter, 'handle_' + name):
+            return self.translate_call(expr, scope, tail)
+
+        translator = getattr(self, 'translate_' + name, None)
+        if translator is None:
+            raise NotTranslatable('special form %s' % name)
+
+        try:
+            if tail and name in self.TAIL_FORMS:
+                return translator(scope, *expr[1:], tail=True)
+            return translator(scope, *expr[1:])
+        except TypeError as exc:
+            raise NotTranslatable('malformed %s' % name) from exc
+
+    def translate_call(self, expr, scope, tail=False):
+        head = expr[0]
+        if isinstance(head, Token) and head.type == Token.TOKEN_IDENTIFIER and head.value not in scope:
+            if isinstance(self.ctx.get(head.value), Macro):
+                raise NotTranslatable('macro %s' % head.value)
+        elif not isinstance(head, (list, Token)):
+            raise NotTranslatable('cannot call %s' % head)
+
+        children = expr[1:]
+        splat = VARARGS in children
+        if splat and (len(children) < 2 or children[-2] is not VARARGS or VARARGS in children[:-2]):
+            raise NotTranslatable('varargs must be in last position')
+        elif splat:
+            children = children[:-2] + children[-1:]
+
+        # the function and the arguments are evaluated in order, and only once
+        exprs, values = [], []
+        for i, child in enumerate([head] + children):
+            value = self.translate_expr(child, scope)
+            if not isinstance(value, (ast.Constant, ast.Name)):
+                var = self.new_name('_x' if i else '_f')
+                exprs.append(self.assign(var, value))
+                value = self.load(var)
+            values.append(value)
+            if not i:
+                head_exprs, exprs = exprs, []
+
+        fun, args = values[0], values[1:]
+        if splat:
+            args[-1] = ast.Starred(args[-1], ast.Load())
+
+        # python functions are called directly, lispy functions through _call
+        exprs.append(ast.IfExp(
+            test=ast.Call(self.load('isinstance'), [fun, self.load('_lispy')], []),
+            body=self.call_helper('_tail' if tail else '_call', fun, self.context(scope),
+                                  ast.List(args, ast.Load())),
+            orelse=ast.Call(fun, args, []),
+        ))
+
+        # the function can be a macro defined after the translation, which
+        # gets the code of the arguments instead of their values
+        return self.sequence(head_exprs + [ast.IfExp(
+            test=ast.Call(self.load('isinstance'), [fun, self.load('_macro')], []),
+            body=self.call_helper('_expand', fun, self.context(scope), self.constant(expr[1:])),
+            orelse=self.sequence(exprs),
+        )])
+
+    def translate_if(self, scope, cond, iftrue, iffalse, tail=False):
+        return ast.IfExp(self.translate_expr(cond, scope),
+                         self.translate_expr(iftrue, scope, tail),
+                         self.translate_expr(iffalse, scope, tail))
+
+    def translate_do(self, scope, *children, tail=False):
+        if VARARGS in children:
+            raise NotTranslatable('varargs in do')
+        return self.sequence([self.translate_expr(child, scope, tail and i == len(children) - 1)
+                              for i, child in enumerate(children)])
+
+    def translate_let(self, scope, bindings, body, tail=False):
+        if not isinstance(bindings, list) or len(bindings) % 2:
+            raise NotTranslatable('malformed let')
+
+        scope = Scope(scope)
+        exprs = []
+        for target, value in zip(bindings[::2], bindings[1::2]):
+            value = self.translate_expr(value, scope)
+            if isinstance(target, list):
+                exprs.extend(self.unpack(scope, '_unpack', self.identifiers(target), value))
+            else:
+                name = self.identifier(target)
+                scope.names[name] = self.new_variable(name)
+                exprs.append(self.assign(scope.names[name], value))
+
+        exprs.append(self.translate_expr(body, scope, tail))
+        return self.sequence(exprs)
+
+    def unpack(self, scope, helper, names, value):
+        """ binds the names in the scope to the elements of value
+        """
+        bindings = self.new_name('_t')
+        exprs = [self.assign(bindings, self.call_helper(helper, self.constant(names), value))]
+        return exprs + self.bind(scope, names, self.load(bindings))
+
+    def bind(self, scope, names, bindings):
+        """ binds the names in the scope to their values in the bindings dict
+        """
+        flat, stack = [], [names]
+        while stack:
+            for name in stack.pop():
+                if isinstance(name, list):
+                    stack.append(name)
+                else:
+                    flat.append(name)
+
+        exprs = []
+        for name in flat:
+            scope.names[name] = self.new_variable(name)
+            exprs.append(self.assign(scope.names[name], ast.Subscript(
+                bindings, ast.Constant(name), ast.Load()
+            )))
+        return exprs
+
+    def translate_def(self, scope, *children):
+        if scope.parent is not None or scope.level.defctx is not None or len(children) % 2:
+            raise NotTranslatable('def not at the top level')
+
+        exprs = []
+        for name, value in zip(children[::2], children[1::2]):
+            name = self.identifier(name)
+            exprs.append(self.call_helper('_def', self.load(scope.level.ctx), ast.Constant(name),
+                                          self.translate_expr(value, scope)))
+        return self.sequence(exprs)
+
+    def translate_defn(self, scope, name, parameters, body):
+        name = self.identifier(name)
+        if not isinstance(parameters, list):
+            raise NotTranslatable('malformed parameters')
+
+        formal = []
+        for p in parameters:
+            if p is VARARGS:
+                formal.append('&')
+            elif isinstance(p, list):
+                if '&' in formal:
+                    raise NotTranslatable('cannot use packed arguments after vararg')
+                formal.append(self.identifiers(p))
+            else:
+                formal.append(self.identifier(p))
+
+        if '&' in formal and formal.index('&') != len(formal) - 2:
+            raise NotTranslatable('varargs must be in last position')
+
+        global_definition = scope.parent is None and scope.level.defctx is None
+        if global_definition:
+            defctx = scope.level.ctx
+        else:
+            # the function is a local variable, visible in its own body
+            context = self.context(scope)
+            var = self.new_variable(name)
+            scope.names[name] = var
+            defctx = self.new_name('_d')
+
+        level = Level(self.new_name('_c'), defctx)
+        inner = Scope(scope, level)
+        args, vararg, exprs = [level.ctx], None, []
+        for i, p in enumerate(formal):
+            if p == '&':
+                continue
+            elif i > 0 and formal[i - 1] == '&':
+                vararg = self.new_name('_r')
+                inner.names[p] = self.new_variable(p)
+                exprs.append(self.assign(inner.names[p], ast.Call(
+                    self.load('list'), [self.load(vararg)], []
+                )))
+            elif isinstance(p, list):
+                args.append(self.new_name('_p'))
+                exprs.extend(self.unpack(inner, '_unpack_parameter', p, self.load(args[-1])))
+            else:
+                inner.names[p] = self.new_variable(p)
+                args.append(inner.names[p])
+
+        exprs.append(self.translate_expr(body, inner, tail=True))
+        native = ast.Lambda(self.arguments(args, vararg), self.sequence(exprs))
+
+        if global_definition:
+            return self.call_helper('_defn', self.load(defctx), ast.Constant(name),
+                                    self.constant(formal), self.constant(body), native)
+
+        return self.assign(var, self.call_helper(
+            '_function', ast.Constant(name), self.constant(formal), self.constant(body),
+            self.assign(defctx, context), native,
+        ))
+
+    def translate_hash(self, scope, *children):
+        children = list(children)
+        defctx = self.new_name('_d')
+        level = Level(self.new_name('_c'), defctx, self.new_name('_a'))
+
+        body = self.translate_expr(children, Scope(scope, level), tail=True)
+        native = ast.Lambda(self.arguments([level.ctx], level.args), body)
+        return self.call_helper('_anonymous', self.assign(defctx, self.context(scope)),
+                                self.constant(children), native)
+
+    def translate_match(self, scope, var, *cases, tail=False):
+        patterns = []
+        for case in cases:
+            if not isinstance(case, list) or len(case) != 2:
+                raise NotTranslatable('malformed match')
+            elif isinstance(case[0], list):
+                patterns.append(self.identifiers(case[0]))
+            else:
+                patterns.append(self.identifier(case[0]))
+
+        matched = self.new_name('_m')
+        result = ast.Constant(None)
+        for i, (names, case) in reversed(list(enumerate(zip(patterns, cases)))):
+            inner = Scope(scope)
+            bindings = ast.Subscript(self.load(matched), ast.Constant(1), ast.Load())
+            exprs = self.bind(inner, names if isinstance(names, list) else [names], bindings)
+            exprs.append(self.translate_expr(case[1], inner, tail))
+
+            result = ast.IfExp(
+                ast.Compare(ast.Subscript(self.load(matched), ast.Constant(0), ast.Load()),
+                            [ast.Eq()], [ast.Constant(i)]),
+                self.sequence(exprs), result,
+            )
+
+        value = self.call_helper('_match', self.translate_expr(var, scope), self.constant(patterns))
+        return self.sequence([self.assign(matched, value), result])
+
+    def translate_quote(self, scope, *children):
+        children = list(children)
+        if not self.has_unquote(children):
+            return self.call_helper('_copy', self.constant(children))
+        return self.quote(children, scope)
+
+    def translate_tick(self, scope, *children):
+        return self.translate_quote(scope, *children)
+
+    def quote(self, template, scope):
+        elts, it = [], iter(template)
+        for cur in it:
+            if isinstance(cur, list):
+                elts.append(self.quote(cur, scope))
+            elif cur is UNQUOTE:
+                try:
+                    elts.append(self.translate_expr(next(it), scope))
+                except StopIteration:
+                    raise NotTranslatable('nothing to un-quote')
+            else:
+                elts.append(self.constant(cur))
+        return ast.List(elts, ast.Load())
+
+    @staticmethod
+    def has_unquote(template):
+        stack = [template]
+        while stack:
+            for x in stack.pop():
+                if x is UNQUOTE:
+                    return True
+                elif isinstance(x, list):
+                    stack.append(x)
+        return False
+
+    def translate_and(self, scope, *children):
+        if VARARGS in children:
+            raise NotTranslatable('varargs in and')
+        elif not children:
+            return ast.Constant(True)
+
+        values = [self.translate_expr(child, scope) for child in children]
+        return ast.IfExp(ast.BoolOp(ast.And(), values) if len(values) > 1 else values[0],
+                         ast.Constant(True), ast.Constant(False))
+
+    def translate_or(self, scope, *children):
+        if VARARGS in children:
+            raise NotTranslatable('varargs in or')
+        elif not children:
+            return ast.Constant(False)
+
+        values = [self.translate_expr(child, scope) for child in children]
+        return ast.IfExp(ast.BoolOp(ast.Or(), values) if len(values) > 1 else values[0],
+                         ast.Constant(True), ast.Constant(False))
+
+    def translate_in(self, scope, item, collection):
+        return ast.Compare(self.translate_expr(item, scope), [ast.In()],
+                           [self.translate_expr(collection, scope)])
+
+    def translate_dollar(self, scope, val):
+        name = val.value if isinstance(val, Token) else val
+        if not isinstance(name, str):
+            raise NotTranslatable('malformed $')
+        elif name in scope:
+            return self.load(scope[name])
+        return self.free_variable(scope, '_lookup', name)
+
+    def translate_dot(self, scope, member, obj):
+        return self.call_helper('_dot', self.translate_expr(obj, scope),
+                                ast.Constant(self.identifier(member)))
+
+    def translate_comment(self, scope, *children):
+        return ast.Constant(None)
+
+    def translate_thread_last(self, scope, value, *forms, tail=False):
+        expr = [Token('->>'), value, *forms]
+        fused, nested = thread_last(expr, self.ctx, scope), thread_last(expr, fuse=False)
+        if fused == nested:
+            return self.translate_expr(nested, scope, tail)
+
+        # the fused stages are used until one of the globals they call is bound
+        version = ast.Attribute(self.load('_inlined'), 'version', ast.Load())
+        return ast.IfExp(ast.Compare(version, [ast.Eq()], [ast.Constant(INLINED.version)]),
+                         self.translate_expr(fused, scope, tail),
+                         self.translate_expr(nested, scope, tail))
+
+    def translate_map(self, scope, fn, coll):
+        return self.call_helper('_map', self.translate_expr(fn, scope),
+                                self.translate_expr(coll, scope), self.context(scope))
+
+    def translate_filter(self, scope, fn, coll):
+        return self.call_helper('_filter', self.translate_expr(fn, scope),
+                                self.translate_expr(coll, scope), self.context(scope))
+
+    def translate_reduce(self, scope, fn, initial, *items):
+        splat = VARARGS in items
+        if splat and (len(items) < 2 or items[-2] is not VARARGS or VARARGS in items[:-2]):
+            raise NotTranslatable('varargs must be in last position')
+
+        args = [self.translate_expr(fn, scope), self.translate_expr(initial, scope), self.context(scope),
+                ast.List([self.translate_expr(item, scope) for item in (items[:-2] if splat else items)],
+                         ast.Load())]
+        if splat:
+            # iterated, not unpacked, so that lazy sequences are not kept in memory
+            args.append(self.translate_expr(items[-1], scope))
+        return self.call_helper('_reduce', *args)
+
+
+class PythonInterpreter(IterativeInterpreter):
+    """ translates every expression given to evaluate to python, falling back
+        to IterativeInterpreter when that is not possible. if emit is a file,
+        the python code is written to it
+    """
+
+    # translated expressions are cached by identity
+    CACHE_SIZE = 2 ** 12
+
+    def __init__(self, ctx=None, with_stdlib=False, engine=None, optimize=False):
+        super(PythonInterpreter, self).__init__(ctx, with_stdlib, optimize=optimize)
+        self.translator = Translator(self)
+        self.translated = {}
+        self.emit = None
+        self.interpreting = 0  # calls that interpret translated functions, see run_async
+
+    def evaluate(self, expr, ctx=None):
+        ctx = ctx or self.ctx
+        expr = self.prepare(expr, ctx)
+
+        if not isinstance(expr, list):
+            return super(PythonInterpreter, self).evaluate(expr, ctx)
+
+        entry = self.translated.get(id(expr))
+        if entry is None:
+            entry = (expr, self.translate(expr, ctx))
+            if len(self.translated) >= self.CACHE_SIZE:
+                self.translated.clear()
+            self.translated[id(expr)] = entry
+
+        form = entry[1]
+        if form is None:
+            return super(PythonInterpreter, self).evaluate(expr, ctx)
+        return ensure_not_recur(form(ctx))
+
+    async def run_async(self, gen):
+        """ like IterativeInterpreter.run_async, but the translated functions
+            are interpreted, since their python code cannot be suspended by
+            (await ...)
+        """
+        self.interpreting += 1
+        try:
+            return await super(PythonInterpreter, self).run_async(gen)
+        finally:
+            self.interpreting -= 1
+
+    def call_function(self, fun, ctx, args):
+        if self.interpreting and isinstance(fun, (CompiledFunction, CompiledAnonymousFunction)):
+            yield TailCodeResult(fun.interpret(ctx, args), ctx)
+        else:
+            yield from super(PythonInterpreter, self).call_function(fun, ctx, args)
+
+    def translate(self, expr, ctx):
+        try:
+            form, source = self.translator.translate(expr, ctx)
+        except NotTranslatable as exc:
+            form, source = None, '# not translated (%s)' % exc
+
+        if self.emit is not None:
+            lispy = ExpressionTree.print_short_format(expr)
+            print('# %s\n%s\n' % (lispy, source), file=self.emit)
+        return form
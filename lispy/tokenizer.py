@@ -1,4 +1,16 @@
+import codecs
+import itertools
+import re
+import sys
+
+
 class Token:
+    """ tokens are immutable. all tokens except literals are interned, so that
+        there is only one token with a given value and type, and comparing or
+        hashing them is as fast as comparing or hashing their identity
+    """
+    __slots__ = ('value', 'type')
+
     TOKEN_EXPR_BEGIN = 1
     TOKEN_EXPR_END = 2
     TOKEN_LITERAL = 3
@@ -9,9 +21,22 @@ class Token:
                               'ABCDEFGHIJKLMNOPQRSTUVWXYZ_')
     TOKEN_LITERAL_START = '".0123456789'
 
-    def __init__(self, value, type_=None):
-        self.value = value
-        self.type = type_ or Token.guess_token_type(value[0])
+    SYMBOLS = {}
+
+    def __new__(cls, value, type_=None):
+        type_ = type_ or Token.guess_token_type(value[0])
+        if type_ != Token.TOKEN_LITERAL:
+            token = Token.SYMBOLS.get((value, type_))
+            if token is not None:
+                return token
+            value = sys.intern(value)
+
+        token = super(Token, cls).__new__(cls)
+        token.value = value
+        token.type = type_
+        if type_ != Token.TOKEN_LITERAL:
+            Token.SYMBOLS[value, type_] = token
+        return token
 
     @staticmethod
     def guess_token_type(initial_char):
@@ -33,9 +58,20 @@ class Token:
         return "'%s" % self.value
 
     def __eq__(self, other):
-        return (isinstance(other, Token)
-                and other.value == self.value
-                and other.type == self.type)
+        if self is other:
+            return True
+        return (self.type == Token.TOKEN_LITERAL
+                and isinstance(other, Token)
+                and other.type == Token.TOKEN_LITERAL
+                and other.value == self.value)
+
+    def __hash__(self):
+        if self.type == Token.TOKEN_LITERAL:
+            return hash(self.value)
+        return id(self)
+
+    def __reduce__(self):
+        return Token, (self.value, self.type)
 
 
 class Tokenizer:
@@ -45,9 +81,154 @@ class Tokenizer:
     TOKEN_SPLIT_BEFORE = '*&=/<>'
     TOKEN_SPLIT_AFTER = '-+*/&=><'
 
+    # a string literal, as long as it is terminated and does not contain parentheses
+    STRING_PATTERN = re.compile(r'("[^"()]*(?:(?<=\\)"[^"()]*)*(?<!\\)")')
+    STRING_START_PATTERN = re.compile(r'"[^"()]*(?:(?<=\\)"[^"()]*)*')
+
+    NUMBER_HINT = re.compile(r'\d|nan|inf', re.IGNORECASE)
+
+    # the last whitespace or parenthesis
+    LAST_SEPARATOR = re.compile(r'[\s()][^\s()]*$')
+
+    CHUNK_SIZE = 2 ** 16
+
+    _split_patterns = {}
+
+    def split_pattern(self):
+        """ regular expression matching the parts of a word that are
+            separated by the rules in TOKEN_SPLIT_BEFORE/TOKEN_SPLIT_AFTER
+        """
+        key = (self.TOKEN_SPLIT_BEFORE, self.TOKEN_SPLIT_AFTER)
+        if key not in Tokenizer._split_patterns:
+            alnum = r'[^\W_]'  # same as str.isalnum
+            split = r'(?<=%s)[%s]|(?<=[%s])%s' % (
+                alnum, re.escape(self.TOKEN_SPLIT_AFTER),
+                re.escape(self.TOKEN_SPLIT_BEFORE), alnum,
+            )
+            Tokenizer._split_patterns[key] = re.compile(r'.(?:(?!%s).)*' % split, re.S)
+        return Tokenizer._split_patterns[key]
 
     def tokenize(self, string):
-        cur_token = None
+        """ produces the same tokens as tokenize_chars, but cuts the source
+            around strings and whitespace and parses every distinct piece of
+            text only once; tokens with the same text are shared.
+
+            strings containing parentheses or missing the closing quote are
+            rare and awkward to handle, so they are left to tokenize_chars
+        """
+        texts, rest = [], None
+
+        parts = self.STRING_PATTERN.split(string)
+        offset = 0
+        for i in range(0, len(parts), 2):
+            code = parts[i]
+            if '"' in code:
+                quote = code.index('"')
+                rest = string[offset + quote:]
+                code = code[:quote]
+
+            texts.extend(code.replace('(', ' ( ').replace(')', ' ) ').split())
+            if rest is not None:
+                break
+            elif i + 1 < len(parts):
+                texts.append(parts[i + 1])
+                offset += len(code) + len(parts[i + 1])
+
+        parsed = dict.fromkeys(texts)
+        for text in parsed:
+            parsed[text] = self.parse_text(text)
+
+        tokens = itertools.chain.from_iterable(map(parsed.__getitem__, texts))
+        if rest is not None:
+            tokens = itertools.chain(tokens, self.tokenize_chars(rest))
+        return tokens
+
+    def tokenize_stream(self, source, chunk_size=None):
+        """ tokenizes a file object (text or binary) or a memory map reading a
+            chunk at a time, so that tokens can be consumed before the whole
+            source is read.
+
+            every chunk is tokenized up to the last point where no token can be
+            cut in half, the rest is kept and prepended to the next chunk
+        """
+        chunks = self.read_chunks(source, chunk_size or self.CHUNK_SIZE)
+        buffer = ''
+        for chunk in chunks:
+            buffer += chunk
+            cut, in_string = self.safe_cut(buffer)
+            yield from self.tokenize(buffer[:cut])
+            buffer = buffer[cut:]
+
+            if in_string:
+                # only tokenize_chars knows what to do with parentheses in strings
+                rest = itertools.chain(buffer, itertools.chain.from_iterable(chunks))
+                yield from self.tokenize_chars(rest)
+                return
+
+        yield from self.tokenize(buffer)
+
+    @staticmethod
+    def read_chunks(source, chunk_size):
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            elif isinstance(chunk, (bytes, bytearray)):
+                chunk = decoder.decode(chunk)
+            yield chunk
+        yield decoder.decode(b'', final=True)
+
+    def safe_cut(self, string):
+        """ returns a position in the string such that tokenizing the string up
+            to it gives the same tokens as tokenizing the whole source, and
+            whether a parenthesis was found inside a string before that position
+        """
+        # only look at the code before the first string that cannot be matched,
+        # either because it is not complete yet or because it contains parentheses
+        parts = self.STRING_PATTERN.split(string)
+        offset = 0
+        for i in range(0, len(parts), 2):
+            code = parts[i]
+            if '"' in code:
+                quote = offset + code.index('"')
+                end = self.STRING_START_PATTERN.match(string, quote).end()
+                if end < len(string):
+                    return quote, True
+                code = code[:code.index('"')]
+                break
+            elif i + 1 < len(parts):
+                offset += len(code) + len(parts[i + 1])
+
+        match = self.LAST_SEPARATOR.search(code)
+        if match is None:
+            return offset, False
+        return offset + match.start() + 1, False
+
+    def parse_text(self, text):
+        if text == '(':
+            return (Token(text, Token.TOKEN_EXPR_BEGIN),)
+        elif text == ')':
+            return (Token(text, Token.TOKEN_EXPR_END),)
+        elif text[0] == '"':
+            return (Token(self.unescape(text[1:-1]), Token.TOKEN_LITERAL),)
+
+        tokens = []
+        for piece in self.split_pattern().findall(text):
+            # int() and float() will fail anyways without these
+            if self.NUMBER_HINT.search(piece) or piece in ('true', 'false'):
+                succ, val = self.tryparse(piece)
+                if succ:
+                    tokens.append(Token(val, Token.TOKEN_LITERAL))
+                    continue
+            tokens.append(Token(piece))
+        return tuple(tokens)
+
+    def tokenize_chars(self, string):
+        """ the original tokenizer, going through the source one character at
+            a time. slow, but it is the reference for the behavior of tokenize
+        """
+        cur_value = cur_type = None
         inside_quotes = False
         prev_char = None
 
@@ -67,45 +248,41 @@ class Tokenizer:
             elif char == '"' and inside_quotes and prev_char != '\\':
                 new_type = -1
                 inside_quotes = False
-                cur_token.value += '"'
+                cur_value += '"'
             elif char.isspace() and not inside_quotes:
                 new_type = -1
 
-            elif (cur_token
-                  and ((cur_token.value[-1].isalnum() and char in self.TOKEN_SPLIT_AFTER)
-                      or cur_token.value[-1] in self.TOKEN_SPLIT_BEFORE and char.isalnum())
+            elif (cur_value is not None
+                  and ((cur_value[-1].isalnum() and char in self.TOKEN_SPLIT_AFTER)
+                      or cur_value[-1] in self.TOKEN_SPLIT_BEFORE and char.isalnum())
                   and not inside_quotes):
 
                 new_type = Token.guess_token_type(char)
-            elif not cur_token:
+            elif cur_value is None:
                 new_type = Token.guess_token_type(char)
 
             if new_type is not None:
-                if cur_token:
-                    succ, val = self.tryparse(cur_token.value)
-                    cur_token.value = val
-                    if succ:
-                        cur_token.type = Token.TOKEN_LITERAL
-                    yield cur_token
-
-                if new_type >= 0:
-                    cur_token = Token(char, new_type)
-                    if singleton:
-                        yield cur_token
-                        cur_token = None
+                if cur_value is not None:
+                    yield self.make_token(cur_value, cur_type)
+
+                if new_type >= 0 and singleton:
+                    yield Token(char, new_type)
+                    cur_value = None
+                elif new_type >= 0:
+                    cur_value, cur_type = char, new_type
                 else:
-                    cur_token = None
-            elif cur_token:
-                cur_token.value += char
+                    cur_value = None
+            elif cur_value is not None:
+                cur_value += char
 
             prev_char = char
 
-        if cur_token is not None:
-            succ, val = self.tryparse(cur_token.value)
-            cur_token.value = val
-            if succ:
-                cur_token.type = Token.TOKEN_LITERAL
-            yield cur_token
+        if cur_value is not None:
+            yield self.make_token(cur_value, cur_type)
+
+    def make_token(self, value, type_):
+        succ, val = self.tryparse(value)
+        return Token(val, Token.TOKEN_LITERAL if succ else type_)
 
     def tryparse(self, value):
         try:
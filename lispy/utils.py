@@ -1,19 +1,44 @@
+import types
+
+from lispy.cache import read_expr_cached
 from lispy.context import ExecutionContext
 from lispy.expression import ExpressionTree
 from lispy.tokenizer import Tokenizer
 from lispy.stdlib import STDLIB
 
 
+def read_expr(program):
+    """ parses the program one top-level expression at a time. the program
+        is a string, or a file object / memory map that is read in chunks
+    """
+    if isinstance(program, str):
+        tokens = Tokenizer().tokenize(program)
+    else:
+        tokens = Tokenizer().tokenize_stream(program)
+    return ExpressionTree.iter_from_tokens(tokens)
+
+
 def parse_expr(program):
-    tokens = Tokenizer().tokenize(program)
-    return ExpressionTree.from_tokens(tokens)
+    return list(read_expr(program))
 
 
 def eval_expr(program, inpr=None):
-    program = parse_expr(program)
+    return eval_forms(read_expr(program), inpr)
+
+
+def eval_file(path, inpr=None, cache=True, cache_dir=None):
+    """ evaluates the file at the given path, using the parsed expressions
+        cached on disk if they are still valid
+    """
+    if not cache:
+        with open(path, 'rb') as f:
+            return eval_expr(f, inpr)
+    return eval_forms(read_expr_cached(path, cache_dir), inpr)
+
 
+def eval_forms(expressions, inpr=None):
     result = None
-    for expression in program:
+    for expression in expressions:
         try:
             result = inpr.evaluate(expression)
         except:
@@ -25,3 +50,30 @@ def eval_expr(program, inpr=None):
 def load_stdlib(inpr):
     eval_expr(STDLIB, inpr)
     return inpr
+
+
+_frozen_stdlib = None
+
+
+def frozen_stdlib():
+    """ context with the standard library, evaluated once per process.
+        its bindings are read-only, interpreters add their own context on
+        top of it so that redefinitions stay in the interpreter
+    """
+    global _frozen_stdlib
+    if _frozen_stdlib is None:
+        from lispy.context import INLINED, SHADOWED
+        from lispy.interpreter import IterativeInterpreter
+        from lispy.resolver import inlinable
+
+        bound = set(SHADOWED)
+        ctx = load_stdlib(IterativeInterpreter()).ctx
+        ctx.bindings = types.MappingProxyType(ctx.bindings)
+        _frozen_stdlib = ctx
+
+        # the functions whose names were not bound before can be inlined,
+        # until their names are bound again
+        for name, value in ctx.bindings.items():
+            if name not in bound and inlinable(value):
+                INLINED[name] = value
+    return _frozen_stdlib
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from lispy.interpreter import IterativeInterpreter
+from lispy.utils import eval_expr, parse_expr
+
+
+ENGINES = ['coroutine', 'closure', 'python', 'cek']
+
+
+def make_interpreter(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    inpr.ctx['sleep'] = asyncio.sleep
+    eval_expr('''
+        (defn slow (n) (do (await (sleep 0.2)) (* n n)))
+        (defn g (n) (+ 1 (slow n)))
+        (defn h (xs) (map slow xs))
+    ''', inpr)
+    return inpr
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_evaluate_async(engine):
+    inpr = make_interpreter(engine)
+    ticks = []
+
+    async def ticker():
+        for _ in range(3):
+            ticks.append(len(ticks))
+            await asyncio.sleep(0)
+
+    async def main():
+        # the evaluations wait at the same time
+        start = time.monotonic()
+        values = await asyncio.gather(*(inpr.evaluate_async(parse_expr('(slow %d)' % n)[0]) for n in range(5)))
+        assert values == [0, 1, 4, 9, 16]
+        assert time.monotonic() - start < 0.6
+
+        # long evaluations let other tasks run
+        expr, = parse_expr('(loop (i 0) (if (< i 5000) (recur (+ i 1)) i))')
+
+        async def evaluate():
+            return await inpr.evaluate_async(expr), len(ticks)
+
+        (value, ticked), _ = await asyncio.gather(evaluate(), ticker())
+        assert value == 5000 and ticked == 3
+
+        # functions waiting in the functions they call
+        assert await inpr.evaluate_async(parse_expr('(g 3)')[0]) == 10
+        assert await inpr.evaluate_async(parse_expr('(h (list 1 2))')[0]) == [1, 4]
+
+        assert await inpr.evaluate_async(parse_expr('(await (future + 1 2))')[0]) == 3
+        assert await inpr.evaluate_async(parse_expr('(+ 1 2)')[0]) == 3
+
+        with pytest.raises(ZeroDivisionError):
+            await inpr.evaluate_async(parse_expr('(await (future / 1 0))')[0])
+
+        # evaluate cannot wait while the event loop is running
+        with pytest.raises(RuntimeError):
+            inpr.evaluate(parse_expr('(slow 1)')[0])
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_await_outside_event_loop(engine):
+    inpr = make_interpreter(engine)
+    assert eval_expr('(slow 3)', inpr) == 9
+    assert eval_expr('(g 3)', inpr) == 10
+    assert eval_expr('(+ 1 (await (future + 1 2)))', inpr) == 4
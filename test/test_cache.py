@@ -0,0 +1,127 @@
+import os
+import tracemalloc
+
+from lispy.cache import HEADER, cache_path, read_expr_cached
+from lispy.expression import ExpressionTree
+from lispy.interpreter import IterativeInterpreter
+from lispy.stdlib import STDLIB
+from lispy.tokenizer import Tokenizer
+from lispy.utils import eval_file, parse_expr, read_expr
+
+
+def test_round_trip(tmp_path):
+    source = tmp_path / 'stdlib.lispy'
+    source.write_text(STDLIB + '(print "àè ì" 1.5 true)\n42\n')
+
+    cold = list(read_expr_cached(str(source)))
+    assert os.path.exists(cache_path(str(source)))
+    warm = list(read_expr_cached(str(source)))
+
+    expected = parse_expr(STDLIB + '(print "àè ì" 1.5 true)\n42\n')
+    for forms in (cold, warm):
+        assert len(forms) == len(expected)
+        for form, exp in zip(forms, expected):
+            assert type(form) is type(exp)
+            if isinstance(form, ExpressionTree):
+                assert form.children == exp.children
+            else:
+                assert form == exp
+
+
+def test_warm_load_does_not_tokenize(tmp_path, monkeypatch):
+    source = tmp_path / 'prog.lispy'
+    source.write_text('(def x 1) (+ x 1)')
+    list(read_expr_cached(str(source)))
+
+    def fail(*args, **kwargs):
+        raise AssertionError('tokenized a cached file')
+
+    monkeypatch.setattr(Tokenizer, 'tokenize', fail)
+    monkeypatch.setattr(Tokenizer, 'tokenize_stream', fail)
+    assert eval_file(str(source), IterativeInterpreter()) == 2
+
+
+def test_invalidation(tmp_path):
+    source = tmp_path / 'prog.lispy'
+    source.write_text('(+ 1 1)')
+    stat = os.stat(source)
+    assert eval_file(str(source), IterativeInterpreter()) == 2
+
+    # same size and modification time, different content
+    source.write_text('(+ 1 2)')
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert eval_file(str(source), IterativeInterpreter()) == 3
+
+    source.write_text('(+ 10 20)')
+    assert eval_file(str(source), IterativeInterpreter()) == 30
+    assert eval_file(str(source), IterativeInterpreter()) == 30
+
+
+def test_cache_dir(tmp_path):
+    source = tmp_path / 'prog.lispy'
+    source.write_text('(+ 1 1)')
+    cache_dir = tmp_path / 'cache'
+
+    assert eval_file(str(source), IterativeInterpreter(), cache_dir=str(cache_dir)) == 2
+    assert os.listdir(cache_dir) == [os.path.basename(cache_path(str(source), str(cache_dir)))]
+    assert not os.path.exists(tmp_path / '__lispycache__')
+
+    assert eval_file(str(source), IterativeInterpreter(), cache=False) == 2
+    assert not os.path.exists(tmp_path / '__lispycache__')
+
+
+def test_corrupt_cache(tmp_path, monkeypatch):
+    source = tmp_path / 'prog.lispy'
+    source.write_text('(append log 1) (append log 2) (append log 3) (len log)')
+    list(read_expr_cached(str(source)))
+
+    cached = cache_path(str(source))
+    with open(cached, 'rb') as f:
+        data = f.read()
+
+    tokenize_stream = Tokenizer.tokenize_stream
+    for corrupt in (data[:-3], data[:-12] + b'\xff' * 12, data[:HEADER.size] + b'\x00' * 20):
+        with open(cached, 'wb') as f:
+            f.write(corrupt)
+
+        # parsed again and cached, without evaluating twice what was loaded
+        inpr = IterativeInterpreter(with_stdlib=True)
+        inpr.ctx['log'] = log = []
+        assert eval_file(str(source), inpr) == 3 and log == [1, 2, 3]
+        with open(cached, 'rb') as f:
+            assert f.read() == data
+
+        monkeypatch.setattr(Tokenizer, 'tokenize_stream', None)
+        inpr.ctx['log'] = []
+        assert eval_file(str(source), inpr) == 3
+        monkeypatch.setattr(Tokenizer, 'tokenize_stream', tokenize_stream)
+
+
+def test_syntax_error_not_cached(tmp_path):
+    source = tmp_path / 'prog.lispy'
+    source.write_text('(+ 1 1')
+    try:
+        list(read_expr_cached(str(source)))
+    except SyntaxError:
+        pass
+    assert not os.path.exists(cache_path(str(source)))
+    assert os.listdir(tmp_path / '__lispycache__') == []
+
+
+def test_bounded_memory(tmp_path):
+    source = tmp_path / 'big.lispy'
+    source.write_text(''.join('(def x (+ %d (* 2 (list "abc" y z))))\n' % i for i in range(10000)))
+
+    def peak(expressions):
+        tracemalloc.start()
+        for _ in expressions:
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    with open(source, 'rb') as f:
+        uncached = peak(read_expr(f))
+    cold = peak(read_expr_cached(str(source)))
+    warm = peak(read_expr_cached(str(source)))
+    assert cold < 2 * uncached and warm < 2 * uncached
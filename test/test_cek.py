@@ -0,0 +1,44 @@
+import pytest
+
+from lispy.cek import CEKInterpreter
+from lispy.interpreter import IterativeInterpreter
+from lispy.utils import eval_expr
+
+# run the tests of the interpreter and of the standard library with this engine too
+from test.test_interpreter import *  # noqa: F401,F403
+from test.test_stdlib import *  # noqa: F401,F403
+
+
+@pytest.fixture(autouse=True)
+def cek_engine(monkeypatch):
+    monkeypatch.setattr(IterativeInterpreter, 'DEFAULT_ENGINE', 'cek')
+
+
+def test_engine():
+    assert type(IterativeInterpreter()) is CEKInterpreter
+
+
+def test_deep_expression():
+    inpr = IterativeInterpreter()
+    assert eval_expr('(+ 1 ' * 10000 + '0' + ')' * 10000, inpr) == 10000
+
+
+def test_deep_recursion():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))', inpr)
+    assert eval_expr('(count 20000)', inpr) == 20000
+
+
+def test_legacy_forms():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x) (match x ((a b) (list b a))))', inpr)
+    assert eval_expr('(map f (list (list 1 2) (list 3 4)))', inpr) == [[2, 1], [4, 3]]
+    assert eval_expr('(filter (# in %0 (list 1 3)) (list 1 2 3))', inpr) == [1, 3]
+
+
+def test_stacktrace(capsys):
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x) (+ 1 (g x)))', inpr)
+    with pytest.raises(NameError):
+        eval_expr('(f 1)', inpr)
+    assert 'Exception happened here: (g x)' in capsys.readouterr().out
@@ -0,0 +1,51 @@
+import pytest
+
+from lispy.compiler import ClosureInterpreter
+from lispy.interpreter import IterativeInterpreter
+from lispy.utils import eval_expr
+
+# run the tests of the interpreter and of the standard library with this engine too
+from test.test_interpreter import *  # noqa: F401,F403
+from test.test_stdlib import *  # noqa: F401,F403
+
+
+@pytest.fixture(autouse=True)
+def closure_engine(monkeypatch):
+    monkeypatch.setattr(IterativeInterpreter, 'DEFAULT_ENGINE', 'closure')
+
+
+def test_engine():
+    assert type(IterativeInterpreter()) is ClosureInterpreter
+    assert type(IterativeInterpreter(engine='coroutine')) is IterativeInterpreter
+
+    with pytest.raises(ValueError):
+        IterativeInterpreter(engine='magic')
+
+
+def test_compiled_once():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn double (x) (* 2 x))', inpr)
+    body = inpr.ctx['double'].code
+
+    eval_expr('(double 1)', inpr)
+    node = inpr.compile(body)
+    eval_expr('(double 2)', inpr)
+    assert inpr.compile(body) is node
+
+
+def test_deep_expression():
+    inpr = IterativeInterpreter()
+    assert eval_expr('(+ 1 ' * 10000 + '0' + ')' * 10000, inpr) == 10000
+
+
+def test_malformed_forms():
+    inpr = IterativeInterpreter()
+    with pytest.raises(SyntaxError):
+        eval_expr('(if 1 2)', inpr)
+
+    with pytest.raises(SyntaxError):
+        eval_expr('(let (1 2) 3)', inpr)
+
+    # only raised when evaluated
+    assert eval_expr('(if true 1 (if 1 2))', inpr) == 1
+
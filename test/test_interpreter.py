@@ -1,6 +1,10 @@
+import io
+import mmap
+
 import pytest
 
 from lispy.context import ExecutionContext
+from lispy.expression import ExpressionTree
 from lispy.interpreter import IterativeInterpreter
 from lispy.utils import eval_expr, parse_expr
 from lispy.globals import GLOBALS
@@ -139,7 +143,9 @@ def test_quote():
     inpr = IterativeInterpreter()
 
     def t(val):
-        return Token(val, Token.guess_token_type(str(val)[0]))
+        if isinstance(val, str):
+            return Token(val, Token.guess_token_type(val[0]))
+        return val  # literals are unboxed
 
     assert eval_expr('(quote + 1 2)', inpr) == [t('+'), t(1), t(2)]
     assert eval_expr('(quote 1 2 (3 (4 5) 6) 7)', inpr) == [
@@ -157,7 +163,7 @@ def test_macro():
     assert eval_expr('(let (i 1) (infix (i + 1)))', inpr) == 2
 
     assert eval_expr('(macroexpand infix (1 + 1))', inpr) == [
-        Token('+', Token.TOKEN_OTHER), Token(1, Token.TOKEN_LITERAL), Token(1, Token.TOKEN_LITERAL)
+        Token('+', Token.TOKEN_OTHER), 1, 1
     ]
 
     assert eval_expr('(infix (1 + 1))', inpr) == 2
@@ -225,4 +231,195 @@ def test_match():
     assert eval_expr(match % '4', inpr) == -1
 
     with pytest.raises(RuntimeError):
-        eval_expr('(match (list 1 2) ((a) 1))', inpr)
\ No newline at end of file
+        eval_expr('(match (list 1 2) ((a) 1))', inpr)
+
+
+def test_eval_stream():
+    inpr = IterativeInterpreter()
+    assert eval_expr(io.StringIO('(def x 1) (def y (+ x 1)) (+ x y)'), inpr) == 3
+
+    # expressions are evaluated as soon as they are parsed
+    with pytest.raises(SyntaxError):
+        eval_expr(io.StringIO('(def z 1) (+ z'), inpr)
+    assert inpr.ctx['z'] == 1
+
+
+def test_eval_mmap(tmp_path):
+    path = tmp_path / 'program.lispy'
+    path.write_text('(defn double (x) (* 2 x)) (double 21)')
+
+    inpr = IterativeInterpreter()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert eval_expr(mm, inpr) == 42
+
+
+def test_unboxed_literals():
+    expr = parse_expr('(f 1 2.5 "three" true)')[0]
+    assert expr.children[1:] == [1, 2.5, 'three', True]
+    assert all(type(x) is not Token for x in expr.children[1:])
+
+
+def test_deep_nesting():
+    depth = 100000
+    inpr = IterativeInterpreter()
+    expr, = parse_expr('(quote ' + '(' * depth + ')' * depth + ')')
+    result = inpr.evaluate(expr)
+    assert ExpressionTree.to_string(result) == '(' * (depth + 1) + ')' * (depth + 1)
+
+
+def test_evaluate_parsed_lists():
+    inpr = IterativeInterpreter()
+    expr, = parse_expr('(+ 1 (* 2 3))')
+    assert isinstance(expr.children[2], list)
+    assert inpr.evaluate(expr) == inpr.evaluate(expr.children) == 7
+    assert eval_expr('1 "a" (def x 3) x', inpr) == 3
+
+
+def test_tail_calls():
+    inpr = IterativeInterpreter()
+    depths = []
+    inpr.ctx['depth'] = lambda: depths.append(len(inpr.operation_stack))
+
+    assert eval_expr('''
+        (defn count_up (i acc)
+            (if (= i 0) acc
+                (do (depth) (count_up (- i 1) (+ acc 1)))))
+        (count_up 10000 0)
+    ''', inpr) == 10000
+    assert len(set(depths)) == 1
+
+    depths.clear()
+    assert eval_expr('''
+        (defn countdown (i)
+            (let (j (- i 1))
+                (match (list j)
+                    ((k) (if (= k 0) 0 (do (depth) (countdown k)))))))
+        (countdown 200)
+    ''', inpr) == 0
+    assert len(set(depths)) == 1
+
+
+def test_mutual_tail_calls():
+    inpr = IterativeInterpreter()
+    assert eval_expr('''
+        (defn even (n) (if (= n 0) true (odd (- n 1))))
+        (defn odd (n) (if (= n 0) false (even (- n 1))))
+        (even 20000)
+    ''', inpr) is True
+
+
+def test_tail_calls_dynamic_bindings():
+    inpr = IterativeInterpreter()
+    assert eval_expr('''
+        (defn f (i) (if (= i 0) y (f (- i 1))))
+        (defn g (y) (f 1000))
+        (g 42)
+    ''', inpr) == 42
+
+
+def test_loop():
+    inpr = IterativeInterpreter()
+    depths = []
+    inpr.ctx['depth'] = lambda: depths.append(len(inpr.operation_stack))
+
+    assert eval_expr('(loop (i 0 acc 1) (if (= i 10) acc (recur (+ i 1) (* acc 2))))', inpr) == 1024
+    assert eval_expr('''
+        (defn sum_to (n)
+            (loop (i 0 acc 0)
+                (if (> i n) acc (do (depth) (recur (+ i 1) (+ acc i))))))
+        (sum_to 10000)
+    ''', inpr) == 50005000
+    assert len(set(depths)) == 1
+
+    assert eval_expr('(loop ((a b) (list 1 2) n 3) (if (= n 0) (list a b) (recur (list b a) (- n 1))))', inpr) == [2, 1]
+    assert eval_expr('(loop (i 0) (if (< i 3) (recur (+ i 1)) (loop (j i) (if (< j 5) (recur (+ j 1)) j))))', inpr) == 5
+
+    with pytest.raises(SyntaxError):
+        eval_expr('(loop (i 0) (if (< i 3) (recur (+ i 1) 2) i))', inpr)
+
+    with pytest.raises(SyntaxError):
+        eval_expr('(loop (i) i)', inpr)
+
+
+def test_recur_outside_loop():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    for program in ('(recur 1)',
+                    '(defn f (x) (recur x)) (f 1)',
+                    '(loop (i 0) (+ 1 (recur i)))',
+                    '(loop (i (recur 1)) i)',
+                    '(loop (i 0) (if (< i 3) (do (recur (+ i 1)) i) i))',
+                    '(defn g (x) (when x (recur x))) (g 1)'):
+        with pytest.raises(SyntaxError, match='recur outside of loop tail position'):
+            eval_expr(program, inpr)
+
+    assert eval_expr('(loop (i 0) (match (list i) ((j) (let (k (+ j 1)) (if (< k 3) (recur k) k)))))', inpr) == 3
+    assert eval_expr('(loop (i 0) (when (< i 3) (recur (+ i 1))))', inpr) is None
+    assert eval_expr('(loop (i 0) (if (< i 3) (recur (+ i 1)) (quote recur i)))', inpr) == [Token('recur'), Token('i')]
+
+
+def test_doseq_dotimes():
+    inpr = IterativeInterpreter()
+    inpr.ctx['acc'] = acc = []
+
+    assert eval_expr('(doseq (x (list 1 2 3)) ((. append acc) (* x x)))', inpr) is None
+    assert acc == [1, 4, 9]
+
+    acc.clear()
+    eval_expr('(doseq ((k v) (list (list 1 2) (list 3 4))) ((. append acc) (+ k v)))', inpr)
+    assert acc == [3, 7]
+
+    acc.clear()
+    eval_expr('(dotimes (i 3) ((. append acc) i) ((. append acc) (* i 10)))', inpr)
+    assert acc == [0, 0, 1, 10, 2, 20]
+
+    acc.clear()
+    eval_expr('(defn f (n) (dotimes (i n) (doseq (j (range i)) ((. append acc) (list i j))))) (f 3)', inpr)
+    assert acc == [[1, 0], [2, 0], [2, 1]]
+
+    with pytest.raises(SyntaxError):
+        eval_expr('(dotimes (i) i)', inpr)
+
+
+def test_def_in_function():
+    inpr = IterativeInterpreter()
+    assert eval_expr('(defn f (x) (let (y 1) (do (def x 5 z 2) (+ x y z)))) (f 1)', inpr) == 8
+    assert 'z' not in inpr.ctx
+
+
+def test_python_calls():
+    inpr = IterativeInterpreter()
+    calls = []
+    inpr.ctx['log'] = lambda *args: calls.append(args) or len(calls)
+
+    # arguments are evaluated once, in order
+    assert eval_expr('(log (log 1) 2 (log 3 (log 4)))', inpr) == 4
+    assert calls == [(1,), (4,), (3, 2), (1, 2, 3)]
+    assert eval_expr('(list & (list 1 2))', inpr) == [1, 2]
+    assert eval_expr('(defmacro m (x) (list (nth x 1) 1 (nth x 0))) (m (2 +))', inpr) == 3
+
+
+def test_atomic_calls():
+    inpr = IterativeInterpreter(engine='coroutine')
+    inpr.ctx['x'] = 2
+    expr, = parse_expr('(+ x 1)')
+    assert inpr.eval(expr.children, inpr.ctx) == 3  # no generator
+
+
+def test_macro_expanded_once():
+    inpr = IterativeInterpreter()
+    expansions = []
+    inpr.ctx['expanding'] = lambda: expansions.append(1)
+
+    eval_expr("(defmacro twice (x) (do (expanding) (list '+ x x)))", inpr)
+    eval_expr('(defn f (n acc) (if (= n 0) acc (f (- n 1) (+ acc (twice n)))))', inpr)
+    assert eval_expr('(f 10 0)', inpr) == 110
+    assert len(expansions) == 1
+
+    # other uses are expanded separately
+    assert eval_expr('(twice 2)', inpr) == 4
+    assert len(expansions) == 2
+
+    # so is the body of f, when the macro is defined again
+    eval_expr("(defmacro twice (x) (do (expanding) (list '* x 2)))", inpr)
+    assert eval_expr('(f 10 0)', inpr) == 110
+    assert len(expansions) == 3
@@ -0,0 +1,124 @@
+import pytest
+
+from lispy.interpreter import VARARGS, IterativeInterpreter, thread_last
+from lispy.lazy import LazySeq
+from lispy.tokenizer import Token
+from lispy.utils import eval_expr, parse_expr
+
+
+ENGINES = ['coroutine', 'closure', 'python', 'cek']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_lazy_map_filter(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    called = []
+    inpr.ctx['record'] = lambda x: called.append(x) or x
+
+    eval_expr('(def xs (map inc (filter (# = 0 (mod (record %0) 2)) (lazy_range 10))))', inpr)
+    assert isinstance(inpr.ctx['xs'], LazySeq) and called == []
+
+    assert eval_expr('(list & (take 2 xs))', inpr) == [1, 3]
+    assert called == [0, 1, 2]
+
+    # every iteration starts again from the source
+    assert eval_expr('(reduce + 0 & xs)', inpr) == 25
+    assert eval_expr('(defn total (s) (reduce + 0 & (drop 3 s))) (total xs)', inpr) == 16
+
+    # other collections are mapped eagerly
+    assert eval_expr('(map inc (list 1 2))', inpr) == [2, 3]
+
+
+def test_long_sequences():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    assert eval_expr('(reduce + 0 & (map (# * 2 %0) (lazy_range 10000)))', inpr) == 2 * sum(range(10000))
+    assert eval_expr('(list & (take 2 (drop 100000 (lazy_range 1000000000))))', inpr) == [100000, 100001]
+
+
+def test_lines(tmp_path):
+    path = tmp_path / 'log.txt'
+    path.write_text('ok 1\nerror 2\r\nok 3\nerror 4')
+
+    inpr = IterativeInterpreter(with_stdlib=True)
+    inpr.ctx['path'] = str(path)
+    eval_expr('(def errors (filter (# (. startswith %0) "error") (lines path)))', inpr)
+    assert eval_expr('(list & errors)', inpr) == ['error 2', 'error 4']
+    assert eval_expr('(len (list & (seq errors)))', inpr) == 2
+
+
+def test_print(capsys):
+    inpr = IterativeInterpreter(with_stdlib=True)
+    eval_expr('(print (take 3 (seq (list 1 (list 2) 3 4))))', inpr)
+    assert capsys.readouterr().out == '(1 (2) 3)\n'
+
+
+def test_thread_last():
+    assert thread_last(parse_expr('(->> x inc (- 1))')[0].children) == [
+        Token('-'), 1, [Token('inc'), Token('x')]
+    ]
+
+    # map, filter, take and drop before a reduce are fused
+    fused = thread_last(parse_expr('(->> xs (map f) (drop 1) (reduce + 0 &))')[0].children)
+    assert fused == [
+        Token('transduce'), [Token('list'), [Token('mapping'), Token('f')], [Token('dropping'), 1]],
+        Token('+'), 0, Token('xs'),
+    ]
+
+    # the others are nested
+    nested = thread_last(parse_expr('(->> xs (map f) (len))')[0].children)
+    assert nested == [Token('len'), [Token('map'), Token('f'), Token('xs')]]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_transduce(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    called = []
+    inpr.ctx['record'] = lambda x: called.append(x) or x
+
+    pipeline = '''(->> (lazy_range 1000000000)
+                       (map record)
+                       (filter (# = 0 (mod %0 3)))
+                       (map inc)
+                       (drop 1)
+                       (take 3)
+                       (reduce + 0 &))'''
+    assert eval_expr(pipeline, inpr) == 4 + 7 + 10
+    assert called == list(range(10))  # stops after the last element taken
+
+    assert eval_expr('(defn f (xs) (->> xs (map inc) (filter zero?) (reduce + 1 &))) (f (list -1 0 -1))', inpr) == 1
+    assert eval_expr('(transduce (+ (mapping inc) (taking 2)) + 0 (list 1 2 3))', inpr) == 5
+    assert eval_expr('(transduce (list (taking 0)) + 0 (list 1 2 3))', inpr) == 0
+    assert eval_expr('(->> (list 1 2 3) (map inc) (filter (# > %0 2)))', inpr) == [3, 4]
+
+
+
+# an engine, a stage of ->>, a global it is fused with, and the sum of the
+# stage on (1 2 3), then when the global is (# list 10)
+FUSED_SHADOWING = [
+    ('coroutine', '(take 2)', 'take', 3, 10),
+    ('closure', '(drop 1)', 'drop', 5, 10),
+    ('python', '(map inc)', 'mapping', 9, 9),
+    ('cek', '(filter (# = 1 (mod %0 2)))', 'filtering', 4, 4),
+]
+
+
+@pytest.mark.parametrize('engine,stage,name,total,value', FUSED_SHADOWING)
+def test_fusion_shadowing(engine, stage, name, total, value):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    expr = parse_expr('(->> xs (take 2) (reduce + 0 &))')[0].children
+    assert thread_last(expr, inpr.ctx, {'take'}) == [
+        Token('reduce'), Token('+'), 0, VARARGS, [Token('take'), 2, Token('xs')]
+    ]
+
+    eval_expr('(defn total (xs) (->> xs %s (reduce + 0 &)))' % stage, inpr)
+    assert eval_expr('(total (list 1 2 3))', inpr) == total
+
+    # not fused where the name is bound, by the function or by its callers
+    eval_expr('(defn h (%s xs) (->> xs %s (reduce + 0 &)))' % (name, stage), inpr)
+    assert eval_expr('(h (# list 10) (list 1 2 3))', inpr) == value
+    eval_expr('(defn g (%s) (total (list 1 2 3)))' % name, inpr)
+    assert eval_expr('(g (# list 10))', inpr) == value
+
+    eval_expr('(def %s (# list 10))' % name, inpr)
+    assert eval_expr('(total (list 1 2 3))', inpr) == value
+    assert eval_expr('(->> (list 1 2 3) %s (reduce + 0 &))' % stage, inpr) == value
@@ -0,0 +1,95 @@
+import pytest
+
+from lispy.interpreter import IterativeInterpreter
+from lispy.memo import MemoCache, freeze
+from lispy.persistent import Vector
+from lispy.utils import eval_expr
+
+
+ENGINES = ['coroutine', 'closure', 'python', 'cek']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_memoize(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    calls = []
+    inpr.ctx['record'] = lambda x: calls.append(x) or x
+
+    eval_expr('(defn fib (n) (if (< (record n) 2) n (+ (fib (- n 1)) (fib (- n 2)))))', inpr)
+    eval_expr('(def fib (memoize fib))', inpr)
+    assert eval_expr('(fib 100)', inpr) == 354224848179261915075
+    assert calls == list(range(100, -1, -1))
+
+    info = eval_expr('(cache_info fib)', inpr)
+    assert (info.hits, info.misses, info.max_size, info.size) == (98, 101, 128, 101)
+
+    calls.clear()
+    assert eval_expr('(fib 50)', inpr) == 12586269025
+    assert calls == []
+
+    eval_expr('(cache_clear fib)', inpr)
+    assert eval_expr('(cache_info fib)', inpr) == (0, 0, 128, 0)
+    assert eval_expr('(fib 3)', inpr) == 2
+    assert calls == [3, 2, 1, 0]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_memoize_arguments(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    calls = []
+    inpr.ctx['record'] = lambda *args: calls.append(args)
+
+    eval_expr('(defn total ((a b) & rest) (do (record a b & rest) (+ a b (len rest))))', inpr)
+    eval_expr('(def total (memoize total))', inpr)
+
+    # lists are compared by content
+    assert eval_expr('(list (total (list 1 2) 3) (total (list 1 2) 3) (total (list 1 2) 3 4))', inpr) == [4, 4, 5]
+    assert calls == [(1, 2, 3), (1, 2, 3, 4)]
+
+    with pytest.raises(RuntimeError):
+        eval_expr('(total (list 1 2 3))', inpr)
+    assert eval_expr('(cache_info total)', inpr).size == 2
+
+    eval_expr('(defn keys (d) (do (record d) (len d)))', inpr)
+    inpr.ctx['keys'] = inpr.ctx['memoize'](inpr.ctx['keys'], 1)
+    inpr.ctx['d'] = {'a': [1, 2]}
+    assert eval_expr('(list (keys d) (keys (dict "a" (list 1 2))) (keys (list 1)) (keys d))', inpr) == [1, 1, 1, 1]
+    assert calls[2:] == [({'a': [1, 2]},), ([1],), ({'a': [1, 2]},)]
+
+    with pytest.raises(TypeError):
+        eval_expr('(memoize +)', inpr)
+
+
+def test_freeze():
+    assert freeze([1, [2, 3]]) == freeze([1, [2, 3]])
+    assert hash(freeze({'a': [1], 'b': {2}})) == hash(freeze({'b': {2}, 'a': [1]}))
+    assert freeze([1, 2]) != freeze((1, 2)) != freeze(Vector([1, 2]))
+
+
+def test_memo_cache(monkeypatch):
+    cache = MemoCache(max_size=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)  # b is the least recently used
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    with pytest.raises(KeyError):
+        cache.get('b')
+
+    now = [0]
+    monkeypatch.setattr('lispy.memo.time.monotonic', lambda: now[0])
+    cache = MemoCache(max_size=None, ttl=10)
+    cache.put('a', 1)
+    now[0] = 5
+    assert cache.get('a') == 1
+    now[0] = 10
+    with pytest.raises(KeyError):
+        cache.get('a')
+    assert cache.info().size == 0
+
+
+def test_stacktrace(capsys):
+    inpr = IterativeInterpreter(with_stdlib=True, engine='coroutine')
+    with pytest.raises(ZeroDivisionError):
+        eval_expr('(defn f (x y) (+ 1 (/ x y))) (def g (memoize f)) (defn h (n) (+ 1 (g n 0))) (h 4)', inpr)
+    assert '  (f x=4 y=0)\n' in capsys.readouterr().out
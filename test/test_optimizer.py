@@ -0,0 +1,72 @@
+from lispy.interpreter import IterativeInterpreter
+from lispy.optimizer import Constant, optimize
+from lispy.tokenizer import Token
+from lispy.utils import eval_expr, parse_expr
+
+
+def optimized(program, inpr=None):
+    inpr = inpr or IterativeInterpreter()
+    expr, = parse_expr(program)
+    return optimize(expr.children, inpr.ctx)
+
+
+def test_folding():
+    assert optimized('(* 60 60 24)') == 86400
+    assert optimized('(+ 1 (* 2 3) (- 4 1))') == 10
+    assert optimized('(< 1 2)') is True
+
+    # only literal arguments are folded
+    assert optimized('(+ x (* 2 3))') == [Token('+'), Token('x'), 6]
+    assert optimized('(/ 1 0)') == [Token('/'), 1, 0]
+
+
+def test_partial_evaluation():
+    assert optimized('(if (> 2 1) a b)') is Token('a')
+    assert optimized('(defn f (x) (if (= 1 2) x (+ 1 1)))')[3] == 2
+    assert optimized('(do (comment a) (f 1) (comment b))') == [Token('do'), [Token('f'), 1], None]
+
+
+def test_quoted_forms():
+    folded = optimized("(' a (b c) 1)")
+    assert type(folded[0]) is Constant
+    assert optimized('(quote a ~(f))') == [Token('quote'), Token('a'), Token('~'), [Token('f')]]
+
+    inpr = IterativeInterpreter(optimize=True)
+    eval_expr('(defn f () (list 1 (quote a (b))))', inpr)
+    first, second = eval_expr('(f)', inpr), eval_expr('(f)', inpr)
+    assert first == second == [1, [Token('a'), [Token('b')]]]
+    assert first is not second and first[1][1] is not second[1][1]
+
+
+def test_shadowing():
+    inpr = IterativeInterpreter()
+    assert optimized('(defn f (int) (int "1"))', inpr)[3] == [Token('int'), '1']
+    assert optimized('(let (x 1 str 2) (str 1))', inpr)[2] == [Token('str'), 1]
+
+    eval_expr('(def mod (# list %0 %1))', inpr)
+    assert optimized('(mod 5 2)', inpr) == [Token('mod'), 5, 2]
+
+    # in bodies only operators are folded, since the other globals can be
+    # bound before they run
+    assert optimized('(defn f () (int 2.5))', inpr)[3] == [Token('int'), 2.5]
+    assert optimized('(defn f () (* 60 60 24))', inpr)[3] == 86400
+    assert optimized('(defmacro m (x) (list x (- 10 (* 2 3))))', inpr)[3] == [Token('list'), Token('x'), 4]
+    for engine in ('coroutine', 'closure', 'python', 'cek'):
+        other = IterativeInterpreter(engine=engine, optimize=True)
+        assert eval_expr('(defn h () (int 2.5)) (def int str) (h)', other) == '2.5'
+        assert eval_expr('(defn f () (str 1)) (defn g (str) (f)) (g (# + 1 %0))', other) == 2
+
+    # macros get their arguments as they are
+    eval_expr("(defmacro m (x) (list 'quote x))", inpr)
+    assert optimized('(m (+ 1 2))', inpr) == [Token('m'), [Token('+'), 1, 2]]
+
+
+def test_engines():
+    program = '''
+        (defn seconds (days) (* days (* 60 60 24)))
+        (defn f (x) (do (comment x) (if (< 1 2) (+ (seconds x) (nth (list 1 2) 1)) 0)))
+        (f 2)
+    '''
+    for engine in ('coroutine', 'closure', 'python', 'cek'):
+        inpr = IterativeInterpreter(engine=engine, optimize=True)
+        assert eval_expr(program, inpr) == 172802
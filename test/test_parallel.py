@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from lispy import parallel
+from lispy.interpreter import IterativeInterpreter
+from lispy.utils import eval_expr
+
+
+ENGINES = ['coroutine', 'closure', 'python', 'cek']
+
+
+@pytest.fixture(scope='module', autouse=True)
+def pool():
+    yield
+    parallel.shutdown()
+
+
+def test_export():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    eval_expr('''
+        (pyimport math)
+        (def k 10 unused 1)
+        (defn fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))
+        (defn scale (x) (let (y (fib x)) (* k (math.floor y))))
+    ''', inpr)
+
+    payload = parallel.export(inpr.ctx['scale'], inpr.ctx)
+    portable, env = parallel.pickle.loads(payload)
+    assert set(env) == {'fib', 'k', 'math'}
+
+    worker = parallel.Worker(IterativeInterpreter)
+    assert worker.run(payload, [10, 11]) == [550, 890]
+
+    # the free variables are looked up from the caller, and must be picklable
+    inpr.ctx['lock'] = threading.Lock
+    eval_expr('(defn f (x) (+ x z))', inpr)
+    with pytest.raises(RuntimeError):
+        eval_expr('(let (z (lock)) (pmap f (list 1)))', inpr)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_pmap(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    eval_expr('(def k 10) (defn fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))', inpr)
+
+    assert eval_expr('(pmap fib (range 15))', inpr) == eval_expr('(map fib (range 15))', inpr)
+    assert eval_expr('(pmap (# + k %0) (range 10) 3)', inpr) == list(range(10, 20))
+    assert eval_expr('(let (k 3) (pmap (# * k %0) (lazy_range 5)))', inpr) == [0, 3, 6, 9, 12]
+    assert eval_expr('(pmap inc (list))', inpr) == []
+
+    # pmap in the workers runs serially
+    assert eval_expr('(pmap (# pmap inc %0) (list (list 1 2) (list 3)))', inpr) == [[2, 3], [4]]
+
+    with pytest.raises(IndexError):
+        eval_expr('(pmap (# nth %0 5) (list (list 1)))', inpr)
+
+    with pytest.raises(ValueError):
+        eval_expr('(pmap inc (list 1) 0)', inpr)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_futures(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    inpr.ctx['sleep'] = lambda seconds: time.sleep(seconds) or seconds
+    eval_expr('(defn fib (n) (if (< n 2) n (+ (fib (- n 1)) (fib (- n 2)))))', inpr)
+
+    # the calls wait at the same time
+    start = time.monotonic()
+    assert eval_expr('(map deref (map (# future sleep %0) (list 0.3 0.2 0.1)))', inpr) == [0.3, 0.2, 0.1]
+    assert eval_expr('(pmap_io (# do (sleep 0.2) (fib %0)) (range 4))', inpr) == [0, 1, 1, 2]
+    assert time.monotonic() - start < 0.9
+
+    assert eval_expr('(let (k 2) (deref (future (# * k (fib %0)) 15)))', inpr) == 1220
+    assert eval_expr('(deref (future + 1 2))', inpr) == 3
+
+    with pytest.raises(ZeroDivisionError):
+        eval_expr('(deref (future / 1 0))', inpr)
+
+    with pytest.raises(ZeroDivisionError):
+        eval_expr('(pmap_io (# / 1 %0) (list 1 0))', inpr)
+
+
+def test_configure():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    inpr.ctx['thread_name'] = lambda _: threading.current_thread().name
+    try:
+        parallel.configure(processes=2, threads=1)
+        assert parallel.PROCESSES == 2 and parallel.executor()._max_workers == 2
+        assert len(set(eval_expr('(pmap_io thread_name (range 4))', inpr))) == 1
+        assert eval_expr('(pmap inc (range 4))', inpr) == [1, 2, 3, 4]
+
+        pool = parallel.thread_executor()
+        parallel.configure(threads=3)
+        assert parallel.PROCESSES == 2 and parallel.THREADS == 3
+        assert parallel.thread_executor() is not pool
+
+        with pytest.raises(ValueError):
+            parallel.configure(threads=0)
+    finally:
+        parallel.configure(processes=None, threads=None)
+    assert parallel.PROCESSES is None and parallel.THREADS is None
@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from lispy.interpreter import IterativeInterpreter
+from lispy.persistent import HashMap, Vector
+from lispy.utils import eval_expr
+
+
+class Collision:
+    """ a key whose hash is the same as the one of other keys
+    """
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return 42
+
+    def __eq__(self, other):
+        return isinstance(other, Collision) and self.value == other.value
+
+
+@pytest.mark.parametrize('size', [0, 1, 31, 32, 33, 64, 1024, 1056, 1057, 5000])
+def test_vector(size):
+    vector, items = Vector(), []
+    for i in range(size):
+        vector = vector.conj(i)
+        items.append(i)
+    assert vector == Vector(items) == items and len(vector) == size
+    assert [vector[i] for i in range(size)] == items
+    if size:
+        assert vector[-1] == size - 1
+
+    # older versions do not change
+    changed = vector.assoc(size // 2, 'x') if size else vector.conj('x')
+    assert list(vector) == items and changed != vector
+
+    for _ in range(size):
+        vector = vector.pop()
+        items.pop()
+        assert list(vector) == items
+    with pytest.raises(IndexError):
+        vector.pop()
+
+
+def test_vector_random_changes():
+    rnd = random.Random(0)
+    versions = [(Vector(), [])]
+    for _ in range(3000):
+        vector, items = rnd.choice(versions[-20:])
+        op = rnd.random()
+        if op < 0.6 or not items:
+            vector, items = vector.conj(op), items + [op]
+        elif op < 0.8:
+            i = rnd.randrange(len(items))
+            vector, items = vector.assoc(i, op), items[:i] + [op] + items[i + 1:]
+        else:
+            vector, items = vector.pop(), items[:-1]
+        versions.append((vector, items))
+
+    for vector, items in versions:
+        assert list(vector) == items and len(vector) == len(items)
+
+
+def test_hash_map():
+    rnd = random.Random(0)
+    keys = list(range(500)) + ['a', 'b', (1, 2)] + [Collision(i) for i in range(5)]
+    versions = [(HashMap(), {})]
+    for _ in range(3000):
+        mapping, expected = rnd.choice(versions[-20:])
+        key = rnd.choice(keys)
+        if rnd.random() < 0.7:
+            mapping, expected = mapping.assoc(key, rnd.random()), dict(expected)
+            expected[key] = mapping[key]
+        else:
+            mapping, expected = mapping.dissoc(key), {k: v for k, v in expected.items() if k != key}
+        versions.append((mapping, expected))
+
+    for mapping, expected in versions:
+        assert mapping == expected and len(mapping) == len(expected)
+        assert all(key in mapping for key in expected)
+        assert sorted(map(str, mapping)) == sorted(map(str, expected))
+    with pytest.raises(KeyError):
+        _ = HashMap()[1]
+
+
+@pytest.mark.parametrize('engine', ['coroutine', 'closure', 'python', 'cek'])
+def test_builtins(engine):
+    inpr = IterativeInterpreter(with_stdlib=True, engine=engine)
+    assert eval_expr('(nth (conj (vector 1 2) 3) -1)', inpr) == 3
+    assert eval_expr('(len (assoc (vector 1 2) 2 3))', inpr) == 3
+    assert eval_expr('(in 2 (vector 1 2))', inpr) is True
+    assert eval_expr('(match (vector 1 (vector 2 3)) ((a (b c)) (+ a b c)))', inpr) == 6
+    assert eval_expr('(defn f ((a b)) (- a b)) (f (vector 3 2))', inpr) == 1
+
+    eval_expr('(def m (hash_map "a" 1 "b" 2))', inpr)
+    assert eval_expr('(list (nth m "a") (in "b" m) (len (dissoc m "b")) (len m))', inpr) == [1, True, 1, 2]
+    assert eval_expr('(nth (assoc m "c" 3) "c")', inpr) == 3
+
+    # other collections are copied
+    assert eval_expr('(def l (list 1)) (list (conj l 2) l)', inpr) == [[1, 2], [1]]
+    assert eval_expr('(def d (dict 1 2)) (list (assoc d 3 4) (dissoc d 1) d)', inpr) == [
+        {1: 2, 3: 4}, {}, {1: 2}
+    ]
+
+
+def test_print(capsys):
+    inpr = IterativeInterpreter()
+    eval_expr('(print (vector 1 (list 2 3) (hash_map "a" (vector))))', inpr)
+    assert capsys.readouterr().out == '[1 (2 3) {a []}]\n'
@@ -0,0 +1,125 @@
+from lispy.context import INLINED, Frame, GlobalRef, LocalRef
+from lispy.globals import GLOBALS
+from lispy.interpreter import IterativeInterpreter
+from lispy.resolver import inlinable
+from lispy.tokenizer import Token
+from lispy.utils import eval_expr
+
+
+def test_local_variables():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x (y z)) (let (a (+ x y)) (match (list a z) ((b c) (+ a b c w)))))', inpr)
+    code = inpr.ctx['f'].code
+
+    # (let ((a (+ x y))) (match (list a z) ((b c) (+ a b c w))))
+    plus = code[1][1]
+    assert [(ref.name, ref.depth) for ref in plus[1:]] == [('x', 1), ('y', 1)]
+
+    match = code[2]
+    assert [(ref.name, ref.depth) for ref in match[1][1:]] == [('a', 0), ('z', 1)]
+
+    result = match[2][1]
+    assert [(ref.name, ref.depth) for ref in result[1:4]] == [('a', 1), ('b', 0), ('c', 0)]
+    assert type(result[4]) is GlobalRef and result[4].token is Token('w')  # scoping is dynamic
+
+    assert eval_expr('(let (w 1) (f 1 (list 2 3)))', inpr) == 10
+
+
+def test_frames():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x & xs) (list x xs))', inpr)
+    f = inpr.ctx['f']
+    frame = f.frame(inpr.ctx, [1, 2, 3])
+    assert type(frame) is Frame and frame.values == [1, [2, 3]]
+
+    # functions with the same parameters share the layout
+    eval_expr('(defn g (x & xs) 0)', inpr)
+    assert inpr.ctx['g'].layout is frame.layout
+
+
+def test_dynamic_bindings():
+    inpr = IterativeInterpreter()
+
+    # def binds names in the innermost frame, which can shadow resolved variables
+    assert eval_expr('(defn f (x) (let (y 1) (do (def x 5) (+ x y)))) (f 1)', inpr) == 6
+    assert eval_expr('(defn g (x) (do (def z 2) ($ "x") (+ x z))) (g 1)', inpr) == 3
+
+    # variables are bound in order
+    assert eval_expr('(def b 1) (defn h () (let (a b b 2) (list a b))) (h)', inpr) == [1, 2]
+
+
+def test_global_names():
+    for engine in ('coroutine', 'closure', 'python'):
+        inpr = IterativeInterpreter(engine=engine)
+        eval_expr('(defn size (x) (len x)) (defn two () (abs -2))', inpr)
+        assert eval_expr('(size "ab")', inpr) == 2
+        assert eval_expr('(two)', inpr) == 2
+
+        # names bound later invalidate the cached values
+        assert eval_expr('(defn count_ (len) (size "abc")) (count_ str)', inpr) == 'abc'
+        assert eval_expr('(size "ab")', inpr) == 2
+        assert eval_expr('(def abs str) (two)', inpr) == '-2'
+
+
+def test_cached_lookups():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x) (+ x 1)) (f 1)', inpr)
+    ref = inpr.ctx['f'].code[0]
+    assert type(ref) is GlobalRef and ref.version is not None and ref.value is GLOBALS['+']
+
+
+def test_variadic_forms():
+    inpr = IterativeInterpreter()
+    assert eval_expr('(defn f (x y) (and x y)) (f 1 0)', inpr) is False
+    assert eval_expr('(defn g (x y) (or x y)) (g 0 0)', inpr) is False
+    assert eval_expr('(defn h (x y) (do x & y)) (h 0 (list 1 2))', inpr) == 2
+
+
+def test_macro_arguments():
+    inpr = IterativeInterpreter()
+    eval_expr('(defmacro infix (args) (list (nth args 1) (nth args 0) (nth args 2)))', inpr)
+    eval_expr('(defn f (i) (infix (i + 1)))', inpr)
+    assert eval_expr('(f 1)', inpr) == 2
+    assert not any(isinstance(x, LocalRef) for x in inpr.ctx['f'].code[1])
+
+
+def test_deep_body():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x) ' + '(+ 1 ' * 10000 + 'x' + ')' * 10000 + ')', inpr)
+    assert eval_expr('(f 1)', inpr) == 10001
+    assert inpr.ctx['f'].code is inpr.ctx['f'].body
+
+
+def test_inlinable():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    for name in ('inc', 'dec', 'first', 'second', 'last', 'zero?', 'empty?'):
+        assert inlinable(inpr.ctx[name])
+
+    # a call before the last parameter, a special form, unused parameters
+    eval_expr('(defn swap (x y) (list y x)) (defn g (x) (if x 1 2)) (defn h (x) 1)', inpr)
+    for name in ('cons', 'append', 'rest', 'swap', 'g', 'h'):
+        assert not inlinable(inpr.ctx[name])
+
+
+def test_inlining():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    eval_expr('(defn double (x) (* x 2)) (defn g (double) (double 1))', inpr)
+    double = inpr.ctx['double']
+    assert inlinable(double)
+
+    INLINED['double'] = double
+    try:
+        eval_expr('(defn f (l) (double (nth l 0)))', inpr)
+        code = inpr.ctx['f'].code
+        assert code[0].token is Token('*') and code[1][0].token is Token('nth')
+        assert eval_expr('(f (list 4 5))', inpr) == 8
+
+        # not inlined where the name is bound
+        assert eval_expr('(g inc)', inpr) == 2
+
+        # rebinding the name undoes the inlining
+        eval_expr('(defn double (x) (* x 3))', inpr)
+        assert 'double' not in INLINED
+        assert eval_expr('(f (list 4 5))', inpr) == 12
+    finally:
+        INLINED.pop('double', None)
@@ -1,7 +1,9 @@
 import pytest
 
+from lispy.context import ExecutionContext
 from lispy.interpreter import IterativeInterpreter
-from lispy.utils import eval_expr, load_stdlib, parse_expr
+from lispy.stdlib import REFERENCE
+from lispy.utils import eval_expr, frozen_stdlib, load_stdlib, parse_expr
 
 
 def test_inc():
@@ -111,3 +113,77 @@ def test_reduce():
 def test_letfn():
     inpr = load_stdlib(IterativeInterpreter())
     assert eval_expr('(letfn (add (x y z) (+ x y z)) (add 1 2 3))', inpr) == 6
+
+
+def test_frozen_stdlib():
+    first = IterativeInterpreter(with_stdlib=True)
+    second = IterativeInterpreter(with_stdlib=True)
+    assert eval_expr('(inc 1)', first) == 2
+
+    # redefinitions stay in the interpreter that made them
+    eval_expr('(defn inc (x) (+ x 10))', first)
+    eval_expr('(def first 0)', first)
+    assert eval_expr('(inc 1)', first) == 11
+    assert eval_expr('(inc 1)', second) == 2
+    assert eval_expr('(first (list 1 2))', second) == 1
+
+    # stdlib functions see the definitions of the caller
+    assert eval_expr('(map inc (list 1 2))', first) == [11, 12]
+
+    with pytest.raises(TypeError):
+        frozen_stdlib().bindings['inc'] = None
+
+
+def test_frozen_stdlib_with_context():
+    ctx = ExecutionContext(None, x=2)
+    inpr = IterativeInterpreter(ctx, with_stdlib=True)
+    assert eval_expr('(inc x)', inpr) == 3
+    assert eval_expr('(map inc (list 1))', inpr) == [2]
+
+    eval_expr('(def y 1)', inpr)
+    assert 'y' not in ctx.bindings
+
+
+def test_long_loops():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    assert eval_expr('(reduce + 0 & (range 2000))', inpr) == sum(range(2000))
+    assert eval_expr('(len (rest (range 2000)))', inpr) == 1999
+
+
+@pytest.mark.parametrize('engine', ['coroutine', 'closure', 'python', 'cek'])
+def test_reference_implementations(engine):
+    native = IterativeInterpreter(with_stdlib=True, engine=engine)
+    reference = load_stdlib(IterativeInterpreter())
+    eval_expr(REFERENCE, reference)
+
+    eval_expr('(defn add (x y) (+ x y))', native)
+    eval_expr('(defn add (x y) (+ x y))', reference)
+    nested = [1, [2, [3, []], 4], [[5]], 'ab']
+    calls = [
+        ('rest', [[]]), ('rest', [[1]]), ('rest', [[1, 2, 3]]), ('rest', ['abc']),
+        ('skip', [0, [1, 2, 3]]), ('skip', [2, [1, 2, 3]]), ('skip', [5, [1]]), ('skip', [-1, [1, 2]]),
+        ('cons', [1, []]), ('cons', [1, [2, 3]]),
+        ('zip', [[1, 2], [3, 4, 5], [6, 7, 8, 9]]), ('zip', [[], [1, 2]]), ('zip', [[1, 2]]),
+        ('flatten', [nested]), ('flatten', [[]]),
+        ('concat', []), ('concat', [[1], [], [2, [3]]]),
+        ('map', [native.ctx['inc'], [1, 2, 3]]), ('map', [native.ctx['inc'], []]),
+        ('filter', [native.ctx['zero?'], [0, 1, 0]]),
+        ('reduce', [native.ctx['add'], 0]), ('reduce', [native.ctx['add'], 0, 1, 2, 3]),
+        ('reduce', [native.ctx['add'], [], [1], [2, 3]]),
+    ]
+    for name, args in calls:
+        expected = reference.call(reference.ctx[name], args)
+        assert native.call(native.ctx[name], args) == expected, name
+
+    assert eval_expr('(reduce add 1 2 & (list 3 4))', native) == 10
+    assert eval_expr('(reduce add 0 & (list))', native) == 0
+    assert eval_expr('(defn total (xs) (reduce add 0 & xs)) (total (range 10))', native) == 45
+    assert eval_expr('(concat & (map (# list %0 %0) (list 1 2)))', native) == [1, 1, 2, 2]
+
+
+def test_long_sequences():
+    inpr = IterativeInterpreter(with_stdlib=True)
+    inpr.ctx['xs'] = list(range(10 ** 5))
+    assert eval_expr('(len (map inc (rest xs)))', inpr) == 10 ** 5 - 1
+    assert eval_expr('(reduce + 0 & (cons 1 xs))', inpr) == sum(range(10 ** 5)) + 1
+    assert eval_expr('(len (flatten (zip xs xs)))', inpr) == 2 * 10 ** 5
@@ -0,0 +1,96 @@
+import sys
+
+import pytest
+
+from lispy.to_python import PythonInterpreter
+from lispy.interpreter import IterativeInterpreter
+from lispy.tokenizer import Token
+from lispy.utils import eval_expr, parse_expr
+
+# run the tests of the interpreter and of the standard library with this engine too
+from test.test_interpreter import *  # noqa: F401,F403
+from test.test_stdlib import *  # noqa: F401,F403
+
+
+@pytest.fixture(autouse=True)
+def python_engine(monkeypatch):
+    monkeypatch.setattr(IterativeInterpreter, 'DEFAULT_ENGINE', 'python')
+
+
+def test_engine():
+    assert type(IterativeInterpreter()) is PythonInterpreter
+    assert type(IterativeInterpreter(engine='coroutine')) is IterativeInterpreter
+
+
+def test_translated():
+    inpr = IterativeInterpreter()
+    expr, = parse_expr('(let (x 1 (a b) (list 2 3)) (+ x a b))')
+    assert inpr.evaluate(expr) == 6
+    assert inpr.translated[id(expr.children)][1] is not None
+
+
+def test_fallback():
+    inpr = IterativeInterpreter()
+    expr, = parse_expr('(defmacro infix (args) (list (nth args 1) (nth args 0) (nth args 2)))')
+    inpr.evaluate(expr)
+    assert inpr.translated[id(expr.children)][1] is None
+
+    expr, = parse_expr('(infix (1 + 1))')
+    assert inpr.evaluate(expr) == 2
+    assert inpr.translated[id(expr.children)][1] is None
+
+    # macros defined after the code calling them was translated
+    eval_expr("(defn f () (m 1)) (defn g (x) (m (+ x 1)))", inpr)
+    eval_expr("(defmacro m (x) (list '+ x 1))", inpr)
+    assert eval_expr('(f)', inpr) == 2
+    assert eval_expr('(g 2)', inpr) == 4
+
+
+def test_translated_functions():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x) (+ x y)) (defn g (y) (f 1)) (defn h (& xs) (map (# * %0 2) xs))', inpr)
+    assert eval_expr('(g 2)', inpr) == 3
+    assert eval_expr('(h 1 2 3)', inpr) == [2, 4, 6]
+    assert eval_expr('((. join ", ") (map str (h 1 2)))', inpr) == '2, 4'
+
+
+def test_deep_recursion():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn count (n) (if (= n 0) 0 (+ 1 (count (- n 1)))))', inpr)
+    assert eval_expr('(count 20000)', inpr) == 20000
+    assert eval_expr('(map count (list 10 20000))', inpr) == [10, 20000]
+    assert eval_expr('(count 10)', inpr) == 10
+
+
+def test_arity():
+    inpr = IterativeInterpreter()
+    eval_expr('(defn f (x y) (+ x y))', inpr)
+    for program in ('(f 1)', '(map f (list 1))'):
+        with pytest.raises(IndexError, match='not enough arguments for "f"'):
+            eval_expr(program, inpr)
+
+
+def test_constants_not_shared():
+    inpr = IterativeInterpreter()
+    eval_expr("(defn f (x) (list x (quote a b)))", inpr)
+    namespace = dict(inpr.translator.namespace)
+
+    for _ in range(10):
+        eval_expr("(defn f (x) (list x (quote a b))) (f (quote c))", inpr)
+    assert inpr.translator.namespace == namespace
+    assert eval_expr('(f 1)', inpr) == [1, [Token('a'), Token('b')]]
+
+
+def test_emit(capsys):
+    inpr = IterativeInterpreter()
+    inpr.emit = sys.stdout
+    eval_expr('(defn inc (x) (+ x 1))', inpr)
+
+    out = capsys.readouterr().out
+    assert out.startswith('# (defn inc (x) (+ x 1))\ndef _form(_c0')
+    assert "_defn(_c0, 'inc'" in out
+
+
+def test_deep_expression():
+    inpr = IterativeInterpreter()
+    assert eval_expr('(+ 1 ' * 10000 + '0' + ')' * 10000, inpr) == 10000
@@ -1,3 +1,8 @@
+import io
+import pickle
+import random
+
+from lispy.stdlib import STDLIB
 from lispy.tokenizer import Token, Tokenizer
 
 
@@ -28,3 +33,58 @@ def test_quotes():
     assert [t.value for t in parsed] == [
         '3', 3, '"3"'
     ]
+
+
+def test_same_tokens_as_tokenize_chars():
+    def tokens(method, source):
+        try:
+            return [(t.type, repr(t.value), type(t.value)) for t in method(source)]
+        except Exception as exc:
+            return type(exc)
+
+    tokenizer = Tokenizer()
+    sources = [
+        STDLIB,
+        '(print "a (b) c" 1)',
+        '"unterminated (1 2)',
+        '"a\\\\" b" c',
+        '1e5 -2.5 nan -inf true false True 1_000 \u0661\u0662 .5 3a',
+    ]
+
+    rnd = random.Random(42)
+    alphabet = list('ab3 ()"\\-+*/&=><._?!%#$~\'\n\t\xa0\u0661') + ['nan', 'inf', 'true']
+    sources.extend(
+        ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 20)))
+        for _ in range(5000)
+    )
+
+    for source in sources:
+        assert tokens(tokenizer.tokenize, source) == tokens(tokenizer.tokenize_chars, source), source
+
+
+def test_tokenize_stream():
+    def tokens(stream):
+        return [(t.type, t.value) for t in stream]
+
+    tokenizer = Tokenizer()
+    source = STDLIB + '(print "àè (ì" "ò\\"ù")'
+    expected = tokens(tokenizer.tokenize_chars(source))
+
+    for chunk_size in (1, 2, 3, 7, 64, 4096):
+        assert tokens(tokenizer.tokenize_stream(io.StringIO(source), chunk_size)) == expected
+        assert tokens(tokenizer.tokenize_stream(io.BytesIO(source.encode()), chunk_size)) == expected
+
+
+def test_interned_symbols():
+    first, second = Tokenizer().tokenize('(abc +)'), Tokenizer().tokenize_chars('(abc +)')
+    for a, b in zip(first, second):
+        assert a is b
+
+    assert Token('abc') is Token('abc', Token.TOKEN_IDENTIFIER)
+    assert Token('abc') is not Token('abc', Token.TOKEN_OTHER)
+    assert pickle.loads(pickle.dumps(Token('abc'))) is Token('abc')
+    assert not hasattr(Token('abc'), '__dict__')
+
+    # literals are not interned, but still compare by value
+    assert Token(1, Token.TOKEN_LITERAL) == Token(1, Token.TOKEN_LITERAL)
+    assert len({Token(1, Token.TOKEN_LITERAL), Token(1, Token.TOKEN_LITERAL), Token('a')}) == 2